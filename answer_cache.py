@@ -0,0 +1,123 @@
+# answer_cache.py
+
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+class _NamespaceEntries:
+    """Cached answers of one knowledge base, with their question embeddings stacked in one matrix."""
+
+    def __init__(self, dimension: int):
+        self.embeddings = np.empty((0, dimension), dtype=np.float32)
+        self.entries = []
+
+    def append(self, embedding, entry):
+        self.embeddings = np.vstack([self.embeddings, embedding[None, :]])
+        self.entries.append(entry)
+
+    def keep(self, mask):
+        self.embeddings = self.embeddings[mask]
+        self.entries = [e for e, k in zip(self.entries, mask) if k]
+
+
+class SemanticAnswerCache:
+    """
+    Per-knowledge-base cache of answers, matched by question embedding similarity.
+
+    A new question hits when its cosine similarity to a previously answered
+    question of the same namespace reaches the threshold. Each namespace keeps
+    at most max_entries answers (least recently used are dropped first), entries
+    expire after ttl_seconds, and invalidate() forgets a namespace entirely when
+    its documents change.
+    """
+
+    def __init__(self, threshold: float = 0.95, ttl_seconds: float = 3600, max_entries: int = 256,
+                 max_namespaces: int = 128, clock=time.monotonic):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_namespaces = max_namespaces
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._namespaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.latency_saved = 0.0
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, namespace: str, query_embedding):
+        """Returns (entry, similarity) for the closest cached question above the threshold, else None."""
+        query = self._normalize(query_embedding)
+        now = self._clock()
+        with self._lock:
+            cached = self._namespaces.get(namespace)
+            if cached is not None:
+                cached.keep(np.array([e["expires_at"] > now for e in cached.entries], dtype=bool))
+            if cached is None or not cached.entries:
+                self.misses += 1
+                return None
+
+            similarities = cached.embeddings @ query
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.threshold:
+                self.misses += 1
+                return None
+
+            entry = cached.entries[best]
+            entry["last_used"] = now
+            self._namespaces.move_to_end(namespace)
+            self.hits += 1
+            self.latency_saved += entry["latency"]
+            return entry, similarity
+
+    def store(self, namespace: str, question: str, query_embedding, answer: str, sources, latency: float):
+        """Caches an answer, along with how long it took to produce, for future similar questions."""
+        query = self._normalize(query_embedding)
+        now = self._clock()
+        entry = {
+            "question": question,
+            "answer": answer,
+            "sources": list(sources),
+            "latency": latency,
+            "expires_at": now + self.ttl_seconds,
+            "last_used": now,
+        }
+        with self._lock:
+            cached = self._namespaces.get(namespace)
+            if cached is None or cached.embeddings.shape[1] != len(query):
+                cached = _NamespaceEntries(len(query))
+                self._namespaces[namespace] = cached
+            self._namespaces.move_to_end(namespace)
+            cached.append(query, entry)
+
+            if len(cached.entries) > self.max_entries:
+                oldest = int(np.argmin([e["last_used"] for e in cached.entries]))
+                mask = np.ones(len(cached.entries), dtype=bool)
+                mask[oldest] = False
+                cached.keep(mask)
+            while len(self._namespaces) > self.max_namespaces:
+                self._namespaces.popitem(last=False)
+
+    def invalidate(self, namespace: str):
+        with self._lock:
+            self._namespaces.pop(namespace, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "latency_saved_seconds": self.latency_saved,
+                "entries": sum(len(c.entries) for c in self._namespaces.values()),
+                "threshold": self.threshold,
+            }
@@ -3,48 +3,243 @@ import re
 import uuid
 import json
 import shutil
+import tempfile
+from datetime import datetime
 import streamlit as st
 import streamlit_authenticator as stauth
 import bcrypt
-from rag_core import process_and_store_documents, create_conversational_chain, load_vector_store, delete_knowledge_base
 from style import CSS_CODE
-from auth import load_credentials_from_db, save_new_user_to_db
+from auth import attach_user_directory, migrate_usernames, username_exists, save_new_user_to_db
 import s3_utils
+import chat_store
+import catalog
+import jobs
+import ingest_jobs
+import uploads
+import chunking
+import telemetry
+import warmup
+# rag_core (LangChain, Pinecone, Bedrock) is imported by the functions below that need it, so the
+# login page renders without it; warmup.start() loads it in the background once a user is signed in.
 
 st.set_page_config(page_title="ChatMyDocs", page_icon="🤖", layout="wide")
 st.markdown(CSS_CODE, unsafe_allow_html=True)
-credentials = load_credentials_from_db()
+telemetry.configure(json_logs=bool(st.secrets.get("TELEMETRY_JSON_LOGS", False)),
+                    metrics_port=st.secrets.get("METRICS_PORT"),
+                    metrics_host=st.secrets.get("METRICS_HOST", "127.0.0.1"))
+jobs.configure({"ingest": st.secrets.get("INGEST_JOB_WORKERS", 2)})
+credentials = {"usernames": {}}
 authenticator = stauth.Authenticate(
     credentials,
     "chatmydocs_cookie",
     "abcdef",
     30
 )
+# Users are looked up one at a time when someone logs in, instead of scanning the whole table on every rerun.
+attach_user_directory(credentials)
 
 def sanitize_filename(name: str) -> str:
     """Sanitizes a string to be used as a valid S3 prefix or filename."""
     return re.sub(r'[^a-zA-Z0-9_-]', '_', name).lower()
 
-def get_kb_documents(username: str, kb_name: str) -> list:
-    """Retrieves the list of source document names from a JSON file in S3."""
+ALLOWED_TYPES = ["pdf", "docx", "pptx", "xlsx", "jpeg", "png", "jpg", "txt"]
+
+def load_kb_manifest(username: str, kb_name: str) -> dict:
+    """Loads a KB's document manifest (source_documents.json) from S3, upgrading legacy file lists."""
     s3_bucket = st.secrets["S3_BUCKET_NAME"]
     s3_key = f"{username}/{kb_name}/source_documents.json"
-    doc_list = s3_utils.load_json_from_s3(s3_bucket, s3_key)
-    return doc_list if doc_list else []
+    from rag_core import load_manifest
+    return load_manifest(s3_utils.load_json_from_s3(s3_bucket, s3_key))
+
+def save_kb_manifest(username: str, kb_name: str, manifest: dict):
+    """Saves a KB's document manifest to S3."""
+    s3_bucket = st.secrets["S3_BUCKET_NAME"]
+    s3_utils.save_json_to_s3(manifest, s3_bucket, f"{username}/{kb_name}/source_documents.json")
+
+def get_kb_documents(username: str, kb_name: str) -> list:
+    """Retrieves the list of source document names from the KB's manifest in S3."""
+    from rag_core import manifest_documents
+    return manifest_documents(load_kb_manifest(username, kb_name))
+
+def get_upload_spool() -> uploads.UploadSpool:
+    """Returns the process-wide upload spool, with the configured session and process budgets."""
+    return uploads.get_spool(
+        st.secrets.get("UPLOAD_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "chatmydocs", "uploads")),
+        int(float(st.secrets.get("UPLOAD_SESSION_LIMIT_MB", 1024)) * 2**20),
+        int(float(st.secrets.get("UPLOAD_PROCESS_LIMIT_MB", 8192)) * 2**20),
+    )
+
+def spool_uploads(uploaded_files) -> list:
+    """Spools this session's uploads to disk once, reporting any that do not fit in the upload budget."""
+    session_id = st.session_state.setdefault("upload_session_id", uuid.uuid4().hex)
+    items, rejected = get_upload_spool().spool_all(session_id, uploaded_files)
+    for name, reason in rejected.items():
+        st.error(f"'{name}' was not accepted: {reason}.")
+    return items
+
+def release_uploads(items: list):
+    """Deletes spooled upload files that are no longer needed."""
+    if items:
+        get_upload_spool().release(st.session_state.get("upload_session_id"), items)
+
+def start_uploads(username: str, kb_name: str, items: list) -> s3_utils.BackgroundUploader:
+    """Starts uploading the original files to the KB's S3 folder in the background."""
+    uploader = s3_utils.BackgroundUploader(
+        st.secrets["S3_BUCKET_NAME"],
+        max_workers=int(st.secrets.get("S3_UPLOAD_WORKERS", 8)),
+        multipart_threshold_mb=float(st.secrets.get("S3_MULTIPART_THRESHOLD_MB", 8)),
+    )
+    for item in items:
+        uploader.submit(item['path'], f"{username}/{kb_name}/{item['name']}")
+    return uploader
+
+def start_ingestion(username: str, kb_name: str, display_name: str, items: list, backend: str,
+                    is_guest: bool = False, manifest: dict = None, chunking_options: dict = None):
+    """
+    Starts ingesting spooled uploads into a KB as a background job, which owns
+    (and finally releases) the spooled files. Returns the job, or None if the
+    KB is already being processed.
+    """
+    job_id = ingest_jobs.job_id(username, kb_name)
+    running = jobs.get_job(job_id)
+    if running is not None and not running.done:
+        st.warning(f"'{display_name}' is already being processed.")
+        return None
+    s3_bucket = st.secrets["S3_BUCKET_NAME"]
+    # Originals go to S3 in the background while the documents are being processed.
+    uploader = start_uploads(username, kb_name, items)
+    spool, session_id = get_upload_spool(), st.session_state.get("upload_session_id")
+    # Pinned, the files outlive this session if it closes while the job runs.
+    spool.pin(session_id)
+
+    def release(done):
+        spool.release(session_id, done)
+        spool.unpin(session_id)
+
+    job = jobs.submit("ingest", ingest_jobs.run, s3_bucket, username, kb_name, display_name, items, backend,
+                      manifest=manifest, chunking_options=chunking_options, persistent=not is_guest,
+                      uploader=uploader, release=release, job_id=job_id)
+    st.session_state.setdefault("ingesting_kbs", {})[kb_name] = display_name
+    return job
+
+@st.fragment(run_every=1.0)
+def _render_ingest_progress(job_id: str):
+    """Polls a running ingestion job, rerunning the whole page once it has finished."""
+    job = jobs.get_job(job_id)
+    if job is None or job.done:
+        st.rerun()
+    outcome = job.snapshot()
+    if outcome["status"] == jobs.PENDING:
+        ahead = jobs.queue_position(job)
+        st.caption(f"⏳ Queued{f' behind {ahead} other upload(s)' if ahead else ''}...")
+    elif job.cancelled:
+        st.caption("Stopping after the batches in flight...")
+    else:
+        from rag_core import STAGE_LABELS
+        for stage, label in STAGE_LABELS.items():
+            done, total = outcome["progress"].get(stage, (0, 0))
+            unit = "files" if stage == "extract" else "chunks"
+            st.progress(min(done / total, 1.0) if total else 0.0, text=f"{label}: {done}/{total} {unit}")
+    for error in outcome["progress"].get("errors", []):
+        st.error(error)
+    if not job.cancelled and st.button("Cancel", key=f"cancel_{job_id}"):
+        job.cancel()
+
+def _report_ingestion_outcome(outcome: dict, display_name: str) -> bool:
+    """Shows how a finished ingestion job went. Returns True if its KB is ready to chat with."""
+    result = outcome["result"] or {}
+    for error in result.get("errors", []):
+        st.error(error)
+    for name, error in result.get("upload_errors", {}).items():
+        st.error(f"Error uploading '{name}' to S3: {error}")
+    if outcome["error"]:
+        st.error(f"Processing '{display_name}' failed: {outcome['error']}")
+        return False
+    report = result["report"]
+    from rag_core import report_ingestion
+    report_ingestion(report)
+    if not result["catalog_updated"]:
+        st.warning("Your knowledge base was saved, but the dashboard list could not be updated.")
+    if report["cancelled"]:
+        st.warning(f"Processing '{display_name}' was cancelled; "
+                   f"{len(result['manifest']['files'])} finished document(s) were kept.")
+        return bool(result["manifest"]["files"])
+    return True
+
+def _report_finished_ingestions(username: str):
+    """Shows the outcome of this session's ingestion jobs that finished since the last rerun."""
+    for kb_name, display_name in list(st.session_state.get("ingesting_kbs", {}).items()):
+        job = jobs.get_job(ingest_jobs.job_id(username, kb_name))
+        if job is not None and not job.done:
+            continue
+        del st.session_state.ingesting_kbs[kb_name]
+        if job is None:
+            continue
+        outcome = job.snapshot()
+        jobs.forget(job.id)
+        if _report_ingestion_outcome(outcome, display_name) and not outcome["result"]["report"]["cancelled"]:
+            st.success(f"Knowledge Base '{display_name}' is ready.")
+
+def render_interrupted_ingestions(username: str, ingests: dict):
+    """Lists KBs whose ingestion is running or was interrupted, offering to resume or stop the latter."""
+    s3_bucket = st.secrets["S3_BUCKET_NAME"]
+    for kb_name, entry in ingests.items():
+        with st.container(border=True):
+            st.subheader(entry["display_name"])
+            job_id = ingest_jobs.job_id(username, kb_name)
+            job = jobs.get_job(job_id)
+            if job is not None and not job.done:
+                _render_ingest_progress(job_id)
+                continue
+            checkpoint = ingest_jobs.load_checkpoint(s3_bucket, username, kb_name)
+            if checkpoint is None:
+                catalog.remove_ingest(s3_bucket, username, kb_name)
+                continue
+            if not ingest_jobs.is_interrupted(checkpoint):
+                st.caption("⚙️ Being processed by another server...")
+                continue
+            finished, total = len(checkpoint["manifest"]["files"]), len(checkpoint["files"])
+            st.caption(f"⚠️ Processing was interrupted. Documents: {finished} of {total} finished.")
+            c1, c2, _ = st.columns([1, 1, 4])
+            if c1.button("Resume", key=f"resume_{kb_name}"):
+                jobs.submit("ingest", ingest_jobs.resume, s3_bucket, username, kb_name, checkpoint, job_id=job_id)
+                st.session_state.setdefault("ingesting_kbs", {})[kb_name] = entry["display_name"]
+                st.rerun()
+            if c2.button("Keep finished only", key=f"abandon_{kb_name}"):
+                with st.spinner("Removing unfinished documents..."):
+                    ingest_jobs.abandon(s3_bucket, username, kb_name, checkpoint)
+                st.rerun()
+
+def get_user_catalog(username: str) -> dict:
+    """Loads the user's KB catalog, revalidating it with S3 only when the cached copy is stale."""
+    s3_bucket = st.secrets["S3_BUCKET_NAME"]
+    return catalog.load_catalog(s3_bucket, username, load_kb_manifest)
+
+def update_catalog_entry(username: str, kb_name: str, manifest: dict, display_name: str = None):
+    """Records a KB's current documents and size in the user's catalog."""
+    s3_bucket = st.secrets["S3_BUCKET_NAME"]
+    if not catalog.upsert_kb(s3_bucket, username, kb_name, manifest, display_name):
+        st.warning("Your knowledge base was saved, but the dashboard list could not be updated.")
 
-def save_chat_history(username: str, kb_name: str, messages: list):
-    """Saves the chat history list as a JSON file to S3."""
+def save_chat_history(username: str, kb_name: str, new_messages: list):
+    """Appends the messages of the latest turn to the KB's segmented chat history in S3."""
     if not kb_name or not username: return
     s3_bucket = st.secrets["S3_BUCKET_NAME"]
-    s3_key = f"{username}/{kb_name}/chat_history.json"
-    s3_utils.save_json_to_s3(messages, s3_bucket, s3_key)
+    chat_store.append_messages(s3_bucket, f"{username}/{kb_name}/", new_messages)
 
-def load_chat_history(username: str, kb_name: str) -> list:
-    """Loads chat history from a JSON file in S3."""
+def load_chat_history(username: str, kb_name: str, end: int = None):
+    """
+    Loads one page of chat history from S3: the most recent messages, or the
+    page before message offset `end`. Returns (messages, start_offset).
+    """
     s3_bucket = st.secrets["S3_BUCKET_NAME"]
-    s3_key = f"{username}/{kb_name}/chat_history.json"
-    history = s3_utils.load_json_from_s3(s3_bucket, s3_key)
-    return history if history else []
+    return chat_store.load_page(s3_bucket, f"{username}/{kb_name}/", end=end)
+
+def _set_chat_history(messages: list, start_offset: int):
+    """Replaces the session's messages with a freshly loaded page of history."""
+    st.session_state.messages = messages
+    st.session_state.history_offset = start_offset
+    st.session_state.history_saved_upto = len(messages)
 
 def _init_wizard_state():
     """Initializes session state variables for the app."""
@@ -52,19 +247,56 @@ def _init_wizard_state():
     st.session_state.setdefault("upload_buffer", [])
     st.session_state.setdefault("rag_chain", None)
     st.session_state.setdefault("messages", [])
+    st.session_state.setdefault("history_offset", 0)
+    st.session_state.setdefault("history_saved_upto", 0)
     st.session_state.setdefault("current_kb_name", None)
     st.session_state.setdefault("current_kb_sanitized_name", None)
 
 def _reset_wizard(clear_chain=True):
     """Resets the wizard and chat state."""
     st.session_state.wizard_step = 1
+    # A KB build in progress keeps running in the background; the dashboard shows it.
+    st.session_state.ingest = None
+    release_uploads(st.session_state.get("upload_buffer"))
     st.session_state.upload_buffer = []
     if clear_chain:
         st.session_state.rag_chain = None
-        st.session_state.messages = []
+        _set_chat_history([], 0)
         st.session_state.current_kb_name = None
         st.session_state.current_kb_sanitized_name = None
 
+def is_admin(username: str) -> bool:
+    return username in st.secrets.get("ADMIN_USERS", [])
+
+def render_latency_panel():
+    """Shows per-stage latency percentiles and component counters of this server process, for admins."""
+    with st.sidebar:
+        with st.expander("⏱️ Latency by stage"):
+            rows = telemetry.summary()
+            if not rows:
+                st.caption("No traced stages yet.")
+                return
+            st.dataframe(rows, hide_index=True, use_container_width=True)
+            st.caption(f"Percentiles over the last {telemetry.RECENT_SPANS} spans; totals since the server started.")
+        counters = telemetry.stats()
+        if counters:
+            with st.expander("📈 Caches"):
+                for component, values in counters.items():
+                    st.caption(component.replace("_", " ").capitalize())
+                    st.dataframe([{"counter": k, "value": v} for k, v in values.items()], hide_index=True,
+                                 use_container_width=True)
+
+def render_admin_tools():
+    """Offers one-off maintenance actions to admins."""
+    with st.sidebar:
+        with st.expander("🛠️ Maintenance"):
+            st.caption("Copies accounts registered under mixed-case usernames to their lower-case key, so their "
+                       "owners can log in. Scans the user table once; later runs only check that it was done.")
+            if st.button("Migrate usernames", key="btn_migrate_usernames"):
+                copied = migrate_usernames()
+                if copied is not None:
+                    st.success(f"Migrated {copied} account(s).")
+
 def _sidebar_header(username: str, is_guest: bool):
     """Renders the sidebar header and navigation."""
     with st.sidebar:
@@ -79,6 +311,9 @@ def _sidebar_header(username: str, is_guest: bool):
         else:
             st.subheader(f'Welcome, {st.session_state.get("name", username)}!')
             authenticator.logout(location="sidebar")
+            if is_admin(username):
+                render_latency_panel()
+                render_admin_tools()
             if st.button("⬅️ Back to Dashboard", key="btn_back_to_dash"):
                 st.session_state.view = 'dashboard'
                 _reset_wizard()
@@ -104,10 +339,9 @@ def step_upload(username: str):
     """UI for Step 1: Document Upload."""
     st.header("1. Upload Documents")
     st.caption("Upload documents to a new Knowledge Base.")
-    allowed_types = ["pdf", "docx", "pptx", "xlsx", "jpeg", "png", "jpg", "txt"]
     uploads = st.file_uploader(
         "Drag and drop files here",
-        type=allowed_types,
+        type=ALLOWED_TYPES,
         accept_multiple_files=True,
         key="uploader_docs"
     )
@@ -121,20 +355,43 @@ def step_upload(username: str):
     with c1:
         disabled = not uploads
         if st.button("Save & Continue →", key="btn_upload_continue", disabled=disabled):
-            st.session_state.upload_buffer = [{"name": f.name, "data": f.getvalue()} for f in uploads]
-            st.session_state.wizard_step = 2
-            st.rerun()
+            release_uploads(st.session_state.upload_buffer)
+            st.session_state.upload_buffer = spool_uploads(uploads)
+            if len(st.session_state.upload_buffer) == len(uploads):
+                st.session_state.wizard_step = 2
+                st.rerun()
     with c2:
         if st.button("Clear", key="btn_upload_clear"):
+            release_uploads(st.session_state.upload_buffer)
             st.session_state.upload_buffer = []
             st.rerun()
 
     if not uploads and not st.session_state.upload_buffer:
         st.info("Select at least one file to continue.")
 
-def step_process(username: str):
+def chunking_settings_input() -> dict:
+    """Renders the optional chunking settings of a new knowledge base and returns them."""
+    defaults = chunking.DEFAULT_CHUNKING
+    with st.expander("Advanced: chunking"):
+        chunk_tokens = st.number_input("Chunk size (tokens)", min_value=64, max_value=2048,
+                                       value=defaults["chunk_tokens"], step=32, key="chunk_tokens_input")
+        overlap_tokens = st.number_input("Overlap between chunks (tokens)", min_value=0, max_value=chunk_tokens // 2,
+                                         value=min(defaults["overlap_tokens"], chunk_tokens // 2), step=8,
+                                         key="overlap_tokens_input")
+        dedup = st.checkbox("Skip near-duplicate chunks (repeated headers, footers, slide templates)",
+                            value=defaults["dedup"], key="dedup_input")
+        threshold = st.slider("Near-duplicate similarity", min_value=0.5, max_value=1.0,
+                              value=defaults["dedup_threshold"], step=0.05, disabled=not dedup,
+                              key="dedup_threshold_input")
+    return {"chunk_tokens": int(chunk_tokens), "overlap_tokens": int(overlap_tokens), "dedup": dedup,
+            "dedup_threshold": float(threshold)}
+
+def step_process(username: str, is_guest: bool = False):
     """UI for Step 2: Document Processing."""
     st.header("2. Process Documents")
+    if st.session_state.get("ingest"):
+        _step_process_job(username, is_guest)
+        return
     if not st.session_state.upload_buffer:
         st.warning("No files found. Please upload documents first.")
         if st.button("← Back to Upload", key="btn_back_to_upload_empty"):
@@ -152,31 +409,20 @@ def step_process(username: str):
         placeholder="e.g., Biology Midterm Notes",
         key="kb_name_input"
     )
+    chunking_options = chunking_settings_input()
     st.markdown('<div class="cta-wrap">', unsafe_allow_html=True)
     disabled = not kb_name.strip()
     if st.button("Create Knowledge Base", key="btn_create_kb", disabled=disabled):
-        with st.spinner("Processing documents... This may take a moment."):
-            kb_name_sanitized = sanitize_filename(kb_name)
-            s3_bucket = st.secrets["S3_BUCKET_NAME"]
-
-            for item in st.session_state.upload_buffer:
-                s3_object_name = f"{username}/{kb_name_sanitized}/{item['name']}"
-                s3_utils.upload_file_to_s3(item['data'], s3_bucket, s3_object_name)
-
-            source_filenames = [item['name'] for item in st.session_state.upload_buffer]
-            s3_utils.save_json_to_s3(source_filenames, s3_bucket,
-                                     f"{username}/{kb_name_sanitized}/source_documents.json")
-
-            namespace = f"{username}-{kb_name_sanitized}"
-            vector_store = process_and_store_documents(st.session_state.upload_buffer, namespace=namespace)
-
-            st.session_state.rag_chain = create_conversational_chain(vector_store)
-            st.session_state.messages = []
-            st.session_state.current_kb_name = kb_name
-            st.session_state.current_kb_sanitized_name = kb_name_sanitized
-
-            st.success(f"Knowledge Base '{kb_name}' created!")
-            st.session_state.wizard_step = 3
+        kb_name_sanitized = sanitize_filename(kb_name)
+        from rag_core import vector_backend
+        backend = vector_backend(is_guest)
+        job = start_ingestion(username, kb_name_sanitized, kb_name, st.session_state.upload_buffer, backend,
+                              is_guest=is_guest, chunking_options=chunking_options)
+        if job is not None:
+            # The job owns the spooled files from here on.
+            st.session_state.upload_buffer = []
+            st.session_state.ingest = {"job_id": job.id, "kb_name": kb_name_sanitized, "display_name": kb_name,
+                                       "backend": backend}
             st.rerun()
 
     st.markdown('</div>', unsafe_allow_html=True)
@@ -187,6 +433,42 @@ def step_process(username: str):
             st.session_state.wizard_step = 1
             st.rerun()
 
+def _step_process_job(username: str, is_guest: bool):
+    """Shows the progress of this session's KB build, then opens the chat once it is ready."""
+    pending = st.session_state.ingest
+    job = jobs.get_job(pending["job_id"])
+    if job is not None and not job.done:
+        st.subheader(f"Building '{pending['display_name']}'")
+        _render_ingest_progress(job.id)
+        if not is_guest:
+            st.caption("You can leave this page: processing continues in the background, "
+                       "and the dashboard shows its progress.")
+        return
+
+    st.session_state.ingest = None
+    st.session_state.get("ingesting_kbs", {}).pop(pending["kb_name"], None)
+    if job is None:
+        st.warning("This upload is no longer being processed. Please upload your documents again.")
+        st.session_state.wizard_step = 1
+        return
+    outcome = job.snapshot()
+    jobs.forget(job.id)
+    if not _report_ingestion_outcome(outcome, pending["display_name"]):
+        if outcome["error"] and not is_guest:
+            st.info("You can resume processing from the dashboard.")
+        st.session_state.wizard_step = 1
+        return
+
+    namespace = f"{username}-{pending['kb_name']}"
+    from rag_core import get_conversational_chain
+    st.session_state.rag_chain = get_conversational_chain(namespace, backend=pending["backend"])
+    _set_chat_history([], 0)
+    st.session_state.current_kb_name = pending["display_name"]
+    st.session_state.current_kb_sanitized_name = pending["kb_name"]
+    st.success(f"Knowledge Base '{pending['display_name']}' created!")
+    st.session_state.wizard_step = 3
+    st.rerun()
+
 def step_chat(username: str, is_guest: bool):
     """UI for Step 3: Chat Interface."""
     st.header("3. Chat")
@@ -195,7 +477,8 @@ def step_chat(username: str, is_guest: bool):
         with st.sidebar:
             with st.expander("📚 Source Documents", expanded=True):
                 sanitized_name = st.session_state.current_kb_sanitized_name
-                docs = get_kb_documents(username, sanitized_name)
+                entry = get_user_catalog(username)["kbs"].get(sanitized_name)
+                docs = entry["documents"] if entry else get_kb_documents(username, sanitized_name)
                 for doc in docs:
                     st.write(f"📄 {doc}")
 
@@ -207,6 +490,15 @@ def step_chat(username: str, is_guest: bool):
     else:
         st.success("Knowledge Base is ready. Ask away!")
 
+    if not is_guest and st.session_state.get("history_offset", 0) > 0:
+        if st.button("⬆️ Load earlier messages", key="btn_load_earlier"):
+            older, start_offset = load_chat_history(username, st.session_state.current_kb_sanitized_name,
+                                                    end=st.session_state.history_offset)
+            st.session_state.messages = older + st.session_state.messages
+            st.session_state.history_saved_upto += len(older)
+            st.session_state.history_offset = start_offset
+            st.rerun()
+
     for message in st.session_state.messages:
         avatar = "👤" if message["role"] == "user" else "🤖"
         with st.chat_message(message["role"], avatar=avatar):
@@ -232,37 +524,96 @@ def step_chat(username: str, is_guest: bool):
                     st.warning("Please create a Knowledge Base first.")
             else:
                 with st.chat_message("assistant", avatar="🤖"):
-                    with st.spinner("Thinking..."):
-                        result = st.session_state.rag_chain.invoke({"query": prompt})
-                        answer = result.get("result", "")
-                        st.markdown(answer)
-                        st.session_state.messages.append({"role": "assistant", "content": answer})
+                    with st.spinner("Searching your documents..."):
+                        namespace = f"{username}-{st.session_state.current_kb_sanitized_name}"
+                        from rag_core import stream_answer
+                        stream = stream_answer(st.session_state.rag_chain, namespace, prompt)
+                    answer = st.write_stream(stream)
+                    result = stream.result
+                    if result.get("cached"):
+                        st.caption("⚡ Answered instantly from a similar earlier question.")
+                    st.session_state.messages.append({"role": "assistant", "content": answer})
+
+                    srcs = result.get("source_documents", [])
+
+                    # Phrases that indicate a generic or non-document-based answer
+                    ignore_phrases = [
+                        "don't know", "does not contain", "not found in the context",
+                        "without any context", "i am an ai assistant", "i'm an ai assistant", "personal name"
+                    ]
+
+                    answer_is_generic = any(phrase in answer.lower() for phrase in ignore_phrases)
+
+                    # Only show sources if they exist and the answer isn't generic
+                    if srcs and not answer_is_generic:
+                        with st.expander("Sources"):
+                            for d in srcs:
+                                st.write(f"• {d.metadata.get('source', 'document')}")
 
-                        srcs = result.get("source_documents", [])
+        if not is_guest:
+            new_messages = st.session_state.messages[st.session_state.get("history_saved_upto", 0):]
+            save_chat_history(username, st.session_state.current_kb_sanitized_name, new_messages)
+            st.session_state.history_saved_upto = len(st.session_state.messages)
 
-                        # Phrases that indicate a generic or non-document-based answer
-                        ignore_phrases = [
-                            "don't know", "does not contain", "not found in the context",
-                            "without any context", "i am an ai assistant", "i'm an ai assistant", "personal name"
-                        ]
 
-                        answer_is_generic = any(phrase in answer.lower() for phrase in ignore_phrases)
+def get_user_kbs(username: str) -> dict:
+    """Returns the user's knowledge bases from their catalog, keyed by sanitized name."""
+    return get_user_catalog(username)["kbs"]
 
-                        # Only show sources if they exist and the answer isn't generic
-                        if srcs and not answer_is_generic:
-                            with st.expander("Sources"):
-                                for d in srcs:
-                                    st.write(f"• {d.metadata.get('source', 'document')}")
 
-        if not is_guest:
-            save_chat_history(username, st.session_state.current_kb_sanitized_name, st.session_state.messages)
+def _delete_job_id(username: str, kb_name: str) -> str:
+    return f"delete:{username}/{kb_name}"
 
+def _delete_kb_job(job, s3_bucket: str, username: str, kb_name: str, backend: str):
+    """Background job: removes a KB's files and vectors, then drops it from the catalog if nothing failed."""
+    from rag_core import purge_knowledge_base
+    report = purge_knowledge_base(s3_bucket, f"{username}/{kb_name}/", f"{username}-{kb_name}", backend=backend,
+                                  on_progress=lambda deleted: job.update(objects_deleted=deleted))
+    if not report["s3_errors"] and not report["vector_error"]:
+        catalog.remove_kb(s3_bucket, username, kb_name)
+    return report
 
-def get_user_kbs(username: str) -> list:
-    """Lists all knowledge bases for a user by checking S3 prefixes."""
+def start_kb_deletion(username: str, kb_name: str, display_name: str):
+    """Starts deleting a KB in the background; the dashboard shows its progress until it finishes."""
     s3_bucket = st.secrets["S3_BUCKET_NAME"]
-    return s3_utils.list_folders_in_s3(s3_bucket, username)
-
+    from rag_core import vector_backend
+    jobs.submit("delete_kb", _delete_kb_job, s3_bucket, username, kb_name, vector_backend(),
+                job_id=_delete_job_id(username, kb_name))
+    st.session_state.deleting_kbs[kb_name] = display_name
+    if st.session_state.get("managing_kb") == kb_name:
+        st.session_state.managing_kb = None
+
+@st.fragment(run_every=1.0)
+def _render_deletion_progress(job_id: str):
+    """Polls a running deletion job, rerunning the whole page once it has finished."""
+    job = jobs.get_job(job_id)
+    if job is None or job.done:
+        st.rerun()
+    st.caption(f"🗑️ Deleting... {job.snapshot()['progress'].get('objects_deleted', 0)} files removed so far.")
+
+def _report_finished_deletions(username: str):
+    """Shows the outcome of this session's deletion jobs that have completed since the last rerun."""
+    for kb_name, display_name in list(st.session_state.deleting_kbs.items()):
+        job = jobs.get_job(_delete_job_id(username, kb_name))
+        if job is not None and not job.done:
+            continue
+        del st.session_state.deleting_kbs[kb_name]
+        if job is None:
+            continue
+        outcome = job.snapshot()
+        jobs.forget(job.id)
+        report = outcome["result"] or {}
+        if outcome["error"]:
+            st.error(f"Deleting '{display_name}' failed: {outcome['error']}")
+        elif report["s3_errors"] or report["vector_error"]:
+            st.error(f"'{display_name}' was only partly deleted. You can try deleting it again.")
+            with st.expander("Details"):
+                if report["vector_error"]:
+                    st.write(f"Vector index: {report['vector_error']}")
+                for err in report["s3_errors"]:
+                    st.write(f"• {err['Key']}: {err['Code']} {err['Message']}")
+        else:
+            st.success(f"Successfully deleted '{display_name}' ({report['s3_deleted']} files removed).")
 
 def render_dashboard(username: str):
     """UI for the main dashboard showing all knowledge bases."""
@@ -275,25 +626,45 @@ def render_dashboard(username: str):
         st.rerun()
 
     st.markdown("### Existing Knowledge Bases")
-    user_kbs = get_user_kbs(username)
-
-    if not user_kbs:
+    st.session_state.setdefault("deleting_kbs", {})
+    _report_finished_deletions(username)
+    _report_finished_ingestions(username)
+    user_catalog = get_user_catalog(username)
+    user_kbs = user_catalog["kbs"]
+    ingests = dict(user_catalog.get("ingests", {}))
+    for kb_name, display_name in st.session_state.get("ingesting_kbs", {}).items():
+        # Jobs started moments ago may not have registered in the catalog yet.
+        ingests.setdefault(kb_name, {"display_name": display_name})
+    if ingests:
+        render_interrupted_ingestions(username, ingests)
+
+    if not user_kbs and not ingests:
         st.info("You haven't created any knowledge bases yet. Click the button above to start!")
         return
 
-    for kb_name in user_kbs:
+    for kb_name, entry in sorted(user_kbs.items(), key=lambda kb: kb[1]["updated_at"], reverse=True):
+        if kb_name in ingests:
+            continue
+        if kb_name in st.session_state.deleting_kbs:
+            with st.container(border=True):
+                st.subheader(entry["display_name"])
+                _render_deletion_progress(_delete_job_id(username, kb_name))
+            continue
         with st.container(border=True):
             c1, c2 = st.columns([4, 1])
             with c1:
-                display_name = kb_name.replace("_", " ").title()
+                display_name = entry["display_name"]
                 st.subheader(display_name)
+                updated = datetime.fromtimestamp(entry["updated_at"]).strftime("%b %d, %Y %H:%M")
+                st.caption(f"{len(entry['documents'])} documents · {entry['chunk_count']} chunks · updated {updated}")
                 if st.button("Chat", key=f"chat_{kb_name}"):
                     with st.spinner(f"Loading '{display_name}'..."):
                         namespace = f"{username}-{kb_name}"
-                        vector_store = load_vector_store(namespace=namespace)
-                        if vector_store:
-                            st.session_state.rag_chain = create_conversational_chain(vector_store)
-                            st.session_state.messages = load_chat_history(username, kb_name)
+                        from rag_core import get_conversational_chain
+                        rag_chain = get_conversational_chain(namespace)
+                        if rag_chain:
+                            st.session_state.rag_chain = rag_chain
+                            _set_chat_history(*load_chat_history(username, kb_name))
                             st.session_state.current_kb_name = display_name
                             st.session_state.current_kb_sanitized_name = kb_name
                             st.session_state.wizard_step = 3
@@ -303,17 +674,53 @@ def render_dashboard(username: str):
                             st.error(f"Failed to load Knowledge Base '{display_name}'.")
 
             with c2:
+                if st.button("Manage", key=f"manage_{kb_name}", type="secondary"):
+                    managing = st.session_state.get("managing_kb") == kb_name
+                    st.session_state.managing_kb = None if managing else kb_name
+                    st.rerun()
                 if st.button("Delete", key=f"delete_{kb_name}", type="secondary"):
-                    with st.spinner(f"Deleting '{display_name}'..."):
-                        s3_bucket = st.secrets["S3_BUCKET_NAME"]
-                        s3_prefix = f"{username}/{kb_name}/"
-                        s3_utils.delete_folder_from_s3(s3_bucket, s3_prefix)
-
-                        namespace = f"{username}-{kb_name}"
-                        delete_knowledge_base(namespace)
-                    st.success(f"Successfully deleted '{display_name}'.")
+                    start_kb_deletion(username, kb_name, display_name)
                     st.rerun()
 
+            if st.session_state.get("managing_kb") == kb_name:
+                render_kb_manager(username, kb_name)
+
+def render_kb_manager(username: str, kb_name: str):
+    """UI for adding documents to, or removing documents from, an existing knowledge base."""
+    from rag_core import manifest_documents, remove_documents_from_kb, vector_backend
+    s3_bucket = st.secrets["S3_BUCKET_NAME"]
+    namespace = f"{username}-{kb_name}"
+    manifest = load_kb_manifest(username, kb_name)
+
+    st.markdown("#### Documents")
+    for doc in manifest_documents(manifest):
+        d1, d2 = st.columns([5, 1])
+        with d1:
+            st.write(f"📄 {doc}")
+        with d2:
+            if st.button("Remove", key=f"remove_{kb_name}_{doc}"):
+                with st.spinner(f"Removing '{doc}'..."):
+                    manifest = remove_documents_from_kb([doc], namespace, manifest)
+                    s3_utils.delete_file_from_s3(s3_bucket, f"{username}/{kb_name}/{doc}")
+                    save_kb_manifest(username, kb_name, manifest)
+                    update_catalog_entry(username, kb_name, manifest)
+                st.rerun()
+
+    new_files = st.file_uploader(
+        "Add documents",
+        type=ALLOWED_TYPES,
+        accept_multiple_files=True,
+        key=f"add_docs_{kb_name}"
+    )
+    if st.button("Add to Knowledge Base", key=f"add_docs_btn_{kb_name}", disabled=not new_files):
+        buffer = spool_uploads(new_files)
+        display_name = get_user_kbs(username)[kb_name]["display_name"]
+        if len(buffer) == len(new_files) and start_ingestion(username, kb_name, display_name, buffer, vector_backend(),
+                                                             manifest=manifest):
+            st.session_state.managing_kb = None
+            st.rerun()
+        release_uploads(buffer)
+
 def render_main_app(username, is_guest):
     """Main application view router."""
     if 'wizard_step' not in st.session_state:
@@ -323,7 +730,7 @@ def render_main_app(username, is_guest):
     if step == 1:
         step_upload(username)
     elif step == 2:
-        step_process(username)
+        step_process(username, is_guest)
     else:
         step_chat(username, is_guest)
 
@@ -331,12 +738,17 @@ def render_main_app(username, is_guest):
 
 st.session_state.setdefault('active_user', None)
 is_guest = st.session_state.get('guest_mode', False)
+if "upload_session_id" in st.session_state:
+    # Spooled uploads of sessions that stop rerunning are swept as abandoned.
+    get_upload_spool().touch(st.session_state.upload_session_id)
 
 if is_guest:
+    warmup.start()
     render_main_app(st.session_state.get('guest_uuid', str(uuid.uuid4())), is_guest=True)
 
 elif st.session_state.get("authentication_status"):
     username = st.session_state.get("username")
+    warmup.start()
     if st.session_state.active_user != username:
         _reset_wizard(clear_chain=True)
         st.session_state.view = 'dashboard'
@@ -389,11 +801,12 @@ else:  # Login/Register Screen
                     st.error("Please fill all fields.")
                 elif pw != pw2:
                     st.error("Passwords do not match.")
-                elif username in credentials.get("usernames", {}):
+                elif username_exists(username):
                     st.error("That username is already taken.")
                 else:
                     hashed_pw = bcrypt.hashpw(pw.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-                    success = save_new_user_to_db(username, full_name, email, hashed_pw)
+                    # The authenticator lower-cases usernames at login, so store them that way for direct lookups.
+                    success = save_new_user_to_db(username.lower(), full_name, email, hashed_pw)
                     if success:
                         st.success("User registered successfully! Please log in.")
                         st.session_state.page = 'login'
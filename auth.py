@@ -1,42 +1,205 @@
 # auth.py
 
+import logging
+import threading
 import streamlit as st
-import boto3
+import aws_clients
 from botocore.exceptions import ClientError
+from caching import TTLCache
+
+USER_CACHE_TTL_SECONDS = 300
+USER_CACHE_MAX_ENTRIES = 10000
+ALL_USERS_CACHE_TTL_SECONDS = 300
+# Key of the item recording that migrate_usernames() has run. Registered names are
+# lower-cased, so no account can take it.
+MIGRATION_MARKER = "#LowercaseUsernames"
+
+logger = logging.getLogger(__name__)
+
+# Usernames are stored lower-cased, the way streamlit-authenticator looks them
+# up, so every login is a single GetItem. Accounts registered earlier under
+# mixed-case names are copied to their lower-cased key by migrate_usernames(),
+# an admin action (see app.render_admin_tools) that scans the table once and
+# leaves a marker item behind. Nothing on the login path scans.
+#
+# Process-wide caches shared by every session.
+_user_cache = TTLCache(max_entries=USER_CACHE_MAX_ENTRIES, ttl_seconds=USER_CACHE_TTL_SECONDS)
+_all_users_cache = TTLCache(max_entries=1, ttl_seconds=ALL_USERS_CACHE_TTL_SECONDS)
+_NOT_FOUND = object()
+_migrated = False
+_migration_lock = threading.Lock()
 
 
 def get_dynamodb_table():
-    """Initializes and returns a boto3 DynamoDB table resource."""
-    dynamodb = boto3.resource(
-        'dynamodb',
-        aws_access_key_id=st.secrets["AWS_ACCESS_KEY_ID"],
-        aws_secret_access_key=st.secrets["AWS_SECRET_ACCESS_KEY"],
-        region_name=st.secrets["AWS_REGION"]
-    )
-    return dynamodb.Table('chatmydocs_users')
-
-
-def load_credentials_from_db():
-    """Loads all user credentials from the DynamoDB table."""
+    """Returns the chatmydocs_users table from the shared DynamoDB resource."""
+    return aws_clients.get_resource('dynamodb').Table('chatmydocs_users')
+
+
+def _credentials_entry(user):
+    return {
+        "email": user['email'],
+        "name": user['name'],
+        "password": user['password']
+    }
+
+
+def get_user(username, consistent=False):
+    """
+    Looks up one user's credentials with a GetItem call, through a TTL cache.
+
+    Returns None if the user does not exist. Pass consistent=True to bypass the
+    cache and force a strongly consistent read, e.g. before registering a name.
+    """
+    if not consistent:
+        cached = _user_cache.get(username)
+        if cached is not None:
+            return None if cached is _NOT_FOUND else cached
+
     table = get_dynamodb_table()
     try:
-        response = table.scan()
-        users = response.get('Items', [])
+        response = table.get_item(Key={'username': username}, ConsistentRead=consistent)
+    except ClientError as e:
+        st.error(f"Failed to load user from DynamoDB: {e.response['Error']['Message']}")
+        return None
+
+    item = response.get('Item')
+    entry = _credentials_entry(item) if item else None
+    _user_cache.set(username, entry if entry else _NOT_FOUND)
+    return entry
+
+
+def username_exists(username):
+    """Checks whether a username is taken, ignoring letter case, with a strongly consistent read."""
+    return get_user(username.lower(), consistent=True) is not None
+
+
+def _scan_users(table):
+    """Yields every user item, following LastEvaluatedKey across 1 MB scan pages."""
+    scan_kwargs = {}
+    while True:
+        response = table.scan(**scan_kwargs)
+        for item in response.get('Items', []):
+            if 'password' in item:
+                yield item
+        if 'LastEvaluatedKey' not in response:
+            return
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
 
+def migrate_usernames():
+    """
+    Copies accounts stored under mixed-case usernames to their lower-cased key.
+
+    Runs once per table: the first successful call scans it and writes
+    MIGRATION_MARKER; later calls only read the marker. The original items are
+    left in place, and a lower-cased name that already belongs to another
+    account is skipped with a warning. Returns the number of accounts copied, or
+    None if the migration failed; it can be run again, and picks up where it left off.
+    """
+    global _migrated
+    with _migration_lock:
+        if _migrated:
+            return 0
+        table = get_dynamodb_table()
+        copied = 0
+        try:
+            if table.get_item(Key={'username': MIGRATION_MARKER}, ConsistentRead=True).get('Item'):
+                _migrated = True
+                return 0
+            for user in _scan_users(table):
+                name = user['username']
+                if name == name.lower():
+                    continue
+                try:
+                    table.put_item(Item={**user, 'username': name.lower()},
+                                   ConditionExpression='attribute_not_exists(username)')
+                    copied += 1
+                except ClientError as e:
+                    if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                        raise
+                    logger.warning("Not migrating user %r: %r belongs to another account", name, name.lower())
+            table.put_item(Item={'username': MIGRATION_MARKER})
+        except ClientError as e:
+            st.error(f"Failed to migrate usernames in DynamoDB: {e.response['Error']['Message']}")
+            return None
+        _migrated = True
+    if copied:
+        logger.info("Migrated %d mixed-case usernames", copied)
+        _user_cache.clear()
+        _all_users_cache.clear()
+    return copied
+
+
+def load_credentials_from_db(use_cache=True):
+    """
+    Loads all user credentials from the DynamoDB table.
+
+    Follows LastEvaluatedKey so tables larger than one 1 MB scan page are read
+    completely. Only used where the full user list is genuinely needed; the login
+    path uses per-user lookups instead.
+    """
+    if use_cache:
+        cached = _all_users_cache.get("all")
+        if cached is not None:
+            return cached
+
+    table = get_dynamodb_table()
+    try:
         credentials = {"usernames": {}}
-        for user in users:
-            username = user['username']
-            credentials["usernames"][username] = {
-                "email": user['email'],
-                "name": user['name'],
-                "password": user['password']
-            }
+        for user in _scan_users(table):
+            credentials["usernames"][user['username']] = _credentials_entry(user)
+        _all_users_cache.set("all", credentials)
         return credentials
     except ClientError as e:
         st.error(f"Failed to load credentials from DynamoDB: {e.response['Error']['Message']}")
         return {"usernames": {}}
 
 
+class UserDirectory(dict):
+    """
+    A username -> credentials mapping for streamlit-authenticator that starts
+    empty and fetches users on demand, instead of holding the whole table.
+
+    Each lookup is one GetItem on the lower-cased username; unknown names are
+    cached as misses too, so they never fall back to a scan.
+    """
+
+    def __missing__(self, username):
+        user = get_user(username.lower())
+        if user is None:
+            raise KeyError(username)
+        # streamlit-authenticator writes per-session state (logged_in, failed
+        # attempts) into the entry, so each directory gets its own copy.
+        user = self[username] = dict(user)
+        return user
+
+    def __contains__(self, username):
+        try:
+            self[username]
+            return True
+        except KeyError:
+            return False
+
+    def get(self, username, default=None):
+        try:
+            return self[username]
+        except KeyError:
+            return default
+
+
+def attach_user_directory(credentials):
+    """
+    Points an authenticator's credentials at a lazily loaded UserDirectory.
+
+    streamlit-authenticator copies credentials["usernames"] into a new dict when it
+    is constructed, but keeps using the outer dict it was given. Replacing the
+    "usernames" entry after construction therefore makes every lookup go through
+    the directory.
+    """
+    credentials["usernames"] = UserDirectory()
+    return credentials
+
+
 def save_new_user_to_db(username, name, email, hashed_password):
     """Saves a new user's details to the DynamoDB table."""
     table = get_dynamodb_table()
@@ -47,9 +210,15 @@ def save_new_user_to_db(username, name, email, hashed_password):
                 'name': name,
                 'email': email,
                 'password': hashed_password
-            }
+            },
+            ConditionExpression='attribute_not_exists(username)'
         )
+        _user_cache.set(username, {"email": email, "name": name, "password": hashed_password})
+        _all_users_cache.clear()
         return True
     except ClientError as e:
-        st.error(f"Failed to register user in DynamoDB: {e.response['Error']['Message']}")
-        return False
\ No newline at end of file
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            st.error("That username is already taken.")
+        else:
+            st.error(f"Failed to register user in DynamoDB: {e.response['Error']['Message']}")
+        return False
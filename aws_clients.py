@@ -0,0 +1,144 @@
+# aws_clients.py
+
+import threading
+import streamlit as st
+import boto3
+from botocore.config import Config
+import telemetry
+
+# Process-wide registry of boto3 clients and resources. Streamlit runs every
+# session (and every rerun) on its own thread, so building a client per call
+# paid for credential resolution, endpoint setup and a fresh TLS handshake each
+# time. Clients are thread-safe and keep a connection pool, so one client per
+# service is shared by the whole process.
+#
+# Every client and resource built here records a telemetry span per API call
+# (see telemetry.instrument_client), so S3, DynamoDB and Bedrock latency shows
+# up next to the pipeline stages that caused it.
+
+_lock = threading.Lock()
+_session = None
+_clients = {}
+_resources = {}
+_overrides = {}
+
+DEFAULT_MAX_POOL_CONNECTIONS = 50
+DEFAULT_MAX_ATTEMPTS = 8
+
+
+def configure(**settings):
+    """
+    Overrides settings normally read from st.secrets and drops existing clients.
+
+    Used by benchmarks and offline runs, e.g. configure(AWS_ENDPOINT_URL="http://127.0.0.1:9000").
+    """
+    with _lock:
+        _overrides.update(settings)
+    reset()
+
+
+def _setting(name, default=None):
+    if name in _overrides:
+        return _overrides[name]
+    return st.secrets.get(name, default)
+
+
+def client_config(service_name: str, own_retries: bool = False) -> Config:
+    """
+    Returns the shared botocore Config: pooled keep-alive connections and adaptive retries.
+
+    With own_retries, botocore makes a single attempt and applies no client-side
+    rate limiting, for callers that handle throttling and backoff themselves.
+    """
+    if own_retries:
+        retries = {"mode": "standard", "total_max_attempts": 1}
+    else:
+        retries = {"mode": "adaptive", "max_attempts": int(_setting("AWS_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS))}
+    config = Config(
+        max_pool_connections=int(_setting("AWS_MAX_POOL_CONNECTIONS", DEFAULT_MAX_POOL_CONNECTIONS)),
+        retries=retries,
+        tcp_keepalive=True,
+    )
+    if service_name == "s3" and _setting("AWS_ENDPOINT_URL"):
+        # Local S3 stand-ins are reached by host:port, which only works with path-style addressing.
+        config = config.merge(Config(s3={"addressing_style": "path"}))
+    return config
+
+
+def _get_session():
+    global _session
+    if _session is None:
+        _session = boto3.session.Session(
+            aws_access_key_id=_setting("AWS_ACCESS_KEY_ID"),
+            aws_secret_access_key=_setting("AWS_SECRET_ACCESS_KEY"),
+            region_name=_setting("AWS_REGION"),
+        )
+    return _session
+
+
+def get_client(service_name: str, own_retries: bool = False):
+    """
+    Returns the shared, pooled boto3 client for a service, creating it on first use.
+
+    own_retries selects a separate client without botocore retries (see client_config).
+    """
+    key = (service_name, own_retries)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        if key not in _clients:
+            # boto3 sessions are not thread-safe, so clients are only ever created under the lock.
+            _clients[key] = telemetry.instrument_client(_get_session().client(
+                service_name,
+                config=client_config(service_name, own_retries),
+                endpoint_url=_setting("AWS_ENDPOINT_URL"),
+            ))
+        return _clients[key]
+
+
+def get_resource(service_name: str):
+    """
+    Returns the shared boto3 resource for a service.
+
+    Resource objects are not thread-safe when their attributes are loaded or
+    mutated. Callers only use stateless actions such as get_item and put_item,
+    which go straight through the resource's (thread-safe) low-level client.
+    """
+    resource = _resources.get(service_name)
+    if resource is not None:
+        return resource
+    with _lock:
+        if service_name not in _resources:
+            resource = _get_session().resource(
+                service_name,
+                config=client_config(service_name),
+                endpoint_url=_setting("AWS_ENDPOINT_URL"),
+            )
+            telemetry.instrument_client(resource.meta.client)
+            _resources[service_name] = resource
+        return _resources[service_name]
+
+
+def install(service_name: str, client=None, resource=None):
+    """
+    Registers a ready-made client and/or resource for a service instead of building one with boto3.
+
+    Used by the offline benchmarks to plug in in-memory stand-ins (see benchmarks/fakes.py).
+    Call it after configure(), which drops every registered client.
+    """
+    with _lock:
+        if client is not None:
+            _clients[(service_name, False)] = client
+            _clients[(service_name, True)] = client
+        if resource is not None:
+            _resources[service_name] = resource
+
+
+def reset():
+    """Drops all cached clients, e.g. after rotating credentials."""
+    global _session
+    with _lock:
+        _session = None
+        _clients.clear()
+        _resources.clear()
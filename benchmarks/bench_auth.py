@@ -0,0 +1,105 @@
+# benchmarks/bench_auth.py
+"""
+Shows per-rerun credential loading cost as the user table grows: the old
+full-table scan on every rerun versus the lazy UserDirectory with cached
+GetItem lookups. DynamoDB is replaced by an in-memory table that paginates
+scans like the real service (about 1 MB per page) and sleeps to simulate
+request latency.
+
+Usage: python benchmarks/bench_auth.py [--latency-ms 8] [--reruns 20]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import auth
+
+ITEM_BYTES = 250
+PAGE_BYTES = 1024 * 1024
+
+
+class FakeUserTable:
+    """An in-memory stand-in for the chatmydocs_users table."""
+
+    def __init__(self, n_users, latency):
+        self.latency = latency
+        self.items = {
+            f"user{i}": {"username": f"user{i}", "name": f"User {i}", "email": f"user{i}@example.com",
+                         "password": "$2b$12$" + "x" * 53}
+            for i in range(n_users)
+        }
+        self.keys = list(self.items)
+        self.calls = 0
+
+    def scan(self, ExclusiveStartKey=None):
+        self.calls += 1
+        page_size = PAGE_BYTES // ITEM_BYTES
+        start = 0 if ExclusiveStartKey is None else self.keys.index(ExclusiveStartKey["username"]) + 1
+        page = self.keys[start:start + page_size]
+        # Scans are billed and timed per page; reading more items takes proportionally longer.
+        time.sleep(self.latency * (1 + len(page) / 1000))
+        response = {"Items": [self.items[k] for k in page]}
+        if start + page_size < len(self.keys):
+            response["LastEvaluatedKey"] = {"username": page[-1]}
+        return response
+
+    def get_item(self, Key, ConsistentRead=False):
+        self.calls += 1
+        time.sleep(self.latency)
+        item = self.items.get(Key["username"])
+        return {"Item": item} if item else {}
+
+
+def old_rerun(table):
+    """What every rerun used to do: one unpaginated scan, building the full credential dict."""
+    response = table.scan()
+    return {"usernames": {u["username"]: u for u in response.get("Items", [])}}
+
+
+def new_rerun(username):
+    """What a rerun does now: an empty directory, plus a (cached) lookup for the logged-in user."""
+    credentials = auth.attach_user_directory({"usernames": {}})
+    return credentials["usernames"][username]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency-ms", type=float, default=8.0)
+    parser.add_argument("--reruns", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'users':>8} {'old scan ms':>12} {'full scan ms':>13} {'new lookup ms':>14} {'full calls':>11} {'new calls':>10}")
+    for n_users in (1000, 10000, 50000, 200000):
+        table = FakeUserTable(n_users, args.latency_ms / 1000)
+        auth.get_dynamodb_table = lambda: table
+
+        start = time.perf_counter()
+        for _ in range(args.reruns):
+            old_rerun(table)
+        old_ms = (time.perf_counter() - start) * 1000 / args.reruns
+        table.calls = 0
+
+        start = time.perf_counter()
+        for _ in range(args.reruns):
+            auth.load_credentials_from_db(use_cache=False)
+        full_ms = (time.perf_counter() - start) * 1000 / args.reruns
+        full_calls, table.calls = table.calls // args.reruns, 0
+
+        auth._user_cache.clear()
+        start = time.perf_counter()
+        for _ in range(args.reruns):
+            new_rerun(f"user{n_users // 2}")
+        new_ms = (time.perf_counter() - start) * 1000 / args.reruns
+
+        print(f"{n_users:>8} {old_ms:>12.2f} {full_ms:>13.2f} {new_ms:>14.3f} {full_calls:>11} {table.calls:>10}")
+    print("Calls are DynamoDB requests per rerun for the full scan, and in total for the new path.")
+    print("Note: the old scan read a single page, so beyond ~4,000 users it silently dropped the rest;")
+    print("the full (paginated) scan is what a correct per-rerun load would have cost.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# benchmarks/bench_aws_clients.py
+"""
+Compares per-request latency of building a fresh boto3 S3 client for every call
+(the old behaviour) against the shared, pooled client from aws_clients, using a
+local in-process S3 stand-in so no AWS account is needed.
+
+Usage: python benchmarks/bench_aws_clients.py [--requests 300] [--threads 8]
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import boto3
+import aws_clients
+
+SETTINGS = {
+    "AWS_ACCESS_KEY_ID": "bench",
+    "AWS_SECRET_ACCESS_KEY": "bench",
+    "AWS_REGION": "us-east-1",
+    "AWS_MAX_POOL_CONNECTIONS": 50,
+    "AWS_MAX_ATTEMPTS": 3,
+}
+
+
+class _S3StandIn(BaseHTTPRequestHandler):
+    """Answers path-style GetObject/PutObject requests from an in-memory dict."""
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    objects = {}
+
+    def do_PUT(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.objects[self.path] = self.rfile.read(length)
+        self._reply(200, b"")
+
+    def do_GET(self):
+        body = self.objects.get(self.path.split("?")[0])
+        if body is None:
+            self._reply(404, b"<Error><Code>NoSuchKey</Code></Error>")
+        else:
+            self._reply(200, body)
+
+    def _reply(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", '"bench"')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stand_in():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _S3StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def fresh_client(endpoint_url):
+    """Mirrors the previous get_s3_client: a brand-new client per call."""
+    return boto3.client(
+        "s3",
+        aws_access_key_id=SETTINGS["AWS_ACCESS_KEY_ID"],
+        aws_secret_access_key=SETTINGS["AWS_SECRET_ACCESS_KEY"],
+        region_name=SETTINGS["AWS_REGION"],
+        endpoint_url=endpoint_url,
+        config=aws_clients.client_config("s3"),
+    )
+
+
+def measure(get_client, n_requests, n_threads):
+    def one(i):
+        start = time.perf_counter()
+        get_client().get_object(Bucket="bench", Key=f"obj-{i % 10}")["Body"].read()
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=n_threads) as pool:
+        return sorted(pool.map(one, range(n_requests)))
+
+
+def report(label, latencies):
+    p = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+    print(f"{label:<18} mean {statistics.mean(latencies) * 1000:7.2f} ms  "
+          f"p50 {p(0.50):7.2f} ms  p95 {p(0.95):7.2f} ms  p99 {p(0.99):7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    server, endpoint_url = start_stand_in()
+    aws_clients.configure(AWS_ENDPOINT_URL=endpoint_url, **SETTINGS)
+    for i in range(10):
+        aws_clients.get_client("s3").put_object(Bucket="bench", Key=f"obj-{i}", Body=os.urandom(4096))
+
+    report("per-call client", measure(lambda: fresh_client(endpoint_url), args.requests, args.threads))
+    report("shared client", measure(lambda: aws_clients.get_client("s3"), args.requests, args.threads))
+    print("Note: the stand-in is plain HTTP, so TLS handshakes saved against real S3 are not included.")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# benchmarks/bench_chunking.py
+"""
+Compares the old fixed character splitter (1,000 characters, 200 overlap)
+against token-budgeted chunking with and without near-duplicate elimination
+on a generated reference corpus that mimics course material: slide decks
+built from one template, PDF pages with running headers and footers, and a
+syllabus that is included in several documents. Pages and slides are
+separated by form feeds (page breaks), which strip_repeated_lines treats
+as page edges.
+
+Reports chunk count, bytes of chunk text, and embedding calls (Titan embeds
+one text per request, so calls equal chunks), plus a false-positive check on
+a corpus of unique text where nothing should be dropped.
+
+Usage: python benchmarks/bench_chunking.py [--decks 20] [--papers 10] [--seed 7]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+import chunking
+
+WORDS = ("cell membrane protein enzyme energy gradient transport signal receptor pathway gene "
+         "expression replication mitochondria nucleus ribosome lipid bilayer diffusion osmosis "
+         "hormone neuron synapse regulation feedback metabolism glucose oxygen carbon nitrogen").split()
+
+
+def sentence(rng: random.Random, n_words: int = 14) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n_words)).capitalize() + "."
+
+
+def paragraph(rng: random.Random, n_sentences: int = 6) -> str:
+    return " ".join(sentence(rng) for _ in range(n_sentences))
+
+
+def make_corpus(n_decks: int, n_papers: int, seed: int):
+    rng = random.Random(seed)
+    syllabus = "\n\n".join(paragraph(rng) for _ in range(4))
+    template = ("BIO 101 - Introduction to Cell Biology - Spring Term\n"
+                "Department of Biological Sciences - For enrolled students only\n"
+                "Learning objectives: explain, compare, apply, evaluate.\n")
+    docs = []
+    for d in range(n_decks):
+        slides = [f"{template}Slide {s + 1} of 30\n\n{sentence(rng)} {sentence(rng)}" for s in range(30)]
+        if d % 4 == 0:
+            slides.append(syllabus)
+        docs.append(Document(page_content="\f".join(slides), metadata={"source": f"deck_{d}.pptx"}))
+    for p in range(n_papers):
+        pages = [
+            f"Journal of Cell Studies, Vol. 12\n\n{paragraph(rng, 10)}\n\n{paragraph(rng, 10)}\n\n"
+            f"Page {n + 1} - Copyright the authors, reproduced for teaching purposes only."
+            for n in range(12)
+        ]
+        if p % 3 == 0:
+            pages.append(syllabus)
+        docs.append(Document(page_content="\f".join(pages), metadata={"source": f"paper_{p}.pdf"}))
+    return docs
+
+
+def measure(label, chunks, elapsed):
+    n_bytes = sum(len(c.page_content.encode("utf-8")) for c in chunks)
+    print(f"{label:<38} chunks {len(chunks):6d}   bytes {n_bytes / 1024:8.1f} KB   "
+          f"embedding calls {len(chunks):6d}   {elapsed * 1000:7.1f} ms")
+    return len(chunks), n_bytes
+
+
+def run(docs, settings):
+    start = time.perf_counter()
+    if settings["dedup"]:
+        docs = [d for doc in docs for d in chunking.strip_repeated_lines([doc])]
+    chunks = chunking.make_splitter(settings).split_documents(docs)
+    if settings["dedup"]:
+        dedup = chunking.NearDuplicateFilter(settings["dedup_threshold"])
+        chunks = [c for c in chunks if not dedup.is_duplicate(c.page_content)]
+    return chunks, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--decks", type=int, default=20)
+    parser.add_argument("--papers", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    docs = make_corpus(args.decks, args.papers, args.seed)
+    print(f"Reference corpus: {len(docs)} documents, "
+          f"{sum(len(d.page_content) for d in docs) / 1024:.0f} KB of text")
+
+    start = time.perf_counter()
+    old = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200).split_documents(docs)
+    old_chunks, old_bytes = measure("characters 1000/200 (old)", old, time.perf_counter() - start)
+
+    no_dedup = chunking.chunking_settings({"dedup": False})
+    measure("tokens 256/24", *run(docs, no_dedup))
+    new_chunks, new_bytes = measure("tokens 256/24 + boilerplate filters", *run(docs, chunking.chunking_settings()))
+
+    print(f"Saved: {old_chunks - new_chunks} chunks ({1 - new_chunks / old_chunks:.0%}), "
+          f"{(old_bytes - new_bytes) / 1024:.0f} KB ({1 - new_bytes / old_bytes:.0%}), "
+          f"{old_chunks - new_chunks} embedding calls")
+
+    rng = random.Random(args.seed + 1)
+    unique = [Document(page_content="\n\n".join(paragraph(rng) for _ in range(40)), metadata={"source": "u"})
+              for _ in range(10)]
+    splitter = chunking.make_splitter(no_dedup)
+    unique_chunks = splitter.split_documents(unique)
+    dedup = chunking.NearDuplicateFilter(chunking.DEFAULT_CHUNKING["dedup_threshold"])
+    dropped = sum(dedup.is_duplicate(c.page_content) for c in unique_chunks)
+    print(f"False positives on unique text: {dropped} of {len(unique_chunks)} chunks dropped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# benchmarks/bench_embeddings.py
+"""
+Compares embedding a batch of chunks one Titan request at a time (what
+BedrockEmbeddings does) against rag_core.BedrockTitanEmbeddings, which sends
+the requests concurrently under an adaptive concurrency limit.
+
+A local Bedrock Runtime stand-in adds a fixed per-request latency and
+throttles with 429 ThrottlingException once more than --rate requests arrive
+within one second, the way an account quota would. Every vector encodes its
+input text, so the run also checks that results come back in input order.
+
+Usage: python benchmarks/bench_embeddings.py [--chunks 500] [--latency-ms 80] [--rate 120]
+                                             [--max-concurrency 16]
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import argparse
+import threading
+import collections
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aws_clients
+import rag_core
+
+SETTINGS = {
+    "AWS_ACCESS_KEY_ID": "bench",
+    "AWS_SECRET_ACCESS_KEY": "bench",
+    "AWS_REGION": "us-east-1",
+    "AWS_MAX_POOL_CONNECTIONS": 50,
+}
+
+
+def fake_vector(text: str) -> list:
+    return [float(zlib.crc32(text.encode("utf-8"))), float(len(text))]
+
+
+class _BedrockStandIn(BaseHTTPRequestHandler):
+    """InvokeModel for Titan embeddings, with simulated latency and a requests-per-second quota."""
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    latency = 0.08
+    rate = 120
+    _recent = collections.deque()
+    _lock = threading.Lock()
+    served = 0
+    throttled = 0
+
+    def _over_quota(self) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            while self._recent and now - self._recent[0] > 1.0:
+                self._recent.popleft()
+            if len(self._recent) >= self.rate:
+                type(self).throttled += 1
+                return True
+            self._recent.append(now)
+            type(self).served += 1
+            return False
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        if self._over_quota():
+            self._reply(429, {"message": "Too many requests, please wait before trying again."},
+                        error_type="ThrottlingException")
+            return
+        time.sleep(self.latency)
+        self._reply(200, {"embedding": fake_vector(body["inputText"]), "inputTextTokenCount": 1})
+
+    def _reply(self, status, payload, error_type=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if error_type:
+            self.send_header("x-amzn-ErrorType", error_type)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def sequential(texts):
+    """One request after another through the default client, as BedrockEmbeddings does."""
+    client = aws_clients.get_client("bedrock-runtime")
+    vectors = []
+    for text in texts:
+        response = client.invoke_model(modelId=rag_core.EMBEDDING_MODEL_ID, body=json.dumps({"inputText": text}),
+                                       accept="application/json", contentType="application/json")
+        vectors.append(json.loads(response["body"].read())["embedding"])
+    return vectors
+
+
+def report(label, texts, elapsed, vectors, extra=""):
+    in_order = all(v == fake_vector(t) for t, v in zip(texts, vectors))
+    print(f"{label:<28} {elapsed:7.2f} s   {len(texts) / elapsed:7.1f} chunks/s   "
+          f"in order: {'yes' if in_order else 'NO'}   {extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=80)
+    parser.add_argument("--rate", type=int, default=120, help="Requests per second before the stand-in throttles")
+    parser.add_argument("--max-concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    _BedrockStandIn.latency = args.latency_ms / 1000
+    _BedrockStandIn.rate = args.rate
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _BedrockStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    aws_clients.configure(AWS_ENDPOINT_URL=f"http://127.0.0.1:{server.server_address[1]}", **SETTINGS)
+
+    texts = [f"chunk {i}: the mitochondria is the powerhouse of the cell" for i in range(args.chunks)]
+    print(f"{args.chunks} chunks, {args.latency_ms:.0f} ms per request, quota {args.rate} requests/s")
+
+    start = time.perf_counter()
+    vectors = sequential(texts)
+    report("sequential (old)", texts, time.perf_counter() - start, vectors)
+
+    for label, options in (
+        (f"concurrent, starts at {args.max_concurrency}", {"max_concurrency": args.max_concurrency,
+                                     "initial_concurrency": args.max_concurrency}),
+        ("concurrent, starts at 4", {"max_concurrency": args.max_concurrency, "initial_concurrency": 4}),
+    ):
+        throttled_before = _BedrockStandIn.throttled
+        embeddings = rag_core.BedrockTitanEmbeddings(aws_clients.get_client("bedrock-runtime", own_retries=True),
+                                                     rag_core.EMBEDDING_MODEL_ID, options)
+        start = time.perf_counter()
+        vectors = embeddings.embed_documents(texts)
+        elapsed = time.perf_counter() - start
+        stats = embeddings.executor.stats()
+        report(label, texts, elapsed, vectors,
+               f"429s: {_BedrockStandIn.throttled - throttled_before:4d}   retries: {stats['retries']:4d}   "
+               f"final limit: {stats['concurrency']}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
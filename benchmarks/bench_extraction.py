@@ -0,0 +1,112 @@
+# benchmarks/bench_extraction.py
+"""
+Measures extraction throughput of rag_core._load_and_split as the number of
+worker processes grows, on a generated mixed PDF/DOCX/PNG corpus.
+
+Usage: python benchmarks/bench_extraction.py [--files 30] [--repeat 2]
+"""
+
+import os
+import io
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rag_core import _load_and_split
+
+LOREM = (
+    "Retrieval augmented generation grounds answers in source documents. "
+    "Each paragraph here is synthetic filler used only to give the parsers real work to do. "
+)
+
+
+def make_pdf(pages: int = 5) -> bytes:
+    """Builds a minimal multi-page text PDF without any third-party dependency."""
+    objects = []
+    page_ids = []
+    font_id = 3
+    for p in range(pages):
+        lines = [f"Page {p + 1}"] + [LOREM[:90]] * 40
+        stream = "BT /F1 10 Tf 40 800 Td 12 TL " + " ".join(f"({line}) '" for line in lines) + " ET"
+        content_id = 4 + 2 * p
+        page_id = content_id + 1
+        objects.append((content_id, f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream"))
+        objects.append((page_id, f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                                 f"/Contents {content_id} 0 R /Resources << /Font << /F1 {font_id} 0 R >> >> >>"))
+        page_ids.append(page_id)
+    objects.insert(0, (font_id, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"))
+    objects.insert(0, (2, f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {pages} >>"))
+    objects.insert(0, (1, "<< /Type /Catalog /Pages 2 0 R >>"))
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = {}
+    for obj_id, body in sorted(objects):
+        offsets[obj_id] = out.tell()
+        out.write(f"{obj_id} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+    xref = out.tell()
+    out.write(f"xref\n0 {len(offsets) + 1}\n0000000000 65535 f \n".encode())
+    for obj_id in sorted(offsets):
+        out.write(f"{offsets[obj_id]:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(offsets) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+
+def make_docx(paragraphs: int = 60) -> bytes:
+    import docx
+    document = docx.Document()
+    for i in range(paragraphs):
+        document.add_paragraph(f"{i}. {LOREM}")
+    out = io.BytesIO()
+    document.save(out)
+    return out.getvalue()
+
+
+def make_png() -> bytes:
+    from PIL import Image, ImageDraw
+    image = Image.new("RGB", (1200, 900), "white")
+    draw = ImageDraw.Draw(image)
+    for row in range(20):
+        draw.text((30, 30 + row * 40), LOREM[:80], fill="black")
+    out = io.BytesIO()
+    image.save(out, format="PNG")
+    return out.getvalue()
+
+
+def make_corpus(n_files: int) -> list:
+    makers = [("pdf", make_pdf), ("docx", make_docx), ("png", make_png)]
+    return [
+        {"name": f"doc_{i:03d}.{ext}", "data": maker()}
+        for i, (ext, maker) in ((i, makers[i % len(makers)]) for i in range(n_files))
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=2)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.files)
+    cpu = os.cpu_count() or 1
+    worker_counts = sorted({1, 2, 4, 8, cpu} & set(range(1, cpu + 1)))
+
+    # Warm the pool for each size once so worker start-up is not billed to the first run.
+    baseline = None
+    print(f"{'workers':>8} {'seconds':>9} {'files/s':>9} {'chunks':>7} {'speedup':>8}")
+    for workers in worker_counts:
+        _load_and_split(corpus[:workers], max_workers=workers)
+        best = float("inf")
+        chunks = 0
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            chunks = len(_load_and_split(corpus, max_workers=workers))
+            best = min(best, time.perf_counter() - start)
+        baseline = baseline or best
+        print(f"{workers:>8} {best:>9.2f} {len(corpus) / best:>9.2f} {chunks:>7} {baseline / best:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+# benchmarks/bench_imports.py
+"""
+Cold-start import benchmark for the login page and the first chat turn.
+
+The module lists come from app.py itself: the login page pays for every
+top-level import of app.py, and the first chat turn (or upload) additionally
+pays for the modules app.py imports inside its functions, i.e. rag_core and
+everything it pulls in. Each run starts a fresh interpreter with
+`python -X importtime`, imports the login modules and then the chat modules,
+and records per phase:
+
+  * wall_ms: wall time of the imports
+  * import_ms: the cumulative import time reported by -X importtime
+  * modules: the number of modules loaded
+
+Results are medians over --repeats runs. The heaviest packages of each phase
+(by self time, summed per top-level package) are listed, and packages that
+belong on the chat path but were loaded by the login page are reported.
+
+Without Streamlit installed, the headless stand-in (see headless/streamlit.py)
+is imported instead, and top-level modules that are not installed are left
+out; both are noted in the output, as they make the login numbers lower than
+in production.
+
+--save and --compare work as in bench_offline.py.
+
+Usage: python benchmarks/bench_imports.py [--repeats 5] [--top 10] [--save out.json]
+                                          [--compare baseline.json] [--tolerance 0.25]
+"""
+
+import os
+import ast
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import importlib.util
+
+from bench_offline import regressions
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+HEADLESS_DIR = os.path.join(BENCH_DIR, "headless")
+APP_PATH = os.path.join(REPO_DIR, "app.py")
+PHASES = ("login", "chat")
+# Packages that only ingestion and chat need; the login page should not load them.
+CHAT_ONLY_PACKAGES = ("langchain", "langchain_core", "langchain_community", "langchain_pinecone", "pinecone",
+                      "unstructured", "pytesseract", "pdf2image", "pypdf")
+
+CHILD = """
+import sys, json, time
+for phase, modules in json.loads(sys.argv[1]):
+    sys.stderr.write(f"@@phase {phase}\\n")
+    sys.stderr.flush()
+    start = time.perf_counter()
+    for module in modules:
+        __import__(module)
+    elapsed = time.perf_counter() - start
+    sys.stderr.write(f"@@wall {elapsed}\\n")
+    sys.stderr.write(f"@@loaded {' '.join(sorted(sys.modules))}\\n")
+    sys.stderr.flush()
+"""
+
+
+def app_imports(path: str = APP_PATH):
+    """Returns (top-level modules, modules imported inside functions) of app.py, in import order."""
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    top, deferred = [], []
+
+    def names(node):
+        if isinstance(node, ast.Import):
+            return [alias.name for alias in node.names]
+        return [node.module] if node.module and not node.level else []
+
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            top.extend(n for n in names(node) if n not in top)
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            for inner in ast.walk(node):
+                if isinstance(inner, (ast.Import, ast.ImportFrom)):
+                    deferred.extend(n for n in names(inner) if n not in top and n not in deferred)
+    return top, deferred
+
+
+def child_env(headless: bool) -> dict:
+    env = dict(os.environ)
+    paths = [HEADLESS_DIR, REPO_DIR] if headless else [REPO_DIR]
+    env["PYTHONPATH"] = os.pathsep.join(paths + [p for p in [env.get("PYTHONPATH")] if p])
+    # Bytecode is compiled on the first run and reused by the others, as on a server that restarts.
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    return env
+
+
+def run_once(phases: list, env: dict) -> dict:
+    """Imports each phase's modules in a fresh interpreter and parses its -X importtime report."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", CHILD, json.dumps(phases)],
+                          cwd=REPO_DIR, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing failed:\n{proc.stderr[-2000:]}")
+    results, phase = {}, None
+    for line in proc.stderr.splitlines():
+        if line.startswith("@@phase "):
+            phase = line.split()[1]
+            results[phase] = {"wall_ms": 0.0, "import_ms": 0.0, "modules": 0, "self_us": {}, "loaded": set()}
+        elif phase is None:
+            continue
+        elif line.startswith("@@wall "):
+            results[phase]["wall_ms"] = float(line.split()[1]) * 1000
+        elif line.startswith("@@loaded "):
+            results[phase]["loaded"] = set(line.split()[1:])
+        elif line.startswith("import time:"):
+            fields = line[len("import time:"):].split("|")
+            if len(fields) != 3 or not fields[0].strip().isdigit():
+                continue
+            self_us, cumulative_us, name = int(fields[0]), int(fields[1]), fields[2][1:]
+            result = results[phase]
+            result["modules"] += 1
+            if not name.startswith(" "):
+                result["import_ms"] += cumulative_us / 1000
+            package = name.strip().split(".")[0]
+            result["self_us"][package] = result["self_us"].get(package, 0) + self_us
+    return results
+
+
+def run(args) -> dict:
+    top, deferred = app_imports()
+    headless = importlib.util.find_spec("streamlit") is None
+    sys.path.insert(0, REPO_DIR)
+    login = []
+    for name in top:
+        if name == "streamlit" or importlib.util.find_spec(name.split(".")[0]) is not None:
+            login.append(name)
+        else:
+            print(f"note: {name} is not installed and is left out of the login phase")
+    if headless:
+        print("note: Streamlit is not installed; the headless stand-in is imported instead")
+    print(f"login modules: {', '.join(login)}")
+    print(f"chat modules:  {', '.join(deferred)}\n")
+
+    env = child_env(headless)
+    phases = [["login", login], ["chat", deferred]]
+    run_once(phases, env)  # Writes the bytecode caches, so every measured run starts from the same state.
+    runs = [run_once(phases, env) for _ in range(args.repeats)]
+
+    metrics = {}
+    for phase in PHASES:
+        for key in ("wall_ms", "import_ms"):
+            metrics[f"{phase}_{key}"] = statistics.median(r[phase][key] for r in runs)
+        metrics[f"{phase}_modules"] = runs[-1][phase]["modules"]
+
+    last = runs[-1]
+    for phase in PHASES:
+        heaviest = sorted(last[phase]["self_us"].items(), key=lambda item: item[1], reverse=True)[:args.top]
+        print(f"heaviest packages, {phase} phase (self time):")
+        for package, self_us in heaviest:
+            print(f"  {package:<32} {self_us / 1000:9.1f} ms")
+        print()
+    leaked = sorted(p for p in CHAT_ONLY_PACKAGES if p in last["login"]["loaded"])
+    if leaked:
+        print(f"warning: the login page loads chat-only packages: {', '.join(leaked)}\n")
+    metrics["login_chat_only_packages"] = len(leaked)
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Heaviest packages listed per phase")
+    parser.add_argument("--save", help="Write the metrics to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON file written by an earlier --save")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    metrics = run(args)
+    width = max(len(name) for name in metrics)
+    for name, value in metrics.items():
+        print(f"{name:<{width}}  {value:10.1f}" if isinstance(value, float) else f"{name:<{width}}  {value:10d}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(metrics, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            found = regressions(metrics, json.load(f), args.tolerance)
+        if found:
+            print(f"\nRegressions beyond {args.tolerance:.0%}:")
+            for line in found:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.tolerance:.0%}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# benchmarks/bench_mmr.py
+"""
+Compares the vectorized retrieval.mmr_select against LangChain's
+maximal_marginal_relevance (the path PineconeVectorStore's MMR search uses)
+for growing fetch_k, and checks that both pick the same candidates.
+
+Usage: python benchmarks/bench_mmr.py [--dim 1536] [--k 5] [--repeat 20]
+"""
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from retrieval import mmr_select
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--lambda-mult", type=float, default=0.5)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    print(f"{'fetch_k':>8} {'langchain ms':>13} {'vectorized ms':>14} {'speedup':>8} {'same picks':>11}")
+    for fetch_k in (50, 200, 500, 1000):
+        query = rng.normal(size=args.dim).astype(np.float32)
+        # Candidates clustered around the query, as real nearest neighbours are.
+        candidates = (query + rng.normal(scale=2.0, size=(fetch_k, args.dim))).astype(np.float32)
+        candidate_list = candidates.tolist()
+
+        baseline, expected = best_of(
+            lambda: maximal_marginal_relevance(
+                np.array([query]), candidate_list, k=args.k, lambda_mult=args.lambda_mult
+            ),
+            args.repeat,
+        )
+        vectorized, picked = best_of(
+            lambda: mmr_select(query, candidate_list, k=args.k, lambda_mult=args.lambda_mult),
+            args.repeat,
+        )
+        print(f"{fetch_k:>8} {baseline * 1000:>13.2f} {vectorized * 1000:>14.2f} "
+              f"{baseline / vectorized:>7.1f}x {str(list(expected) == picked):>11}")
+
+
+if __name__ == "__main__":
+    main()
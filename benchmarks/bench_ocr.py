@@ -0,0 +1,71 @@
+# benchmarks/bench_ocr.py
+"""
+Compares OCR of phone-photo-sized images the old way (full resolution, colour,
+one image at a time) against the ocr.py stage (normalized and downscaled,
+several images at once, cached by content hash).
+
+Images are synthetic: lines of text drawn onto a 4032 x 3024 canvas, the size
+of a typical 12 MP phone photo. Requires the tesseract binary.
+
+Usage: python benchmarks/bench_ocr.py [--images 8] [--workers 4]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw, ImageFont
+import pytesseract
+import ocr
+
+TEXT = "Lecture notes: the mitochondria is the powerhouse of the cell, week {n}."
+
+
+def make_photo(path: str, n: int):
+    image = Image.new("RGB", (4032, 3024), (236, 232, 220))
+    draw = ImageDraw.Draw(image)
+    try:
+        font = ImageFont.truetype("DejaVuSans.ttf", 64)
+    except OSError:
+        font = ImageFont.load_default()
+    for line in range(30):
+        draw.text((150, 120 + line * 95), TEXT.format(n=n * 100 + line), fill=(40, 40, 60), font=font)
+    image.save(path, quality=90, dpi=(72, 72))
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = [os.path.join(temp_dir, f"photo_{i}.jpg") for i in range(args.images)]
+        for i, path in enumerate(paths):
+            make_photo(path, i)
+        settings = {"cache_dir": os.path.join(temp_dir, "ocr-cache")}
+
+        baseline = timed(lambda: [pytesseract.image_to_string(Image.open(p)) for p in paths])
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            optimized = timed(lambda: list(pool.map(lambda p: ocr.ocr_image_file(p, p, settings), paths)))
+            cached = timed(lambda: list(pool.map(lambda p: ocr.ocr_image_file(p, p, settings), paths)))
+
+    print(f"{args.images} photos at 4032 x 3024")
+    print(f"full resolution, serial   {baseline:7.2f} s   {baseline / args.images:6.2f} s/image")
+    print(f"ocr.py, {args.workers} in parallel    {optimized:7.2f} s   {optimized / args.images:6.2f} s/image")
+    print(f"ocr.py, cached            {cached:7.2f} s")
+
+
+if __name__ == "__main__":
+    main()
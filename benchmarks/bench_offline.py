@@ -0,0 +1,236 @@
+# benchmarks/bench_offline.py
+"""
+End-to-end offline benchmark of the app's library code, with every external
+service replaced by the deterministic stand-ins in fakes.py and without
+Streamlit (see headless/streamlit.py).
+
+On a synthetic corpus (corpus.py) it measures:
+  * ingestion: rag_core.process_and_store_documents, in files/s and chunks/s
+  * chain setup: rag_core.create_conversational_chain over the stored namespace
+  * questions: rag_core.stream_answer, consumed the way step_chat renders it,
+    as p50/p95/p99 of time to first token and of total latency
+  * helpers: s3_utils JSON round trips and folder listing, catalog loads and
+    auth lookups and registrations, as p50/p95/p99
+  * peak memory: max RSS of this process and of the extraction workers
+
+--stages also prints the per-stage latency table collected by telemetry.py.
+
+--save writes the metrics to a JSON file; --compare checks them against a
+saved baseline and exits with status 1 if any metric regressed by more than
+--tolerance (throughputs must not drop, latencies and memory must not grow).
+
+Usage: python benchmarks/bench_offline.py [--files 20] [--questions 50] [--embed-latency-ms 20]
+                                          [--index-latency-ms 15] [--s3-latency-ms 10]
+                                          [--first-token-ms 300] [--save out.json]
+                                          [--compare baseline.json] [--tolerance 0.25] [--stages]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+
+import numpy as np
+
+import fakes
+from corpus import generate_corpus, generate_questions
+
+USERNAME = "bench"
+KB_NAME = "biology"
+BUCKET = "offline-bench"
+NOISE_FLOOR = 1.0  # Differences below 1 ms, 1 MB or 1 item/s are never reported as regressions.
+
+
+def secrets(work_dir: str, args) -> dict:
+    return {
+        "S3_BUCKET_NAME": BUCKET,
+        "PINECONE_API_KEY": "offline",
+        "PINECONE_INDEX_NAME": "offline",
+        "VECTOR_BACKEND": "pinecone",
+        "EXTRACTION_WORKERS": args.extraction_workers,
+        "EMBEDDING_CACHE_DIR": os.path.join(work_dir, "embeddings"),
+        "EXTRACTION_CACHE_DIR": os.path.join(work_dir, "extraction"),
+        "OCR_CACHE_DIR": os.path.join(work_dir, "ocr"),
+        "CHUNK_TEXT_CACHE_DIR": os.path.join(work_dir, "chunks"),
+        "LOCAL_INDEX_DIR": os.path.join(work_dir, "vectors"),
+    }
+
+
+def percentiles(samples, prefix: str) -> dict:
+    if not samples:
+        return {}
+    p50, p95, p99 = np.percentile(np.asarray(samples) * 1000, [50, 95, 99])
+    return {f"{prefix}_p50_ms": p50, f"{prefix}_p95_ms": p95, f"{prefix}_p99_ms": p99}
+
+
+def timed_samples(fn, repeats: int) -> list:
+    samples = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def peak_rss_mb(who) -> float:
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def run(args) -> dict:
+    work_dir = tempfile.mkdtemp(prefix="chatmydocs-bench-")
+    try:
+        st = fakes.use_headless_streamlit(secrets(work_dir, args))
+        import rag_core
+        import s3_utils
+        import catalog
+        import auth
+        import telemetry
+
+        services = fakes.install(
+            bedrock_latency=args.embed_latency_ms / 1000,
+            index_latency=args.index_latency_ms / 1000,
+            s3_latency=args.s3_latency_ms / 1000,
+            dynamodb_latency=args.s3_latency_ms / 1000,
+            first_token_s=args.first_token_ms / 1000,
+            token_s=args.token_ms / 1000,
+        )
+        items = generate_corpus(os.path.join(work_dir, "corpus"), n_files=args.files, seed=args.seed)
+        questions = generate_questions(args.questions, seed=args.seed + 1)
+        namespace = f"{USERNAME}-{KB_NAME}"
+        metrics = {}
+
+        start = time.perf_counter()
+        _, manifest = rag_core.process_and_store_documents(items, namespace=namespace, backend="pinecone")
+        elapsed = time.perf_counter() - start
+        n_chunks = sum(len(entry["chunk_ids"]) for entry in manifest["files"].values())
+        metrics.update(ingest_s=elapsed, ingest_files_per_s=len(items) / elapsed, ingest_chunks_per_s=n_chunks / elapsed)
+        s3_utils.save_json_to_s3(manifest, BUCKET, f"{USERNAME}/{KB_NAME}/source_documents.json")
+
+        start = time.perf_counter()
+        chain = rag_core.create_conversational_chain(rag_core.load_vector_store(namespace, backend="pinecone"))
+        metrics["chain_setup_ms"] = (time.perf_counter() - start) * 1000
+
+        totals, first_tokens, cached = [], [], 0
+        for question in questions:
+            start = time.perf_counter()
+            stream = rag_core.stream_answer(chain, namespace, question)
+            for _ in stream:
+                pass
+            if stream.result["cached"]:
+                cached += 1
+                continue
+            totals.append(time.perf_counter() - start)
+            first_tokens.append(stream.timings.get("first_token", stream.timings["total"]))
+        metrics.update(percentiles(totals, "query"))
+        metrics.update(percentiles(first_tokens, "first_token"))
+        metrics["answer_cache_hits"] = cached
+
+        def load_manifest(username, kb_name):
+            return rag_core.load_manifest(s3_utils.load_json_from_s3(BUCKET, f"{username}/{kb_name}/source_documents.json"))
+
+        document = {"kbs": {f"kb{i}": {"documents": i} for i in range(50)}}
+        repeats = args.helper_repeats
+        metrics.update(percentiles(timed_samples(
+            lambda i: s3_utils.save_json_to_s3(document, BUCKET, f"{USERNAME}/bench/{i}.json"), repeats), "s3_save_json"))
+        metrics.update(percentiles(timed_samples(
+            lambda i: s3_utils.load_json_from_s3(BUCKET, f"{USERNAME}/bench/{i}.json"), repeats), "s3_load_json"))
+        metrics.update(percentiles(timed_samples(
+            lambda i: s3_utils.list_folders_in_s3(BUCKET, USERNAME), repeats), "s3_list_folders"))
+        metrics.update(percentiles(timed_samples(
+            lambda i: catalog.load_catalog(BUCKET, USERNAME, load_manifest), repeats), "catalog_load"))
+        metrics.update(percentiles(timed_samples(
+            lambda i: auth.save_new_user_to_db(f"user{i}", f"User {i}", f"user{i}@example.com", "x" * 60),
+            repeats), "auth_register"))
+        metrics.update(percentiles(timed_samples(
+            lambda i: auth.get_user(f"user{i}", consistent=True), repeats), "auth_get_user"))
+
+        # Worker processes only count towards RUSAGE_CHILDREN once they have exited.
+        if rag_core._extraction_pool is not None:
+            rag_core._extraction_pool.shutdown(wait=True)
+        metrics["peak_rss_mb"] = peak_rss_mb(resource.RUSAGE_SELF)
+        metrics["peak_worker_rss_mb"] = peak_rss_mb(resource.RUSAGE_CHILDREN)
+        metrics["files"] = len(items)
+        metrics["chunks"] = n_chunks
+        metrics["embedding_requests"] = services.bedrock.requests
+        metrics["index_requests"] = services.index.requests
+        metrics["s3_requests"] = services.s3.requests
+        if args.stages:
+            print_stages(telemetry.summary())
+
+        errors = [text for kind, text in st.messages if kind == "error"]
+        if errors:
+            raise RuntimeError(f"{len(errors)} error(s) reported during the run, e.g. {errors[0]}")
+        return metrics
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def print_stages(rows: list):
+    print(f"{'stage':<24} {'count':>6} {'p50_ms':>9} {'p95_ms':>9} {'p99_ms':>9} {'total_s':>8}")
+    for row in rows:
+        print(f"{row['stage']:<24} {row['count']:>6} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} "
+              f"{row['p99_ms']:>9.1f} {row['total_s']:>8.2f}")
+    print()
+
+
+def regressions(metrics: dict, baseline: dict, tolerance: float) -> list:
+    """Compares rates (higher is better) and latencies and memory (lower is better) against a baseline."""
+    found = []
+    for name, base in baseline.items():
+        current = metrics.get(name)
+        if current is None or not base or not (name.endswith(("_per_s", "_ms", "_mb"))):
+            continue
+        if abs(current - base) < NOISE_FLOOR:
+            continue
+        if name.endswith("_per_s"):
+            worse = current < base * (1 - tolerance)
+        else:
+            worse = current > base * (1 + tolerance)
+        if worse:
+            found.append(f"{name}: {current:.1f} (baseline {base:.1f})")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--helper-repeats", type=int, default=50)
+    parser.add_argument("--embed-latency-ms", type=float, default=20)
+    parser.add_argument("--index-latency-ms", type=float, default=15)
+    parser.add_argument("--s3-latency-ms", type=float, default=10)
+    parser.add_argument("--first-token-ms", type=float, default=300)
+    parser.add_argument("--token-ms", type=float, default=5)
+    parser.add_argument("--extraction-workers", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--save", help="Write the metrics to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON file written by an earlier --save")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--stages", action="store_true", help="Print the per-stage latency table")
+    args = parser.parse_args()
+
+    metrics = run(args)
+    width = max(len(name) for name in metrics)
+    for name, value in metrics.items():
+        print(f"{name:<{width}}  {value:10.1f}" if isinstance(value, float) else f"{name:<{width}}  {value:10d}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(metrics, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            found = regressions(metrics, json.load(f), args.tolerance)
+        if found:
+            print(f"\nRegressions beyond {args.tolerance:.0%}:")
+            for line in found:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.tolerance:.0%}.")
+
+
+if __name__ == "__main__":
+    main()
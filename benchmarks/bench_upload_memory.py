@@ -0,0 +1,133 @@
+# benchmarks/bench_upload_memory.py
+"""
+Measures the memory a session's uploads cost with the old approach (bytes kept
+in session state, written again to a temp file for the loaders, hashed and sent
+to S3 from memory) against spooling once to disk via uploads.UploadSpool and
+reading that file everywhere.
+
+Two numbers are reported per variant:
+  * peak: highest RSS above the pre-upload baseline while the uploads are handled
+  * retained: RSS still held once the upload widget has gone away (steps 2 and 3
+    of the wizard), which is what accumulates across concurrent sessions
+
+Each variant runs in its own subprocess because ru_maxrss only ever grows.
+
+Usage: python benchmarks/bench_upload_memory.py [--files 8] [--size-mb 50] [--sessions 2]
+"""
+
+import io
+import os
+import sys
+import gc
+import json
+import hashlib
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PART_BYTES = 8 * 1024 * 1024
+
+
+def current_rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class FakeUploadedFile(io.BytesIO):
+    """Stands in for Streamlit's UploadedFile: an in-memory buffer with a name and size."""
+
+    def __init__(self, name, data):
+        super().__init__(data)
+        self.name = name
+        self.size = len(data)
+
+
+def drain_to_s3(stream):
+    """Reads a stream the way a multipart upload does, part by part."""
+    while stream.read(PART_BYTES):
+        pass
+
+
+def session_copying(uploaded_files, temp_dir, retained):
+    buffer = [{"name": f.name, "data": f.getvalue()} for f in uploaded_files]
+    retained.append(buffer)
+    for item in buffer:
+        drain_to_s3(io.BytesIO(item["data"]))
+    hashes = [hashlib.sha256(item["data"]).hexdigest() for item in buffer]
+    for item in buffer:
+        path = os.path.join(temp_dir, item["name"])
+        with open(path, "wb") as f:
+            f.write(item["data"])
+        os.remove(path)
+    return hashes
+
+
+def session_spooling(uploaded_files, temp_dir, retained, session_id):
+    import uploads
+    spool = uploads.get_spool(temp_dir, 2**40, 2**40)
+    items, _ = spool.spool_all(session_id, uploaded_files)
+    for item in items:
+        with open(item["path"], "rb") as f:
+            drain_to_s3(f)
+    retained.append(items)
+    return [item["sha256"] for item in items]
+
+
+def run_variant(variant, n_files, size_mb, n_sessions):
+    baseline = current_rss_mb()
+    sessions = [
+        [FakeUploadedFile(f"doc_{i}.pdf", os.urandom(size_mb * 2**20)) for i in range(n_files)]
+        for _ in range(n_sessions)
+    ]
+    retained = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        threads = [
+            threading.Thread(target=session_copying, args=(files, temp_dir, retained)) if variant == "copy"
+            else threading.Thread(target=session_spooling, args=(files, temp_dir, retained, f"session-{n}"))
+            for n, files in enumerate(sessions)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # The upload widget is not rendered after step 1, so Streamlit drops its buffers.
+        sessions.clear()
+        gc.collect()
+        print(json.dumps({"peak_mb": peak_rss_mb() - baseline, "retained_mb": current_rss_mb() - baseline}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=8)
+    parser.add_argument("--size-mb", type=int, default=50)
+    parser.add_argument("--sessions", type=int, default=2)
+    parser.add_argument("--variant", choices=["copy", "spool"])
+    args = parser.parse_args()
+
+    if args.variant:
+        run_variant(args.variant, args.files, args.size_mb, args.sessions)
+        return
+
+    upload_mb = args.files * args.size_mb
+    print(f"{args.sessions} concurrent session(s), each uploading {args.files} x {args.size_mb} MB = {upload_mb} MB")
+    for variant, label in (("copy", "copy into session state"), ("spool", "spool once to disk")):
+        output = subprocess.run(
+            [sys.executable, __file__, "--variant", variant, "--files", str(args.files),
+             "--size-mb", str(args.size_mb), "--sessions", str(args.sessions)],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{label:<26} peak {result['peak_mb']:8.1f} MB   "
+              f"retained per session {result['retained_mb'] / args.sessions:8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# benchmarks/bench_uploads.py
+"""
+Compares uploading a batch of files to S3 one put_object at a time (the old
+step_process loop) against s3_utils.BackgroundUploader, and shows how much of
+the upload time disappears when it overlaps with document processing.
+
+A local S3 stand-in adds a fixed per-request latency and a per-connection
+bandwidth cap, so the numbers reflect round trips rather than loopback speed.
+
+Usage: python benchmarks/bench_uploads.py [--files 50] [--size-kb 512] [--large-mb 64]
+                                          [--latency-ms 30] [--mbps 200] [--processing-s 5]
+"""
+
+import os
+import sys
+import time
+import uuid
+import argparse
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aws_clients
+import s3_utils
+
+SETTINGS = {
+    "AWS_ACCESS_KEY_ID": "bench",
+    "AWS_SECRET_ACCESS_KEY": "bench",
+    "AWS_REGION": "us-east-1",
+    "AWS_MAX_POOL_CONNECTIONS": 50,
+}
+
+
+class _SlowS3StandIn(BaseHTTPRequestHandler):
+    """Path-style PutObject plus the three multipart calls, with simulated latency and bandwidth."""
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    latency = 0.03
+    bytes_per_second = 200e6 / 8
+
+    def _delay(self, n_bytes):
+        time.sleep(self.latency + n_bytes / self.bytes_per_second)
+
+    def do_PUT(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        self._delay(length)
+        self._reply(200, b"", etag=f'"{uuid.uuid4().hex}"')
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        self._delay(length)
+        query = parse_qs(urlsplit(self.path).query, keep_blank_values=True)
+        if "uploads" in query:
+            body = (f"<InitiateMultipartUploadResult><Bucket>bench</Bucket><Key>k</Key>"
+                    f"<UploadId>{uuid.uuid4().hex}</UploadId></InitiateMultipartUploadResult>")
+        else:
+            body = "<CompleteMultipartUploadResult><ETag>\"done\"</ETag></CompleteMultipartUploadResult>"
+        self._reply(200, body.encode())
+
+    def _reply(self, status, body, etag='"bench"'):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serial_upload(files):
+    client = aws_clients.get_client("s3")
+    for name, data in files:
+        client.put_object(Bucket="bench", Key=name, Body=data)
+
+
+def background_upload(files, max_workers):
+    uploader = s3_utils.BackgroundUploader("bench", max_workers=max_workers)
+    for name, data in files:
+        uploader.submit(data, name)
+    return uploader
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--size-kb", type=int, default=512)
+    parser.add_argument("--large-mb", type=int, default=64)
+    parser.add_argument("--latency-ms", type=float, default=30)
+    parser.add_argument("--mbps", type=float, default=200, help="Bandwidth per connection, in megabits/s")
+    parser.add_argument("--processing-s", type=float, default=5, help="Simulated extraction + embedding time")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    _SlowS3StandIn.latency = args.latency_ms / 1000
+    _SlowS3StandIn.bytes_per_second = args.mbps * 1e6 / 8
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _SlowS3StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    aws_clients.configure(AWS_ENDPOINT_URL=f"http://127.0.0.1:{server.server_address[1]}", **SETTINGS)
+
+    files = [(f"u/kb/doc-{i}.pdf", os.urandom(args.size_kb * 1024)) for i in range(args.files)]
+    large = [("u/kb/large.pdf", os.urandom(args.large_mb * 1024 * 1024))]
+
+    serial_s, _ = timed(lambda: serial_upload(files))
+    parallel_s, _ = timed(lambda: background_upload(files, args.workers).results())
+    print(f"{args.files} x {args.size_kb} KB   serial {serial_s:6.2f} s   background pool {parallel_s:6.2f} s")
+
+    single_s, _ = timed(lambda: serial_upload(large))
+    multipart_s, _ = timed(lambda: background_upload(large, args.workers).results())
+    print(f"1 x {args.large_mb} MB        put_object {single_s:6.2f} s   multipart {multipart_s:6.2f} s")
+
+    def overlapped():
+        uploader = background_upload(files, args.workers)
+        time.sleep(args.processing_s)
+        return uploader.results()
+
+    before_s = serial_s + args.processing_s
+    overlap_s, _ = timed(overlapped)
+    print(f"KB creation with {args.processing_s:.0f} s of processing: "
+          f"upload-then-process {before_s:6.2f} s   overlapped {overlap_s:6.2f} s")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# benchmarks/bench_upserts.py
+"""
+Compares the old upsert path (one batch at a time, full chunk text and all
+Unstructured metadata on every vector) against rag_core.IndexUpserter with
+the compact metadata policy, with the chunk text kept inline and in a side
+chunk store.
+
+An in-memory index stand-in charges each request a fixed round trip plus
+transfer time for its JSON payload, so upsert time tracks both the number of
+sequential requests and their size. Query payload is the JSON size of a
+fetch_k-candidate response with values and metadata, as the MMR retriever
+requests it, and separately the metadata and text part of it, which is what
+the policy controls; with the side store, the texts of the k selected chunks
+are fetched afterwards and counted too.
+
+Usage: python benchmarks/bench_upserts.py [--chunks 2000] [--dim 1536] [--latency-ms 40]
+                                          [--mbps 100] [--workers 4]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+import rag_core
+from retrieval import mmr_select
+
+BATCH_SIZE = rag_core.EMBED_BATCH_SIZE
+
+
+class MemoryIndex:
+    """Pinecone-Index-like upsert and query over a dict, with simulated network cost per request."""
+
+    def __init__(self, latency: float, bytes_per_second: float):
+        self.latency = latency
+        self.bytes_per_second = bytes_per_second
+        self.records = {}
+        self.lock = threading.Lock()
+        self.bytes_sent = 0
+
+    def _network(self, n_bytes):
+        time.sleep(self.latency + n_bytes / self.bytes_per_second)
+
+    def upsert(self, vectors, namespace=None):
+        payload = json.dumps({"vectors": vectors, "namespace": namespace}).encode()
+        self._network(len(payload))
+        with self.lock:
+            self.bytes_sent += len(payload)
+            for v in vectors:
+                self.records[v["id"]] = v
+
+    def query(self, vector, top_k, namespace=None, filter=None, include_values=True, include_metadata=True):
+        records = list(self.records.values())
+        scores = np.asarray([r["values"] for r in records], dtype=np.float32) @ np.asarray(vector, dtype=np.float32)
+        order = np.argsort(-scores)[:top_k]
+        matches = [{"id": records[i]["id"], "score": float(scores[i]), "values": records[i]["values"],
+                    "metadata": records[i]["metadata"]} for i in order]
+        metadata_bytes = sum(len(json.dumps(m["metadata"]).encode()) for m in matches)
+        return {"matches": matches, "bytes": len(json.dumps({"matches": matches}).encode()),
+                "metadata_bytes": metadata_bytes}
+
+
+class MemoryChunkStore:
+    """ChunkTextStore stand-in: one simulated S3 round trip per call, as its objects are fetched concurrently."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.texts = {}
+
+    def put_many(self, namespace, texts):
+        time.sleep(self.latency)
+        self.texts.update(texts)
+
+    def get_many(self, namespace, vector_ids):
+        time.sleep(self.latency)
+        return {i: self.texts[i] for i in vector_ids if i in self.texts}
+
+
+def make_chunks(n: int, dim: int, seed: int):
+    rng = random.Random(seed)
+    words = "cell membrane protein enzyme energy gradient transport signal receptor pathway".split()
+    chunks, vectors = [], []
+    for i in range(n):
+        text = " ".join(rng.choice(words) for _ in range(180))
+        metadata = {
+            "source": f"lecture_{i // 100}.pdf",
+            "filename": f"tmp{i // 100:08x}.pdf",
+            "file_directory": "/tmp/chatmydocs/uploads/7f3e2a",
+            "filetype": "application/pdf",
+            "last_modified": "2024-03-14T09:26:53",
+            "languages": ["eng"],
+            "page_number": i % 40 + 1,
+        }
+        chunks.append(Document(page_content=text, metadata=metadata))
+        vectors.append([round(rng.gauss(0, 1), 6) for _ in range(dim)])
+    ids = [f"chunk-{i}" for i in range(n)]
+    return ids, chunks, vectors
+
+
+def old_upsert(index, ids, chunks, vectors):
+    for start in range(0, len(ids), BATCH_SIZE):
+        index.upsert(vectors=[
+            {"id": i, "values": v, "metadata": {**c.metadata, "text": c.page_content}}
+            for i, c, v in zip(ids[start:start + BATCH_SIZE], chunks[start:start + BATCH_SIZE],
+                               vectors[start:start + BATCH_SIZE])
+        ], namespace="bench")
+
+
+def new_upsert(index, ids, chunks, vectors, policy, store, workers):
+    upserter = rag_core.IndexUpserter(index, "bench", policy, store, max_workers=workers)
+    futures = [upserter(ids[s:s + BATCH_SIZE], chunks[s:s + BATCH_SIZE], vectors[s:s + BATCH_SIZE])
+               for s in range(0, len(ids), BATCH_SIZE)]
+    for future in futures:
+        future.result()
+    upserter.close()
+
+
+def query_payload(index, store, query, fetch_k=50, k=5):
+    response = index.query(vector=query, top_k=fetch_k, namespace="bench")
+    n_bytes, metadata_bytes = response["bytes"], response["metadata_bytes"]
+    matches = response["matches"]
+    selected = [matches[i] for i in mmr_select(query, [m["values"] for m in matches], k=k)]
+    if store is not None:
+        texts = store.get_many("bench", [m["id"] for m in selected if "text" not in m["metadata"]])
+        side_bytes = sum(len(t.encode()) for t in texts.values())
+        n_bytes += side_bytes
+        metadata_bytes += side_bytes
+    return n_bytes, metadata_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--latency-ms", type=float, default=40)
+    parser.add_argument("--mbps", type=float, default=100, help="Bandwidth to the index, in megabits/s")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    ids, chunks, vectors = make_chunks(args.chunks, args.dim, seed=3)
+    query = vectors[7]
+    latency, bandwidth = args.latency_ms / 1000, args.mbps * 1e6 / 8
+    whitelist = list(rag_core.DEFAULT_METADATA_FIELDS)
+    print(f"{args.chunks} chunks of dim {args.dim}, batches of {BATCH_SIZE}, "
+          f"{args.latency_ms:.0f} ms + {args.mbps:.0f} Mbit/s per request")
+
+    runs = (
+        ("sequential, full metadata (old)", None, None),
+        (f"{args.workers} workers, whitelist, inline", {"fields": whitelist, "text": "inline"}, None),
+        (f"{args.workers} workers, whitelist, side store", {"fields": whitelist, "text": "s3"},
+         MemoryChunkStore(latency)),
+    )
+    for label, policy, store in runs:
+        index = MemoryIndex(latency, bandwidth)
+        start = time.perf_counter()
+        if policy is None:
+            old_upsert(index, ids, chunks, vectors)
+        else:
+            new_upsert(index, ids, chunks, vectors, policy, store, args.workers)
+        elapsed = time.perf_counter() - start
+        payload, metadata = query_payload(index, store, query)
+        print(f"{label:<36} upsert {elapsed:6.2f} s  {args.chunks / elapsed:6.0f} vectors/s  "
+              f"sent {index.bytes_sent / 1e6:5.1f} MB   query {payload / 1024:6.1f} KB "
+              f"(metadata and text {metadata / 1024:5.1f} KB)")
+
+
+if __name__ == "__main__":
+    main()
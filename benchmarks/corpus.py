@@ -0,0 +1,82 @@
+# benchmarks/corpus.py
+"""
+Generates a deterministic synthetic corpus of course material for the offline
+benchmarks: plain-text and Markdown lecture notes built from topic
+vocabularies, with a running header on every page and a syllabus shared by
+some files, plus questions about the same topics.
+
+Files are written to a directory and returned as upload items in the shape
+uploads.UploadSpool produces ({"name", "path", "size", "sha256"}).
+"""
+
+import os
+import random
+import hashlib
+
+TOPICS = {
+    "cells": "cell membrane nucleus ribosome mitochondria organelle cytoplasm lipid protein vesicle",
+    "genetics": "gene allele chromosome mutation dominant recessive genotype phenotype inheritance dna",
+    "energy": "atp glucose respiration photosynthesis enzyme catalyst metabolism oxidation electron gradient",
+    "ecology": "population habitat predator prey niche biome ecosystem carbon nitrogen succession",
+    "physiology": "neuron synapse hormone receptor muscle heart kidney homeostasis feedback signal",
+}
+FILLER = "the of and to in is that by for with as are this which from can be an on".split()
+
+
+def _sentence(rng: random.Random, words: list) -> str:
+    picked = [rng.choice(words) if rng.random() < 0.4 else rng.choice(FILLER) for _ in range(rng.randint(10, 20))]
+    return " ".join(picked).capitalize() + "."
+
+
+def _page(rng: random.Random, words: list, paragraphs: int) -> str:
+    return "\n\n".join(" ".join(_sentence(rng, words) for _ in range(rng.randint(3, 6))) for _ in range(paragraphs))
+
+
+def generate_corpus(directory: str, n_files: int = 20, pages_per_file: int = 8, paragraphs_per_page: int = 4,
+                    seed: int = 7) -> list:
+    """Writes n_files documents into directory and returns their upload items."""
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    topics = list(TOPICS)
+    syllabus = _page(random.Random(seed - 1), " ".join(TOPICS.values()).split(), paragraphs_per_page)
+    items = []
+    for i in range(n_files):
+        topic = topics[i % len(topics)]
+        words = TOPICS[topic].split()
+        extension = ".md" if i % 3 == 0 else ".txt"
+        pages = []
+        for page in range(pages_per_file):
+            header = f"BIO 101 - {topic.title()} - Lecture {i + 1}"
+            body = _page(rng, words, paragraphs_per_page)
+            if extension == ".md":
+                pages.append(f"# {header}\n\n## Page {page + 1}\n\n{body}")
+            else:
+                pages.append(f"{header}\n\n{body}\n\nPage {page + 1} of {pages_per_file}")
+        if i % 4 == 0:
+            pages.append(syllabus)
+        data = "\n\n".join(pages).encode("utf-8")
+
+        name = f"lecture_{i + 1:03d}_{topic}{extension}"
+        path = os.path.join(directory, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        items.append({"name": name, "path": path, "size": len(data), "sha256": hashlib.sha256(data).hexdigest()})
+    return items
+
+
+def generate_questions(n: int, seed: int = 11) -> list:
+    """Returns n distinct questions about the corpus topics."""
+    rng = random.Random(seed)
+    templates = ("What is the role of the {a} in {b}?", "How does {a} relate to {b}?",
+                 "Explain {a} and {b} with an example.", "Why does {a} affect {b}?")
+    questions = []
+    seen = set()
+    while len(questions) < n:
+        words = TOPICS[rng.choice(list(TOPICS))].split()
+        a, b = rng.sample(words, 2)
+        question = rng.choice(templates).format(a=a, b=b)
+        if question in seen:
+            question = f"{question} (part {len(questions) + 1})"
+        seen.add(question)
+        questions.append(question)
+    return questions
@@ -0,0 +1,473 @@
+# benchmarks/fakes.py
+"""
+Deterministic local stand-ins for every external service the app talks to,
+for offline benchmarks:
+
+  * FakeBedrockRuntime: Titan-style InvokeModel backed by hash_embedding, a
+    feature-hashing embedder (similar texts get similar vectors)
+  * ScriptedChatModel: a chat model that answers with words from its prompt, with a
+    configurable time to first token and per-token delay
+  * MemoryIndex: a Pinecone-Index-like in-memory vector index
+  * MemoryS3: the S3 client calls used by s3_utils, caching and chunk_store
+  * MemoryDynamoDB: the DynamoDB resource and table calls used by auth
+
+Every stand-in can add a fixed per-request latency, so numbers reflect round
+trips rather than loopback speed. install() wires them into aws_clients and
+rag_core; use_headless_streamlit() must run before any repo module is imported.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import zlib
+import hashlib
+import threading
+
+import numpy as np
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+HEADLESS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "headless")
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def use_headless_streamlit(secrets: dict):
+    """
+    Puts the headless Streamlit stand-in on sys.path, ahead of any installed
+    Streamlit, and fills its st.secrets. sys.path is inherited by spawned
+    extraction workers, so they import the stand-in too.
+    """
+    for path in (REPO_DIR, HEADLESS_DIR):
+        if path in sys.path:
+            sys.path.remove(path)
+        sys.path.insert(0, path)
+    import streamlit
+    if not hasattr(streamlit, "messages"):
+        raise RuntimeError("streamlit was imported before use_headless_streamlit()")
+    streamlit.secrets.clear()
+    streamlit.secrets.update(secrets)
+    return streamlit
+
+
+def _client_error(code: str, operation: str, message: str = "", status: int = 400):
+    from botocore.exceptions import ClientError
+    return ClientError({"Error": {"Code": code, "Message": message or code},
+                        "ResponseMetadata": {"HTTPStatusCode": status}}, operation)
+
+
+class _Latency:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests = 0
+        self._counter_lock = threading.Lock()
+
+    def _request(self, extra: float = 0.0):
+        with self._counter_lock:
+            self.requests += 1
+        if self.latency or extra:
+            time.sleep(self.latency + extra)
+
+
+# --- Bedrock ---------------------------------------------------------------
+
+def hash_embedding(text: str, dim: int = 1536) -> list:
+    """
+    Embeds a text by feature hashing: each word adds +-1 to one of dim buckets.
+    Deterministic, and texts sharing words get a high cosine similarity.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in text.lower().split():
+        h = zlib.crc32(word.encode("utf-8"))
+        vector[h % dim] += 1.0 if h & 0x80000000 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector /= norm
+    return vector.tolist()
+
+
+class FakeBedrockRuntime(_Latency):
+    """bedrock-runtime client with Titan's InvokeModel request and response shape."""
+
+    def __init__(self, latency: float = 0.0, dim: int = 1536):
+        super().__init__(latency)
+        self.dim = dim
+
+    def invoke_model(self, modelId, body, accept=None, contentType=None, **kwargs):
+        self._request()
+        text = json.loads(body)["inputText"]
+        payload = {"embedding": hash_embedding(text, self.dim), "inputTextTokenCount": len(text.split())}
+        return {"body": io.BytesIO(json.dumps(payload).encode("utf-8")), "contentType": "application/json"}
+
+
+class ScriptedChatModel(BaseChatModel):
+    """A chat model that answers with words drawn from its prompt, after scripted delays."""
+
+    first_token_s: float = 0.3
+    token_s: float = 0.01
+    answer_words: int = 60
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def _words(self, messages) -> list:
+        prompt = " ".join(str(m.content) for m in messages)
+        seed = hashlib.sha256(prompt.encode("utf-8")).digest()
+        vocabulary = prompt.split() or ["answer"]
+        return [vocabulary[seed[i % len(seed)] * (i + 1) % len(vocabulary)] for i in range(self.answer_words)]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        words = self._words(messages)
+        time.sleep(self.first_token_s + self.token_s * len(words))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=" ".join(words)))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.first_token_s)
+        for i, word in enumerate(self._words(messages)):
+            if i:
+                time.sleep(self.token_s)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+
+
+def scripted_chat_model(first_token_s: float = 0.3, token_s: float = 0.01, answer_words: int = 60):
+    """Returns a factory with BedrockChat's signature that builds a ScriptedChatModel with these timings."""
+    def factory(client=None, model_id="", model_kwargs=None, **kwargs):
+        return ScriptedChatModel(first_token_s=first_token_s, token_s=token_s, answer_words=answer_words)
+    return factory
+
+
+# --- Pinecone --------------------------------------------------------------
+
+def _matches(metadata: dict, flt: dict) -> bool:
+    for field, condition in (flt or {}).items():
+        value = metadata.get(field)
+        if isinstance(condition, dict):
+            if "$eq" in condition and value != condition["$eq"]:
+                return False
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+class MemoryIndex(_Latency):
+    """The subset of pinecone.Index the app uses: upsert, query, delete, describe_index_stats."""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__(latency)
+        self._lock = threading.Lock()
+        self._namespaces = {}
+        self._matrices = {}
+
+    def upsert(self, vectors, namespace: str = "", **kwargs):
+        self._request()
+        with self._lock:
+            records = self._namespaces.setdefault(namespace, {})
+            for v in vectors:
+                records[v["id"]] = (np.asarray(v["values"], dtype=np.float32), dict(v.get("metadata") or {}))
+            self._matrices.pop(namespace, None)
+        return {"upserted_count": len(vectors)}
+
+    def _matrix(self, namespace):
+        with self._lock:
+            if namespace not in self._matrices:
+                records = self._namespaces.get(namespace, {})
+                ids = list(records)
+                values = np.stack([records[i][0] for i in ids]) if ids else np.zeros((0, 1), dtype=np.float32)
+                self._matrices[namespace] = (ids, values, [records[i][1] for i in ids])
+            return self._matrices[namespace]
+
+    def query(self, vector, top_k: int = 10, namespace: str = "", filter: dict = None,
+              include_values: bool = False, include_metadata: bool = False, **kwargs):
+        self._request()
+        ids, values, metadatas = self._matrix(namespace)
+        if not ids:
+            return {"matches": []}
+        scores = values @ np.asarray(vector, dtype=np.float32)
+        if filter:
+            scores = np.where([_matches(m, filter) for m in metadatas], scores, -np.inf)
+        order = np.argsort(-scores)[:top_k]
+        matches = []
+        for row in order:
+            if not np.isfinite(scores[row]):
+                break
+            match = {"id": ids[row], "score": float(scores[row])}
+            if include_values:
+                match["values"] = values[row].tolist()
+            if include_metadata:
+                match["metadata"] = dict(metadatas[row])
+            matches.append(match)
+        return {"matches": matches}
+
+    def delete(self, ids=None, delete_all: bool = False, namespace: str = "", filter: dict = None, **kwargs):
+        self._request()
+        with self._lock:
+            records = self._namespaces.get(namespace, {})
+            if delete_all:
+                if not records:
+                    # Like Pinecone, which has no namespace until a vector is written to it.
+                    from pinecone.exceptions import NotFoundException
+                    raise NotFoundException(status=404, reason="Namespace not found")
+                records.clear()
+            elif filter:
+                for id_ in [i for i, (_, m) in records.items() if _matches(m, filter)]:
+                    del records[id_]
+            else:
+                for id_ in ids or []:
+                    records.pop(id_, None)
+            self._matrices.pop(namespace, None)
+        return {}
+
+    def describe_index_stats(self, **kwargs):
+        with self._lock:
+            return {"namespaces": {ns: {"vector_count": len(r)} for ns, r in self._namespaces.items()}}
+
+
+class MemoryVectorStore:
+    """
+    Stands in for PineconeVectorStore: exposes the `_index`, `_namespace`,
+    `_text_key` and `embeddings` attributes that MMRRetriever reads.
+    """
+
+    index = None
+
+    def __init__(self, index, embedding, namespace: str, text_key: str = "text"):
+        self._index = index
+        self._embedding = embedding
+        self._namespace = namespace
+        self._text_key = text_key
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    @classmethod
+    def from_existing_index(cls, index_name=None, embedding=None, namespace=None, text_key="text", **kwargs):
+        return cls(cls.index, embedding, namespace, text_key)
+
+
+# --- S3 --------------------------------------------------------------------
+
+class _ListObjectsV2Paginator:
+    def __init__(self, s3):
+        self._s3 = s3
+
+    def paginate(self, Bucket, Prefix="", Delimiter=None, PaginationConfig=None, **kwargs):
+        page_size = (PaginationConfig or {}).get("PageSize", 1000)
+        token = None
+        while True:
+            page = self._s3.list_objects_v2(Bucket=Bucket, Prefix=Prefix, Delimiter=Delimiter,
+                                            MaxKeys=page_size, ContinuationToken=token)
+            yield page
+            token = page.get("NextContinuationToken")
+            if not token:
+                return
+
+
+class MemoryS3(_Latency):
+    """The S3 client calls the app makes, over a dict, including conditional GET and PUT by ETag."""
+
+    def __init__(self, latency: float = 0.0, bytes_per_second: float = None):
+        super().__init__(latency)
+        self.bytes_per_second = bytes_per_second
+        self._lock = threading.Lock()
+        self._objects = {}
+
+    def _transfer(self, n_bytes):
+        self._request(n_bytes / self.bytes_per_second if self.bytes_per_second else 0.0)
+
+    @staticmethod
+    def _etag(data: bytes) -> str:
+        return f'"{hashlib.md5(data).hexdigest()}"'
+
+    def put_object(self, Bucket, Key, Body=b"", IfMatch=None, IfNoneMatch=None, **kwargs):
+        data = Body.read() if hasattr(Body, "read") else (Body.encode("utf-8") if isinstance(Body, str) else bytes(Body))
+        self._transfer(len(data))
+        with self._lock:
+            current = self._objects.get((Bucket, Key))
+            if IfNoneMatch == "*" and current is not None:
+                raise _client_error("PreconditionFailed", "PutObject", status=412)
+            if IfMatch is not None and (current is None or current[1] != IfMatch):
+                raise _client_error("PreconditionFailed", "PutObject", status=412)
+            etag = self._etag(data)
+            self._objects[(Bucket, Key)] = (data, etag)
+        return {"ETag": etag}
+
+    def _get(self, Bucket, Key, operation):
+        with self._lock:
+            found = self._objects.get((Bucket, Key))
+        if found is None:
+            raise _client_error("NoSuchKey", operation, status=404)
+        return found
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None, **kwargs):
+        data, etag = self._get(Bucket, Key, "GetObject")
+        if IfNoneMatch is not None and IfNoneMatch == etag:
+            self._request()
+            raise _client_error("304", "GetObject", "Not Modified", status=304)
+        self._transfer(len(data))
+        return {"Body": io.BytesIO(data), "ETag": etag, "ContentLength": len(data)}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self._request()
+        data, etag = self._get(Bucket, Key, "HeadObject")
+        return {"ETag": etag, "ContentLength": len(data)}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self._request()
+        with self._lock:
+            self._objects.pop((Bucket, Key), None)
+        return {}
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        self._request()
+        with self._lock:
+            for obj in Delete["Objects"]:
+                self._objects.pop((Bucket, obj["Key"]), None)
+        return {} if Delete.get("Quiet") else {"Deleted": [{"Key": o["Key"]} for o in Delete["Objects"]]}
+
+    def list_objects_v2(self, Bucket, Prefix="", Delimiter=None, MaxKeys=1000, ContinuationToken=None, **kwargs):
+        self._request()
+        with self._lock:
+            keys = sorted(k for b, k in self._objects if b == Bucket and k.startswith(Prefix))
+            sizes = {k: len(self._objects[(Bucket, k)][0]) for k in keys}
+        # Keys under a common prefix collapse into one entry; the continuation token is an offset into the entries.
+        entries = []
+        for key in keys:
+            rest = key[len(Prefix):]
+            if Delimiter and Delimiter in rest:
+                prefix = Prefix + rest.split(Delimiter, 1)[0] + Delimiter
+                if not entries or entries[-1] != ("prefix", prefix):
+                    entries.append(("prefix", prefix))
+            else:
+                entries.append(("key", key))
+        offset = int(ContinuationToken or 0)
+        page_entries = entries[offset:offset + MaxKeys]
+        page = {"KeyCount": len(page_entries)}
+        contents = [{"Key": k, "Size": sizes[k]} for kind, k in page_entries if kind == "key"]
+        prefixes = [{"Prefix": p} for kind, p in page_entries if kind == "prefix"]
+        if contents:
+            page["Contents"] = contents
+        if prefixes:
+            page["CommonPrefixes"] = prefixes
+        if offset + MaxKeys < len(entries):
+            page["NextContinuationToken"] = str(offset + MaxKeys)
+        return page
+
+    def get_paginator(self, operation_name):
+        if operation_name != "list_objects_v2":
+            raise NotImplementedError(operation_name)
+        return _ListObjectsV2Paginator(self)
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, Config=None, **kwargs):
+        self.put_object(Bucket=Bucket, Key=Key, Body=Fileobj.read())
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None, Config=None, **kwargs):
+        with open(Filename, "rb") as f:
+            self.put_object(Bucket=Bucket, Key=Key, Body=f.read())
+
+    def download_file(self, Bucket, Key, Filename, ExtraArgs=None, Config=None, **kwargs):
+        with open(Filename, "wb") as f:
+            f.write(self.get_object(Bucket=Bucket, Key=Key)["Body"].read())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._objects)
+
+
+# --- DynamoDB --------------------------------------------------------------
+
+class MemoryTable(_Latency):
+    """A DynamoDB table keyed by one hash key, with conditional puts and paginated scans."""
+
+    def __init__(self, key: str, latency: float = 0.0):
+        super().__init__(latency)
+        self.key = key
+        self._lock = threading.Lock()
+        self._items = {}
+
+    def get_item(self, Key, ConsistentRead=False, **kwargs):
+        self._request()
+        with self._lock:
+            item = self._items.get(Key[self.key])
+        return {"Item": dict(item)} if item else {}
+
+    def put_item(self, Item, ConditionExpression=None, **kwargs):
+        self._request()
+        with self._lock:
+            if ConditionExpression == f"attribute_not_exists({self.key})" and Item[self.key] in self._items:
+                raise _client_error("ConditionalCheckFailedException", "PutItem")
+            self._items[Item[self.key]] = dict(Item)
+        return {}
+
+    def scan(self, ExclusiveStartKey=None, Limit=1000, **kwargs):
+        self._request()
+        with self._lock:
+            keys = sorted(self._items)
+            if ExclusiveStartKey:
+                keys = [k for k in keys if k > ExclusiveStartKey[self.key]]
+            page = keys[:Limit]
+            response = {"Items": [dict(self._items[k]) for k in page], "Count": len(page)}
+        if len(keys) > Limit:
+            response["LastEvaluatedKey"] = {self.key: page[-1]}
+        return response
+
+
+class MemoryDynamoDB:
+    """A DynamoDB resource whose Table() returns MemoryTables, created on first use."""
+
+    def __init__(self, latency: float = 0.0, keys: dict = None):
+        self.latency = latency
+        self.keys = {"chatmydocs_users": "username", **(keys or {})}
+        self.tables = {}
+        self._lock = threading.Lock()
+
+    def Table(self, name):
+        with self._lock:
+            if name not in self.tables:
+                self.tables[name] = MemoryTable(self.keys.get(name, "id"), self.latency)
+            return self.tables[name]
+
+
+# --- Wiring ----------------------------------------------------------------
+
+class FakeServices:
+    """The stand-ins used by one benchmark run, for inspecting request counts afterwards."""
+
+    def __init__(self, s3, dynamodb, bedrock, index):
+        self.s3 = s3
+        self.dynamodb = dynamodb
+        self.bedrock = bedrock
+        self.index = index
+
+
+def install(bedrock_latency: float = 0.0, index_latency: float = 0.0, s3_latency: float = 0.0,
+            dynamodb_latency: float = 0.0, first_token_s: float = 0.3, token_s: float = 0.01,
+            embedding_dim: int = 1536) -> FakeServices:
+    """
+    Wires the stand-ins into aws_clients and rag_core: S3, DynamoDB and Bedrock
+    Runtime clients, the Pinecone index and vector store, and the chat model.
+    """
+    import aws_clients
+    import rag_core
+
+    services = FakeServices(
+        s3=MemoryS3(s3_latency),
+        dynamodb=MemoryDynamoDB(dynamodb_latency),
+        bedrock=FakeBedrockRuntime(bedrock_latency, embedding_dim),
+        index=MemoryIndex(index_latency),
+    )
+    aws_clients.configure(AWS_ACCESS_KEY_ID="offline", AWS_SECRET_ACCESS_KEY="offline", AWS_REGION="us-east-1")
+    aws_clients.install("s3", client=services.s3)
+    aws_clients.install("bedrock-runtime", client=services.bedrock)
+    aws_clients.install("dynamodb", resource=services.dynamodb)
+
+    MemoryVectorStore.index = services.index
+    rag_core._pinecone_index = lambda: services.index
+    rag_core.PineconeVectorStore = MemoryVectorStore
+    rag_core.BedrockChat = scripted_chat_model(first_token_s, token_s)
+    return services
@@ -0,0 +1,84 @@
+# benchmarks/headless/streamlit.py
+"""
+A headless stand-in for the parts of Streamlit that the library modules use
+(rag_core, s3_utils, auth, aws_clients), so the offline benchmarks run without
+Streamlit installed and without a script-run context.
+
+st.secrets is a plain dict filled by benchmarks.fakes.use_headless_streamlit.
+UI calls do nothing except record their text in `messages`, so a benchmark
+can tell whether a run reported errors.
+"""
+
+import threading
+
+secrets = {}
+messages = []
+_lock = threading.Lock()
+
+
+def _record(kind, body):
+    with _lock:
+        messages.append((kind, str(body)))
+
+
+def error(body, *args, **kwargs):
+    _record("error", body)
+
+
+def warning(body, *args, **kwargs):
+    _record("warning", body)
+
+
+def info(body, *args, **kwargs):
+    _record("info", body)
+
+
+def caption(body, *args, **kwargs):
+    _record("caption", body)
+
+
+def success(body, *args, **kwargs):
+    _record("success", body)
+
+
+def write(*args, **kwargs):
+    pass
+
+
+def markdown(*args, **kwargs):
+    pass
+
+
+class _Element:
+    """A placeholder element: accepts any update and renders nothing."""
+
+    def progress(self, *args, **kwargs):
+        return self
+
+    def update(self, *args, **kwargs):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+
+def progress(*args, **kwargs):
+    return _Element()
+
+
+def status(*args, **kwargs):
+    return _Element()
+
+
+def spinner(*args, **kwargs):
+    return _Element()
+
+
+def empty():
+    return _Element()
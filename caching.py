@@ -0,0 +1,259 @@
+# caching.py
+
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+
+
+def content_key(*parts) -> str:
+    """Builds a stable SHA-256 key from a sequence of string or bytes parts."""
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        h.update(part)
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class DiskLRUCache:
+    """
+    A size-bounded key/value blob cache on local disk.
+
+    Entries are stored as one file per key under a two-level fan-out directory.
+    A file's mtime doubles as its last-access time, so the LRU order survives
+    process restarts without a separate index file.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._sizes = {}
+        self._total = 0
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def _scan(self):
+        """Rebuilds the in-memory size index from what is already on disk."""
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                try:
+                    size = os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    continue
+                self._sizes[name] = size
+                self._total += size
+
+    def get(self, key: str):
+        """Returns the cached bytes for a key, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except OSError:
+            return None
+
+    def set(self, key: str, data: bytes):
+        """Stores bytes under a key, evicting least-recently-used entries if needed."""
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._total += len(data) - self._sizes.get(key, 0)
+            self._sizes[key] = len(data)
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Deletes the oldest entries until the cache is back under 90% of its budget."""
+        target = int(self.max_bytes * 0.9)
+        entries = []
+        for key in self._sizes:
+            try:
+                entries.append((os.path.getmtime(self._path(key)), key))
+            except OSError:
+                entries.append((0, key))
+        entries.sort()
+
+        for _, key in entries:
+            if self._total <= target:
+                break
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            self._total -= self._sizes.pop(key, 0)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._total
+
+    def __len__(self):
+        return len(self._sizes)
+
+
+class S3BlobStore:
+    """A flat key/value blob store under an S3 prefix, used as a shared second cache tier."""
+
+    def __init__(self, client_factory, bucket_name: str, prefix: str, max_workers: int = 16):
+        self._client_factory = client_factory
+        self.bucket_name = bucket_name
+        self.prefix = prefix.rstrip("/") + "/"
+        self.max_workers = max_workers
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key[:2]}/{key}"
+
+    def get(self, key: str):
+        """Returns the stored bytes for a key, or None if it is missing or unreadable."""
+        try:
+            response = self._client_factory().get_object(Bucket=self.bucket_name, Key=self._key(key))
+            return response["Body"].read()
+        except ClientError:
+            return None
+
+    def set(self, key: str, data: bytes):
+        try:
+            self._client_factory().put_object(Bucket=self.bucket_name, Key=self._key(key), Body=data)
+        except ClientError:
+            pass
+
+    def get_many(self, keys):
+        """Fetches several keys concurrently and returns a {key: bytes} dict of the hits."""
+        if not keys:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(keys))) as pool:
+            results = pool.map(self.get, keys)
+        return {key: data for key, data in zip(keys, results) if data is not None}
+
+    def set_many(self, items: dict):
+        if not items:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(items))) as pool:
+            list(pool.map(lambda kv: self.set(*kv), items.items()))
+
+
+class TieredBlobCache:
+    """A local DiskLRUCache optionally backed by an S3BlobStore; remote hits are copied locally."""
+
+    def __init__(self, local: DiskLRUCache, remote: S3BlobStore = None):
+        self.local = local
+        self.remote = remote
+
+    def get_many(self, keys):
+        """Looks keys up locally, then remotely. Returns ({key: bytes}, remote_hit_count)."""
+        found = {}
+        pending = []
+        for key in keys:
+            data = self.local.get(key)
+            if data is None:
+                pending.append(key)
+            else:
+                found[key] = data
+
+        remote_hits = 0
+        if pending and self.remote is not None:
+            fetched = self.remote.get_many(pending)
+            for key, data in fetched.items():
+                self.local.set(key, data)
+            found.update(fetched)
+            remote_hits = len(fetched)
+        return found, remote_hits
+
+    def set_many(self, items: dict):
+        for key, data in items.items():
+            self.local.set(key, data)
+        if self.remote is not None:
+            self.remote.set_many(items)
+
+
+class TTLCache:
+    """
+    A thread-safe, size-bounded in-process LRU mapping whose entries also expire.
+
+    get_or_create builds a missing value outside the main lock, and concurrent
+    callers asking for the same key wait for the first builder instead of all
+    building their own copy.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._building = {}
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if self._clock() >= expires_at:
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, self._clock() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_create(self, key, factory):
+        """Returns the cached value for key, calling factory() to build it on a miss."""
+        missing = object()
+        value = self.get(key, missing)
+        if value is not missing:
+            return value
+
+        with self._lock:
+            build_lock = self._building.setdefault(key, threading.Lock())
+        with build_lock:
+            value = self.get(key, missing)
+            if value is missing:
+                value = factory()
+                self.set(key, value)
+        with self._lock:
+            self._building.pop(key, None)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate) -> int:
+        """Drops every entry whose key matches predicate(key) and returns how many were dropped."""
+        with self._lock:
+            stale = [key for key in self._entries if predicate(key)]
+            for key in stale:
+                del self._entries[key]
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,164 @@
+# catalog.py
+
+import time
+import weakref
+import threading
+import s3_utils
+from caching import TTLCache
+
+# One JSON object per user, <username>/_catalog.json, describing all of their
+# knowledge bases so the dashboard and chat sidebar never need to list S3
+# prefixes or fetch per-KB manifests:
+#
+#   {"version": 1, "kbs": {"biology_notes": {"display_name": "Biology Notes",
+#     "documents": ["ch1.pdf"], "chunk_count": 120, "bytes": 81234,
+#     "created_at": 1700000000.0, "updated_at": 1700000300.0}}}
+#
+# Knowledge bases that are still being built, or whose build was interrupted,
+# are listed under "ingests" ({"biology_notes": {"display_name": ..., "started_at": ...}})
+# until their ingestion job finishes, so the dashboard can offer to resume them.
+#
+# Reads go through an in-process cache. Within FRESH_SECONDS a cached copy is
+# served without touching S3; after that, a conditional GET (If-None-Match) costs
+# a body-less 304 unless the catalog changed. Writes are read-modify-write with
+# S3 conditional puts (If-Match), retried if another session got there first.
+# Within this process, writes to the same catalog also take a per-user lock so
+# they queue instead of using up each other's attempts; other users are not held up.
+
+CATALOG_VERSION = 1
+FRESH_SECONDS = 5
+MAX_WRITE_ATTEMPTS = 5
+
+_cache = TTLCache(max_entries=1024, ttl_seconds=3600)
+_write_locks = weakref.WeakValueDictionary()
+_write_locks_guard = threading.Lock()
+
+
+def _catalog_key(username: str) -> str:
+    return f"{username}/_catalog.json"
+
+
+def _write_lock(bucket_name: str, username: str) -> threading.Lock:
+    """Returns the lock for writes to one catalog; it lives as long as someone holds it."""
+    with _write_locks_guard:
+        lock = _write_locks.get((bucket_name, username))
+        if lock is None:
+            lock = _write_locks[(bucket_name, username)] = threading.Lock()
+        return lock
+
+
+def _empty_catalog() -> dict:
+    return {"version": CATALOG_VERSION, "kbs": {}}
+
+
+def _build_from_s3(bucket_name: str, username: str, load_manifest) -> dict:
+    """Builds a catalog for a user who predates catalogs, from their KB folders and manifests."""
+    catalog = _empty_catalog()
+    now = time.time()
+    for kb_name in s3_utils.list_folders_in_s3(bucket_name, username):
+        catalog["kbs"][kb_name] = kb_summary(load_manifest(username, kb_name), kb_name.replace("_", " ").title(), now)
+    return catalog
+
+
+def _fetch(bucket_name: str, username: str):
+    """
+    Returns (catalog, etag, ok), revalidating the cached copy with a conditional GET when it is stale.
+
+    A missing catalog is (None, None, True). ok is False when S3 could not be
+    read and nothing was cached; the error has been reported by s3_utils.
+    """
+    cached = _cache.get(username)
+    if cached is not None and time.monotonic() - cached["checked_at"] < FRESH_SECONDS:
+        return cached["catalog"], cached["etag"], True
+
+    data, etag, changed = s3_utils.load_json_if_changed(
+        bucket_name, _catalog_key(username), cached["etag"] if cached else None
+    )
+    if not changed and cached is None:
+        return None, None, False  # Only a failed read leaves nothing to revalidate against.
+    catalog = data if changed else cached["catalog"]
+    _cache.set(username, {"catalog": catalog, "etag": etag, "checked_at": time.monotonic()})
+    return catalog, etag, True
+
+
+def load_catalog(bucket_name: str, username: str, load_manifest) -> dict:
+    """
+    Returns a user's catalog, creating it from their existing KBs on first use.
+
+    load_manifest(username, kb_name) is only called during that one-time migration,
+    which only runs when S3 reports that the catalog does not exist. If it cannot
+    be read, an empty catalog is returned and nothing is written.
+    """
+    catalog, _, ok = _fetch(bucket_name, username)
+    if catalog is None and ok:
+        update_catalog(bucket_name, username, lambda c: c, bootstrap=lambda: _build_from_s3(bucket_name, username, load_manifest))
+        catalog, _, _ = _fetch(bucket_name, username)
+    return catalog or _empty_catalog()
+
+
+def update_catalog(bucket_name: str, username: str, mutate, bootstrap=None) -> bool:
+    """
+    Applies mutate(catalog) to the user's catalog as an optimistic transaction.
+
+    The catalog is re-read and the mutation re-applied if another writer changed
+    it in between. bootstrap() supplies the starting catalog when none exists.
+    Returns False without writing if the catalog cannot be read.
+    """
+    with _write_lock(bucket_name, username):
+        for _ in range(MAX_WRITE_ATTEMPTS):
+            _cache.invalidate(username)
+            catalog, etag, ok = _fetch(bucket_name, username)
+            if not ok:
+                return False
+            if catalog is None:
+                catalog, etag = (bootstrap() if bootstrap else _empty_catalog()), None
+            mutate(catalog)
+            new_etag = s3_utils.save_json_if_unchanged(catalog, bucket_name, _catalog_key(username), etag)
+            if new_etag is not None:
+                _cache.set(username, {"catalog": catalog, "etag": new_etag, "checked_at": time.monotonic()})
+                return True
+        _cache.invalidate(username)
+        return False
+
+
+def kb_summary(manifest: dict, display_name: str, created_at: float = None) -> dict:
+    """Summarizes a KB manifest into its catalog entry."""
+    files = manifest["files"].values()
+    now = time.time()
+    return {
+        "display_name": display_name,
+        "documents": list(manifest["files"]),
+        "chunk_count": sum(len(f.get("chunk_ids") or []) for f in files),
+        "bytes": sum(f.get("size") or 0 for f in files),
+        "created_at": created_at or now,
+        "updated_at": now,
+    }
+
+
+def upsert_kb(bucket_name: str, username: str, kb_name: str, manifest: dict, display_name: str = None) -> bool:
+    """Records a created or updated KB in the user's catalog."""
+    def mutate(catalog):
+        previous = catalog["kbs"].get(kb_name, {})
+        catalog["kbs"][kb_name] = kb_summary(
+            manifest,
+            display_name or previous.get("display_name") or kb_name.replace("_", " ").title(),
+            previous.get("created_at"),
+        )
+    return update_catalog(bucket_name, username, mutate)
+
+
+def remove_kb(bucket_name: str, username: str, kb_name: str) -> bool:
+    """Removes a deleted KB from the user's catalog."""
+    return update_catalog(bucket_name, username, lambda catalog: catalog["kbs"].pop(kb_name, None))
+
+
+def add_ingest(bucket_name: str, username: str, kb_name: str, display_name: str) -> bool:
+    """Records that a KB's documents are being ingested by a background job."""
+    def mutate(catalog):
+        catalog.setdefault("ingests", {})[kb_name] = {"display_name": display_name, "started_at": time.time()}
+    return update_catalog(bucket_name, username, mutate)
+
+
+def remove_ingest(bucket_name: str, username: str, kb_name: str) -> bool:
+    """Clears a KB's ingestion record once its job has finished or been abandoned."""
+    return update_catalog(bucket_name, username, lambda catalog: catalog.get("ingests", {}).pop(kb_name, None))
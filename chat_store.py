@@ -0,0 +1,185 @@
+# chat_store.py
+
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor
+import s3_utils
+
+# Chat history is stored as an append-only series of compact JSON Lines
+# segments under <kb prefix>chat/, listed in order by a small index.json:
+#
+#   {"version": 1, "next_segment": 7, "segments": [{"id": 1, "count": 50}, ...]}
+#
+# Each chat turn writes one new segment holding only that turn's messages and
+# rewrites the index, so the bytes written per turn no longer grow with the
+# conversation. Two sessions on the same KB (e.g. two browser tabs) can append
+# at once: segments are only ever created, never overwritten, and the index is
+# saved with an S3 conditional put (If-Match), re-read and retried after a short
+# random backoff if the other session saved it first.
+#
+# Once enough small per-turn segments pile up at the tail they are compacted
+# into full pages of PAGE_SIZE messages. Readers load the most recent page
+# first and fetch older pages on demand by message offset, which stays valid
+# across compactions.
+
+PAGE_SIZE = 50
+MAX_TAIL_SEGMENTS = 10
+INDEX_VERSION = 1
+MAX_WRITE_ATTEMPTS = 5
+RETRY_BACKOFF_SECONDS = 0.05
+
+
+def _index_key(prefix: str) -> str:
+    return f"{prefix}chat/index.json"
+
+
+def _segment_key(prefix: str, segment_id: int) -> str:
+    return f"{prefix}chat/seg-{segment_id:08d}.jsonl"
+
+
+def _legacy_key(prefix: str) -> str:
+    return f"{prefix}chat_history.json"
+
+
+def _empty_index() -> dict:
+    return {"version": INDEX_VERSION, "next_segment": 1, "segments": []}
+
+
+def _write_segment(bucket_name: str, prefix: str, index: dict, messages: list) -> bool:
+    """Creates a segment under the next free id and appends it to the index; ids taken by another session are skipped."""
+    for _ in range(MAX_WRITE_ATTEMPTS):
+        segment_id = index["next_segment"]
+        index["next_segment"] += 1
+        if s3_utils.save_jsonl_to_s3(messages, bucket_name, _segment_key(prefix, segment_id), if_absent=True):
+            index["segments"].append({"id": segment_id, "count": len(messages)})
+            return True
+    return False
+
+
+def _read_segments(bucket_name: str, prefix: str, segments: list) -> list:
+    """Fetches several segments concurrently and returns their messages concatenated in order."""
+    if not segments:
+        return []
+    keys = [_segment_key(prefix, s["id"]) for s in segments]
+    with ThreadPoolExecutor(max_workers=min(8, len(keys))) as pool:
+        pages = list(pool.map(lambda key: s3_utils.load_jsonl_from_s3(bucket_name, key) or [], keys))
+    return [message for page in pages for message in page]
+
+
+def _migrate_legacy(bucket_name: str, prefix: str):
+    """Converts a legacy single-file chat_history.json into paged segments. Returns the new index or None."""
+    legacy = s3_utils.load_json_from_s3(bucket_name, _legacy_key(prefix))
+    if not legacy:
+        return None
+    index = _empty_index()
+    for start in range(0, len(legacy), PAGE_SIZE):
+        if not _write_segment(bucket_name, prefix, index, legacy[start:start + PAGE_SIZE]):
+            return None
+    if s3_utils.save_json_to_s3(index, bucket_name, _index_key(prefix)):
+        s3_utils.delete_file_from_s3(bucket_name, _legacy_key(prefix))
+    return index
+
+
+def load_index(bucket_name: str, prefix: str) -> dict:
+    """Loads a KB's chat index, migrating a legacy chat_history.json on first access."""
+    index = s3_utils.load_json_from_s3(bucket_name, _index_key(prefix))
+    if index is None:
+        index = _migrate_legacy(bucket_name, prefix)
+    return index or _empty_index()
+
+
+def _load_index_for_write(bucket_name: str, prefix: str):
+    """Returns (index, etag) read straight from S3, for a conditional save. The etag is None if there is no index yet."""
+    index, etag, _ = s3_utils.load_json_if_changed(bucket_name, _index_key(prefix))
+    if index is None and _migrate_legacy(bucket_name, prefix) is not None:
+        index, etag, _ = s3_utils.load_json_if_changed(bucket_name, _index_key(prefix))
+    return index or _empty_index(), etag
+
+
+def _compact_tail(bucket_name: str, prefix: str, index: dict) -> list:
+    """
+    Merges the run of small per-turn segments at the end of the index into full pages.
+
+    Only rewrites the index in memory; returns the keys of the replaced segments,
+    which the caller deletes once the new index has been saved.
+    """
+    tail_start = len(index["segments"])
+    while tail_start > 0 and index["segments"][tail_start - 1]["count"] < PAGE_SIZE:
+        tail_start -= 1
+    tail = index["segments"][tail_start:]
+    if len(tail) < MAX_TAIL_SEGMENTS:
+        return []
+
+    messages = _read_segments(bucket_name, prefix, tail)
+    if len(messages) != sum(s["count"] for s in tail):
+        return []  # A segment could not be read; leave the tail alone rather than lose messages.
+
+    compacted = dict(index, segments=index["segments"][:tail_start])
+    for start in range(0, len(messages), PAGE_SIZE):
+        if not _write_segment(bucket_name, prefix, compacted, messages[start:start + PAGE_SIZE]):
+            for page in compacted["segments"][tail_start:]:
+                s3_utils.delete_file_from_s3(bucket_name, _segment_key(prefix, page["id"]))
+            return []
+    index.update(compacted)
+    return [_segment_key(prefix, s["id"]) for s in tail]
+
+
+def append_messages(bucket_name: str, prefix: str, messages: list) -> bool:
+    """
+    Appends new chat messages as one segment, compacting the tail when it gets fragmented.
+
+    The segment is written once; if another session saves the index first, the
+    index is re-read and the segment appended to that version instead.
+    """
+    if not messages:
+        return True
+    index, etag = _load_index_for_write(bucket_name, prefix)
+    if not _write_segment(bucket_name, prefix, index, messages):
+        return False
+    segment = index["segments"][-1]
+    for attempt in range(MAX_WRITE_ATTEMPTS):
+        before = {s["id"] for s in index["segments"]}
+        obsolete = _compact_tail(bucket_name, prefix, index)
+        if s3_utils.save_json_if_unchanged(index, bucket_name, _index_key(prefix), etag) is not None:
+            for key in obsolete:
+                s3_utils.delete_file_from_s3(bucket_name, key)
+            return True
+        for compacted in index["segments"]:
+            if compacted["id"] not in before:
+                s3_utils.delete_file_from_s3(bucket_name, _segment_key(prefix, compacted["id"]))
+        time.sleep(random.uniform(0, RETRY_BACKOFF_SECONDS * 2 ** attempt))
+        index, etag = _load_index_for_write(bucket_name, prefix)
+        index["segments"].append(segment)
+        index["next_segment"] = max(index["next_segment"], segment["id"] + 1)
+    s3_utils.delete_file_from_s3(bucket_name, _segment_key(prefix, segment["id"]))
+    return False
+
+
+def load_page(bucket_name: str, prefix: str, end: int = None, min_messages: int = PAGE_SIZE):
+    """
+    Loads at least min_messages messages ending just before message offset `end`
+    (the newest messages when end is None).
+
+    Returns (messages, start_offset). start_offset is the position of the first
+    returned message in the whole conversation; pass it as `end` to load the
+    page before. An offset of 0 means the beginning has been reached.
+    """
+    index = load_index(bucket_name, prefix)
+    total = sum(s["count"] for s in index["segments"])
+    end = total if end is None else min(end, total)
+    window_start = max(0, end - min_messages)
+
+    selected = []
+    start_offset = 0
+    offset = 0
+    for segment in index["segments"]:
+        seg_start, seg_end = offset, offset + segment["count"]
+        offset = seg_end
+        if seg_end <= window_start or seg_start >= end:
+            continue
+        if not selected:
+            start_offset = seg_start
+        selected.append(segment)
+
+    messages = _read_segments(bucket_name, prefix, selected)
+    return messages[:end - start_offset], start_offset
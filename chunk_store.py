@@ -0,0 +1,89 @@
+# chunk_store.py
+
+from concurrent.futures import ThreadPoolExecutor
+from caching import DiskLRUCache, content_key
+import s3_utils
+
+# Chunk texts can be kept out of the vector index (see rag_core.metadata_policy),
+# so vectors carry only a few small metadata fields and query responses stay
+# small. The texts then live in S3, one object per vector:
+#
+#   {prefix}/{namespace}/{vector_id}
+#
+# Chunk IDs are derived from the file name, its content hash, the chunk's
+# position and how the file was extracted and split (chunking settings, loader
+# and OCR versions; see rag_core.chunk_variant), so an ID always names the same
+# text, even in a KB deleted and recreated under the same name with other
+# settings. That makes the local copy a plain cache that never needs
+# invalidating; it only has to be bounded.
+
+
+class ChunkTextStore:
+    """Stores chunk texts by vector ID in S3, with a local on-disk LRU in front for reads."""
+
+    def __init__(self, bucket_name: str, prefix: str, local: DiskLRUCache = None, max_workers: int = 16):
+        self.bucket_name = bucket_name
+        self.prefix = prefix.strip("/")
+        self.local = local
+        self.max_workers = max_workers
+
+    def _key(self, namespace: str, vector_id: str) -> str:
+        return f"{self.prefix}/{namespace}/{vector_id}"
+
+    def _local_key(self, namespace: str, vector_id: str) -> str:
+        return content_key("chunk", namespace, vector_id)
+
+    def namespace_prefix(self, namespace: str) -> str:
+        return f"{self.prefix}/{namespace}/"
+
+    def put_many(self, namespace: str, texts: dict):
+        """Writes {vector_id: text} concurrently. Raises on the first failed write."""
+        def put(item):
+            vector_id, text = item
+            data = text.encode("utf-8")
+            s3_utils.get_s3_client().put_object(Bucket=self.bucket_name, Key=self._key(namespace, vector_id),
+                                                Body=data)
+            if self.local is not None:
+                self.local.set(self._local_key(namespace, vector_id), data)
+
+        if not texts:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(texts))) as pool:
+            list(pool.map(put, texts.items()))
+
+    def get_many(self, namespace: str, vector_ids) -> dict:
+        """Returns {vector_id: text} for the given IDs; IDs with no stored text are left out."""
+        found = {}
+        missing = []
+        for vector_id in dict.fromkeys(vector_ids):
+            data = self.local.get(self._local_key(namespace, vector_id)) if self.local is not None else None
+            if data is None:
+                missing.append(vector_id)
+            else:
+                found[vector_id] = data.decode("utf-8")
+
+        def get(vector_id):
+            try:
+                response = s3_utils.get_s3_client().get_object(Bucket=self.bucket_name,
+                                                               Key=self._key(namespace, vector_id))
+                return response["Body"].read()
+            except Exception:
+                return None
+
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(missing))) as pool:
+                for vector_id, data in zip(missing, pool.map(get, missing)):
+                    if data is None:
+                        continue
+                    if self.local is not None:
+                        self.local.set(self._local_key(namespace, vector_id), data)
+                    found[vector_id] = data.decode("utf-8")
+        return found
+
+    def delete_many(self, namespace: str, vector_ids) -> dict:
+        """Deletes the texts of the given IDs; returns s3_utils.delete_keys's report."""
+        return s3_utils.delete_keys(self.bucket_name, [self._key(namespace, vector_id) for vector_id in vector_ids])
+
+    def delete_namespace(self, namespace: str, on_progress=None) -> dict:
+        """Deletes every text stored for a namespace; returns s3_utils.delete_prefix's report."""
+        return s3_utils.delete_prefix(self.bucket_name, self.namespace_prefix(namespace), on_progress=on_progress)
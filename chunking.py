@@ -0,0 +1,176 @@
+# chunking.py
+
+import re
+import zlib
+
+# Chunking settings are chosen per knowledge base and stored in its manifest
+# under "chunking"; missing keys fall back to DEFAULT_CHUNKING:
+#
+#   {"chunk_tokens": 256, "overlap_tokens": 24, "dedup": true, "dedup_threshold": 0.9}
+#
+# Chunk sizes are measured in tokens rather than characters, so dense text and
+# text full of short tokens (code, tables, numbers) get comparable budgets. The
+# count is an estimate: words and punctuation marks are tokens, and long words
+# count one token per four characters, which tracks subword tokenizers closely
+# enough for sizing chunks without depending on the embedding model's vocabulary.
+#
+# With "dedup" on, boilerplate is removed in two steps before embedding. Lines
+# that recur at the top or bottom of the pages of one file (running headers and
+# footers, slide template text) are kept only where they first appear; numbers,
+# table rows and the body of a page are left alone. Then near-duplicate
+# chunks (the same page in two documents, near-identical slides) are dropped,
+# using MinHash signatures over word shingles and locality-sensitive hashing to
+# find candidate pairs. Both only look within one ingestion run.
+
+DEFAULT_CHUNKING = {
+    "chunk_tokens": 256,
+    "overlap_tokens": 24,
+    "dedup": True,
+    "dedup_threshold": 0.9,
+}
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_DIGITS_RE = re.compile(r"\d+")
+
+
+def chunking_settings(overrides: dict = None) -> dict:
+    return {**DEFAULT_CHUNKING, **(overrides or {})}
+
+
+def count_tokens(text: str) -> int:
+    """Estimates the number of subword tokens in a text."""
+    return sum((len(piece) + 3) // 4 for piece in _TOKEN_RE.findall(text))
+
+
+def make_splitter(settings: dict):
+    """Returns a recursive splitter whose chunk size and overlap are token budgets."""
+    # Imported here so that app.py can read DEFAULT_CHUNKING without loading LangChain.
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(
+        chunk_size=settings["chunk_tokens"],
+        chunk_overlap=settings["overlap_tokens"],
+        length_function=count_tokens,
+    )
+
+
+def strip_repeated_lines(docs, min_repeats: int = 3, max_line_chars: int = 200, edge_lines: int = 2,
+                         min_line_chars: int = 8) -> list:
+    """
+    Removes running headers and footers: lines among the first or last
+    edge_lines lines of a page that recur at least min_repeats times in those
+    positions across one file's documents. The first occurrence is kept.
+
+    Each document is a page, and form feeds split a document into pages.
+    Lines are compared with digits collapsed, so "Page 3" and "Page 4" count
+    as the same line, but only lines of min_line_chars to max_line_chars
+    characters with more letters than digits qualify. Table rows, numbers,
+    short labels and anything in the body of a page are never removed.
+    """
+    def normalize(line):
+        return _DIGITS_RE.sub("0", line.strip().lower())
+
+    def qualifies(line, key):
+        letters = sum(c.isalpha() for c in line)
+        return min_line_chars <= len(key) <= max_line_chars and letters > sum(c.isdigit() for c in line)
+
+    def split_page(page):
+        lines = page.split("\n")
+        filled = [i for i, line in enumerate(lines) if line.strip()]
+        return lines, set(filled[:edge_lines] + filled[-edge_lines:])
+
+    pages = [[split_page(page) for page in doc.page_content.split("\f")] for doc in docs]
+    counts = {}
+    for doc_pages in pages:
+        for lines, edges in doc_pages:
+            for i in edges:
+                key = normalize(lines[i])
+                if qualifies(lines[i], key):
+                    counts[key] = counts.get(key, 0) + 1
+    repeated = {key for key, n in counts.items() if n >= min_repeats}
+    if not repeated:
+        return list(docs)
+
+    from langchain_core.documents import Document
+    seen = set()
+    stripped = []
+    for doc, doc_pages in zip(docs, pages):
+        kept_pages = []
+        for lines, edges in doc_pages:
+            kept = []
+            for i, line in enumerate(lines):
+                key = normalize(line) if i in edges else None
+                if key in repeated:
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                kept.append(line)
+            kept_pages.append("\n".join(kept))
+        stripped.append(Document(page_content="\f".join(kept_pages), metadata=dict(doc.metadata)))
+    return stripped
+
+
+class NearDuplicateFilter:
+    """
+    Streams chunks through MinHash + LSH and reports whether each one nearly
+    duplicates a chunk seen earlier in the same run.
+
+    Each chunk becomes a set of word shingles (lower-cased, digits collapsed, so
+    "Page 3 of 40" and "Page 4 of 40" match). A MinHash signature of num_perm
+    values estimates Jaccard similarity between sets. Signatures are cut into
+    bands; chunks sharing any band are candidates, and a candidate is a
+    duplicate when its estimated similarity reaches the threshold.
+    """
+
+    _PRIME = 4294967311  # Smallest prime above 2**32; keeps a * x + b within uint64.
+
+    # numpy is imported by the methods: app.py imports this module for
+    # DEFAULT_CHUNKING on the login page, which should not load numpy.
+
+    def __init__(self, threshold: float = 0.9, num_perm: int = 64, bands: int = 16, shingle_size: int = 5,
+                 seed: int = 1):
+        import numpy as np
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 2**32 - 1, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 2**32 - 1, size=num_perm, dtype=np.uint64)
+        self._prime = np.uint64(self._PRIME)
+        self._buckets = [{} for _ in range(bands)]
+        self._signatures = []
+        self.seen = 0
+        self.dropped = 0
+
+    def _shingles(self, text: str) -> "np.ndarray":
+        import numpy as np
+        words = _DIGITS_RE.sub("0", text.lower()).split()
+        size = min(self.shingle_size, len(words)) or 1
+        shingles = {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+        return np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+
+    def signature(self, text: str) -> "np.ndarray":
+        hashes = self._shingles(text)
+        return ((self._a[:, None] * hashes[None, :] + self._b[:, None]) % self._prime).min(axis=1)
+
+    def is_duplicate(self, text: str) -> bool:
+        """Returns True if text nearly duplicates an earlier chunk; otherwise remembers it and returns False."""
+        self.seen += 1
+        signature = self.signature(text)
+        band_keys = [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+        candidates = set()
+        for band, key in zip(self._buckets, band_keys):
+            candidates.update(band.get(key, ()))
+        for candidate in candidates:
+            if (self._signatures[candidate] == signature).mean() >= self.threshold:
+                self.dropped += 1
+                return True
+
+        position = len(self._signatures)
+        self._signatures.append(signature)
+        for band, key in zip(self._buckets, band_keys):
+            band.setdefault(key, []).append(position)
+        return False
@@ -0,0 +1,229 @@
+# ingest_jobs.py
+
+import os
+import time
+import shutil
+import logging
+import tempfile
+import threading
+from botocore.exceptions import ClientError
+import s3_utils
+import catalog
+import chunking
+
+logger = logging.getLogger(__name__)
+
+# Knowledge bases are built by background jobs on the "ingest" queue (see
+# jobs.py) instead of on the Streamlit script thread. A page refresh or a
+# dropped websocket no longer loses the work, the browser session is not
+# blocked, and a burst of uploads queues up instead of competing with chat.
+#
+# Progress is checkpointed to <username>/<kb_name>/_ingest_checkpoint.json after
+# every finished file and every few seconds while a file's batches are being
+# stored (see rag_core.ingest_documents), and re-saved by a heartbeat timer
+# while the job runs, even when a long extraction reports no progress:
+#
+#   {"version": 1, "job_id": "ingest:alice/biology", "display_name": "Biology",
+#    "backend": "pinecone", "chunking": {...}, "files": [{"name", "sha256", "size"}],
+#    "manifest": {...finished files...}, "partial": {"ch2.pdf": [chunk IDs stored so far]},
+#    "updated_at": 1700000000.0, "failed": true (only once the job has failed)}
+#
+# While a job runs, the KB is listed under "ingests" in the user's catalog. If
+# the server restarts mid-job, the dashboard finds that entry with a checkpoint
+# that is no longer being updated and offers to resume it: finished files are
+# skipped, stored batches are not embedded again, and the remaining files are
+# read back from the originals in the KB's S3 folder.
+#
+# Like every job function, nothing here calls Streamlit. rag_core is imported
+# by the functions that need it, so the dashboard can look up checkpoints
+# without loading the ingestion stack (see warmup.py).
+
+CHECKPOINT_VERSION = 1
+HEARTBEAT_SECONDS = 30
+STALE_SECONDS = 120
+
+
+def job_id(username: str, kb_name: str) -> str:
+    return f"ingest:{username}/{kb_name}"
+
+
+def checkpoint_key(username: str, kb_name: str) -> str:
+    return f"{username}/{kb_name}/_ingest_checkpoint.json"
+
+
+def load_checkpoint(bucket_name: str, username: str, kb_name: str):
+    """Returns a KB's ingestion checkpoint, or None if it has none."""
+    data = s3_utils.load_json_from_s3(bucket_name, checkpoint_key(username, kb_name))
+    return data if data and data.get("version") == CHECKPOINT_VERSION else None
+
+
+def is_interrupted(checkpoint: dict) -> bool:
+    """True when the checkpoint's job failed, or stopped updating it (e.g. because the server restarted)."""
+    return checkpoint.get("failed", False) or time.time() - checkpoint.get("updated_at", 0) > STALE_SECONDS
+
+
+class _Checkpointer:
+    """Writes a job's checkpoint, and re-writes it from a heartbeat timer thread while the job runs."""
+
+    def __init__(self, bucket_name: str, key: str, header: dict, state: dict):
+        self.bucket_name = bucket_name
+        self.key = key
+        self.header = header
+        self.state = state
+        self.saved_at = 0.0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._heartbeat = None
+
+    def save(self, state: dict = None):
+        with self._lock:
+            if state is not None:
+                self.state = state
+            self.saved_at = time.monotonic()
+            s3_utils.save_json_to_s3({**self.header, **self.state, "updated_at": time.time()},
+                                     self.bucket_name, self.key)
+
+    def start_heartbeat(self):
+        self._heartbeat = threading.Thread(target=self._beat, name="ingest-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+    def _beat(self):
+        while not self._stopped.wait(HEARTBEAT_SECONDS):
+            if time.monotonic() - self.saved_at >= HEARTBEAT_SECONDS:
+                try:
+                    self.save()
+                except Exception:
+                    logger.warning("Heartbeat of %s failed", self.key, exc_info=True)
+
+    def stop_heartbeat(self):
+        """Stops the timer, waiting for a save in progress, so nothing re-creates the checkpoint afterwards."""
+        self._stopped.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+
+
+def run(job, bucket_name: str, username: str, kb_name: str, display_name: str, items: list, backend: str,
+        manifest: dict = None, chunking_options: dict = None, checkpoint: dict = None, persistent: bool = True,
+        uploader: s3_utils.BackgroundUploader = None, release=None) -> dict:
+    """
+    Background job: ingests upload items into a KB and saves its manifest.
+
+    With a manifest, documents are added to an existing KB; without, a new KB
+    is created. A `checkpoint` from an interrupted job resumes it. Persistent
+    jobs (registered users) are checkpointed and recorded in the catalog; guest
+    jobs are not. `uploader` is the BackgroundUploader sending the originals to
+    S3, waited for before the job ends, and `release(items)` frees the spooled
+    files afterwards. Cancelling the job keeps the files finished so far.
+
+    Returns {"manifest", "report", "errors", "upload_errors", "catalog_updated"}.
+    """
+    import rag_core
+    namespace = f"{username}-{kb_name}"
+    is_new = manifest is None
+    errors = list(job.snapshot()["progress"].get("errors", []))
+    header = {
+        "version": CHECKPOINT_VERSION, "job_id": job.id, "display_name": display_name, "backend": backend,
+        "new_kb": is_new if checkpoint is None else checkpoint.get("new_kb", is_new),
+        "chunking": chunking.chunking_settings(chunking_options or (manifest or {}).get("chunking")),
+        "files": [{"name": i["name"], "sha256": rag_core.upload_sha256(i), "size": rag_core.upload_size(i)}
+                  for i in items],
+    }
+    checkpointer = None
+    if persistent:
+        checkpointer = _Checkpointer(bucket_name, checkpoint_key(username, kb_name), header, {
+            "manifest": manifest or rag_core.new_manifest(), "partial": (checkpoint or {}).get("partial", {}),
+        })
+        checkpointer.save()
+        catalog.add_ingest(bucket_name, username, kb_name, display_name)
+
+    def on_progress(stage, done, total):
+        job.update(**{stage: [done, total]})
+
+    def on_error(message):
+        errors.append(message)
+        job.update(errors=list(errors))
+
+    if checkpointer is not None:
+        checkpointer.start_heartbeat()
+    try:
+        manifest, report = rag_core.ingest_documents(
+            items, namespace, manifest, backend, header["chunking"],
+            on_progress=on_progress, on_error=on_error,
+            on_checkpoint=checkpointer.save if checkpointer else None,
+            should_stop=lambda: job.cancelled, checkpoint=checkpoint,
+        )
+    except Exception:
+        if checkpointer is not None:
+            checkpointer.header["failed"] = True
+            checkpointer.save()
+        raise
+    finally:
+        if checkpointer is not None:
+            checkpointer.stop_heartbeat()
+        try:
+            upload_errors = {os.path.basename(k): e for k, e in (uploader.results() if uploader else {}).items() if e}
+        finally:
+            if release:
+                release(items)
+
+    catalog_updated = True
+    if manifest["files"] or not header["new_kb"]:
+        s3_utils.save_json_to_s3(manifest, bucket_name, f"{username}/{kb_name}/source_documents.json")
+        if persistent:
+            catalog_updated = catalog.upsert_kb(bucket_name, username, kb_name, manifest, display_name)
+    elif report["cancelled"]:
+        # A new KB cancelled before any file was finished: drop the originals uploaded so far.
+        s3_utils.delete_prefix(bucket_name, f"{username}/{kb_name}/")
+    if persistent:
+        s3_utils.delete_file_from_s3(bucket_name, checkpoint_key(username, kb_name))
+        catalog.remove_ingest(bucket_name, username, kb_name)
+    return {"manifest": manifest, "report": report, "errors": errors, "upload_errors": upload_errors,
+            "catalog_updated": catalog_updated}
+
+
+def resume(job, bucket_name: str, username: str, kb_name: str, checkpoint: dict) -> dict:
+    """
+    Background job: finishes an interrupted ingestion from its checkpoint.
+
+    The originals of unfinished files are downloaded from the KB's S3 folder;
+    files whose original never made it to S3 are reported as errors and left out.
+    """
+    finished = checkpoint["manifest"]["files"]
+    work_dir = tempfile.mkdtemp(prefix="chatmydocs-resume-")
+    items = []
+    try:
+        for entry in checkpoint["files"]:
+            item = dict(entry)
+            if finished.get(entry["name"], {}).get("sha256") != entry["sha256"]:
+                item["path"] = os.path.join(work_dir, f"{len(items)}{os.path.splitext(entry['name'])[1].lower()}")
+                try:
+                    s3_utils.download_file_from_s3(bucket_name, f"{username}/{kb_name}/{entry['name']}", item["path"])
+                except ClientError as e:
+                    logger.warning("Cannot resume %s of %s/%s: %s", entry["name"], username, kb_name, e)
+                    job.update(errors=job.snapshot()["progress"].get("errors", []) +
+                               [f"'{entry['name']}' could not be read back from S3 and was skipped."])
+                    continue
+            items.append(item)
+        return run(job, bucket_name, username, kb_name, checkpoint["display_name"], items, checkpoint["backend"],
+                   manifest=checkpoint["manifest"], chunking_options=checkpoint["chunking"], checkpoint=checkpoint)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def abandon(bucket_name: str, username: str, kb_name: str, checkpoint: dict):
+    """
+    Ends an interrupted ingestion without resuming it, keeping the files it had finished.
+
+    Vectors of unfinished files are removed. A new KB without any finished
+    file is removed altogether.
+    """
+    import rag_core
+    rag_core.discard_checkpoint(checkpoint, f"{username}-{kb_name}", checkpoint["backend"])
+    manifest = checkpoint["manifest"]
+    if manifest["files"] or not checkpoint.get("new_kb", True):
+        s3_utils.save_json_to_s3(manifest, bucket_name, f"{username}/{kb_name}/source_documents.json")
+        catalog.upsert_kb(bucket_name, username, kb_name, manifest, checkpoint["display_name"])
+        s3_utils.delete_file_from_s3(bucket_name, checkpoint_key(username, kb_name))
+    else:
+        s3_utils.delete_prefix(bucket_name, f"{username}/{kb_name}/")
+    catalog.remove_ingest(bucket_name, username, kb_name)
@@ -0,0 +1,151 @@
+# jobs.py
+
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Long-running work (deleting a large knowledge base, ingesting documents) runs
+# on a small process-wide thread pool instead of the Streamlit script thread, so
+# the page stays responsive. Jobs outlive the rerun that started them; the UI
+# looks them up by id on later reruns and polls their status and progress.
+#
+# Kinds listed in QUEUE_WORKERS get a queue of their own with that many workers,
+# so a burst of one kind of work (e.g. many uploads being ingested at once)
+# waits in line instead of taking every worker; other kinds share the default
+# queue of MAX_WORKERS.
+#
+# Job functions must not call Streamlit: they run outside any script context.
+
+MAX_WORKERS = 4
+QUEUE_WORKERS = {"ingest": 2}
+RETENTION_SECONDS = 3600
+
+PENDING, RUNNING, SUCCEEDED, FAILED, CANCELLED = "pending", "running", "succeeded", "failed", "cancelled"
+
+_executors = {}
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+class Job:
+    """A unit of background work with status, progress and a cooperative cancel flag."""
+
+    def __init__(self, job_id: str, kind: str):
+        self.id = job_id
+        self.kind = kind
+        self.status = PENDING
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def update(self, **progress):
+        """Merges new progress values; called from the job's own thread."""
+        with self._lock:
+            self.progress.update(progress)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "progress": dict(self.progress),
+                "result": self.result,
+                "error": self.error,
+            }
+
+    def cancel(self):
+        """Asks the job to stop; the job function decides where it is safe to do so."""
+        self._cancel.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    @property
+    def done(self) -> bool:
+        return self.status in (SUCCEEDED, FAILED, CANCELLED)
+
+    def _run(self, fn, args, kwargs):
+        self.status = RUNNING
+        try:
+            result = fn(self, *args, **kwargs)
+            with self._lock:
+                self.result = result
+                self.status = CANCELLED if self.cancelled else SUCCEEDED
+        except Exception as e:
+            logger.exception("Background job %s (%s) failed", self.id, self.kind)
+            with self._lock:
+                self.error = str(e)
+                self.status = FAILED
+        finally:
+            self.finished_at = time.time()
+
+
+def configure(queue_workers: dict):
+    """Sets the worker count of dedicated queues; takes effect for queues not yet in use."""
+    with _jobs_lock:
+        QUEUE_WORKERS.update({kind: max(1, int(n)) for kind, n in queue_workers.items()})
+
+
+def _executor_for(kind: str) -> ThreadPoolExecutor:
+    queue = kind if kind in QUEUE_WORKERS else None
+    if queue not in _executors:
+        _executors[queue] = ThreadPoolExecutor(
+            max_workers=QUEUE_WORKERS.get(queue, MAX_WORKERS), thread_name_prefix=f"chatmydocs-{queue or 'job'}"
+        )
+    return _executors[queue]
+
+
+def _prune():
+    cutoff = time.time() - RETENTION_SECONDS
+    for job_id in [j.id for j in _jobs.values() if j.done and j.finished_at < cutoff]:
+        del _jobs[job_id]
+
+
+def submit(kind: str, fn, *args, job_id: str = None, **kwargs) -> Job:
+    """
+    Runs fn(job, *args, **kwargs) in the background and returns its Job.
+
+    Submitting with the id of a job that is still running returns that job
+    instead of starting a second one, so double clicks are harmless.
+    """
+    job_id = job_id or uuid.uuid4().hex
+    with _jobs_lock:
+        _prune()
+        existing = _jobs.get(job_id)
+        if existing is not None and not existing.done:
+            return existing
+        job = Job(job_id, kind)
+        _jobs[job_id] = job
+        executor = _executor_for(kind)
+    executor.submit(job._run, fn, args, kwargs)
+    return job
+
+
+def get_job(job_id: str):
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def queue_position(job: Job) -> int:
+    """Returns how many jobs of the same kind were submitted earlier and have not started yet."""
+    with _jobs_lock:
+        return sum(1 for j in _jobs.values()
+                   if j.kind == job.kind and j.status == PENDING and j.created_at < job.created_at)
+
+
+def forget(job_id: str):
+    """Drops a finished job once its outcome has been shown."""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is not None and job.done:
+            del _jobs[job_id]
@@ -0,0 +1,470 @@
+# local_index.py
+
+import os
+import json
+import time
+import shutil
+import threading
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from retrieval import mmr_select
+
+try:
+    import fcntl
+except ImportError:  # Windows: cross-process write locking is unavailable, threads are still serialized.
+    fcntl = None
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+# An in-process vector index that mirrors the small part of the Pinecone Index
+# API rag_core relies on (upsert / query / delete with namespaces), so the
+# ingestion and deletion code paths work unchanged against either backend.
+#
+# Each namespace is a directory of immutable segments. Every upsert appends one
+# segment (a float32 .npy matrix plus a JSON file of IDs and metadata) and then
+# atomically replaces manifest.json. Segments are opened with mmap, so loading
+# is near-instant and the OS page cache shares them between processes.
+# Overwritten or deleted rows are tombstoned and reclaimed by compaction.
+#
+# A process keeps its loaded view of a namespace and advances it in memory
+# after each of its own writes, sharing the unchanged segments; only a write by
+# another process makes it reload the directory. The manifest records each
+# segment's row count, so whether to compact is decided without reading them.
+
+COMPACT_DEAD_RATIO = 0.25
+DEFAULT_ANN_THRESHOLD = 20000
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _matches_filter(metadata: dict, flt: dict) -> bool:
+    """Evaluates the {"field": value} / {"field": {"$eq"|"$in": ...}} subset of Pinecone filters."""
+    for field, condition in flt.items():
+        value = metadata.get(field)
+        if isinstance(condition, dict):
+            if "$eq" in condition and value != condition["$eq"]:
+                return False
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+class _Segment:
+    def __init__(self, vectors, ids, metadatas):
+        self.vectors = vectors
+        self.ids = ids
+        self.metadatas = metadatas
+        self.alive = np.ones(len(ids), dtype=bool)
+
+    def with_dead(self, rows) -> "_Segment":
+        """Returns a copy sharing the rows, with the given rows marked dead."""
+        segment = _Segment(self.vectors, self.ids, self.metadatas)
+        segment.alive = self.alive.copy()
+        segment.alive[list(rows)] = False
+        return segment
+
+
+class _Namespace:
+    """The loaded, read-only view of one namespace directory at a given manifest generation."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.manifest = self._read_manifest()
+        self.segments = {}
+        self.locations = {}
+        for name in self.manifest["segments"]:
+            vectors = np.load(os.path.join(directory, f"seg-{name}.npy"), mmap_mode="r")
+            with open(os.path.join(directory, f"seg-{name}.json"), encoding="utf-8") as f:
+                rows = json.load(f)
+            segment = _Segment(vectors, rows["ids"], rows["metadatas"])
+            for row in self.manifest["deleted"].get(name, []):
+                segment.alive[row] = False
+            for row, id_ in enumerate(segment.ids):
+                if segment.alive[row]:
+                    self.locations[id_] = (name, row)
+            self.segments[name] = segment
+        # Manifests written before row counts were recorded get them from the loaded segments.
+        self.manifest.setdefault("rows", {name: len(seg.ids) for name, seg in self.segments.items()})
+        self._ann = None
+
+    def advanced(self, manifest: dict, added: dict = None) -> "_Namespace":
+        """
+        Returns the view at a manifest this process committed on top of this
+        one, given the segments it added. Unchanged segments are shared, so
+        readers of this view are not disturbed.
+        """
+        added = added or {}
+        view = _Namespace.__new__(_Namespace)
+        view.directory = self.directory
+        view.manifest = manifest
+        view.segments = {}
+        view.locations = dict(self.locations)
+        view._ann = None
+        for name in manifest["segments"]:
+            if name in added:
+                continue
+            segment = self.segments[name]
+            newly_dead = manifest["deleted"].get(name, [])[len(self.manifest["deleted"].get(name, [])):]
+            if newly_dead:
+                segment = segment.with_dead(newly_dead)
+                for row in newly_dead:
+                    if view.locations.get(segment.ids[row]) == (name, row):
+                        del view.locations[segment.ids[row]]
+            view.segments[name] = segment
+        for name, segment in added.items():
+            view.segments[name] = segment
+            for row, id_ in enumerate(segment.ids):
+                view.locations[id_] = (name, row)
+        return view
+
+    def _read_manifest(self) -> dict:
+        try:
+            with open(os.path.join(self.directory, "manifest.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"generation": 0, "next_segment": 1, "segments": [], "rows": {}, "deleted": {}, "dimension": None}
+
+    @property
+    def generation(self) -> int:
+        return self.manifest["generation"]
+
+    def __len__(self):
+        return len(self.locations)
+
+    def _ann_index(self, threshold: int):
+        """Returns an HNSW graph over the live rows, or None when the flat scan should be used."""
+        if hnswlib is None or len(self) < threshold:
+            return None
+        if self._ann is not None:
+            return self._ann
+
+        labels = list(self.locations.items())
+        path = os.path.join(self.directory, f"ann-{self.generation}.bin")
+        index = hnswlib.Index(space="ip", dim=self.manifest["dimension"])
+        if os.path.exists(path):
+            index.load_index(path, max_elements=len(labels))
+        else:
+            index.init_index(max_elements=len(labels), ef_construction=200, M=16)
+            index.add_items(
+                np.vstack([self.segments[seg].vectors[row] for _, (seg, row) in labels]),
+                np.arange(len(labels)),
+            )
+            index.save_index(path)
+            for name in os.listdir(self.directory):
+                if name.startswith("ann-") and name != os.path.basename(path):
+                    try:
+                        os.remove(os.path.join(self.directory, name))
+                    except OSError:
+                        pass
+        index.set_ef(128)
+        self._ann = (index, [loc for _, loc in labels])
+        return self._ann
+
+    def search(self, query: np.ndarray, top_k: int, flt: dict = None, ann_threshold: int = DEFAULT_ANN_THRESHOLD):
+        """Returns up to top_k (score, segment_name, row) tuples, best first, by cosine similarity."""
+        ann = None if flt else self._ann_index(ann_threshold)
+        if ann is not None:
+            index, locations = ann
+            labels, distances = index.knn_query(query, k=min(top_k, len(locations)))
+            # hnswlib reports inner-product distance as 1 - similarity.
+            return [(1.0 - float(d), *locations[label]) for label, d in zip(labels[0], distances[0])]
+
+        candidates = []
+        for name, segment in self.segments.items():
+            mask = segment.alive
+            if flt:
+                mask = mask & np.array([_matches_filter(m, flt) for m in segment.metadatas], dtype=bool)
+            if not mask.any():
+                continue
+            scores = np.asarray(segment.vectors) @ query
+            scores = np.where(mask, scores, -np.inf)
+            k = min(top_k, int(mask.sum()))
+            top = np.argpartition(-scores, k - 1)[:k]
+            candidates.extend((float(scores[row]), name, int(row)) for row in top)
+        candidates.sort(key=lambda c: -c[0])
+        return candidates[:top_k]
+
+
+class LocalIndex:
+    """A Pinecone-Index-compatible vector index stored as memory-mapped files under a root directory."""
+
+    def __init__(self, root: str, ann_threshold: int = DEFAULT_ANN_THRESHOLD):
+        self.root = root
+        self.ann_threshold = ann_threshold
+        self._lock = threading.RLock()
+        self._loaded = {}
+        os.makedirs(root, exist_ok=True)
+
+    def _dir(self, namespace: str) -> str:
+        return os.path.join(self.root, namespace or "_default")
+
+    def _namespace(self, namespace: str) -> _Namespace:
+        """Returns the loaded namespace, reloading it if another process has written to it since."""
+        directory = self._dir(namespace)
+        stamp = self._stamp(directory)
+        with self._lock:
+            loaded = self._loaded.get(namespace)
+            if loaded is None or loaded[0] != stamp:
+                loaded = (stamp, _Namespace(directory))
+                self._loaded[namespace] = loaded
+            return loaded[1]
+
+    def _stamp(self, directory: str):
+        try:
+            stat = os.stat(os.path.join(directory, "manifest.json"))
+            return stat.st_mtime_ns, stat.st_ino
+        except FileNotFoundError:
+            return None
+
+    def _publish(self, namespace: str, view: _Namespace) -> _Namespace:
+        """Makes a view this process just committed the loaded one. Caller holds the write lock."""
+        with self._lock:
+            self._loaded[namespace] = (self._stamp(view.directory), view)
+        return view
+
+    def _write_lock(self, namespace: str):
+        return _DirectoryLock(self._dir(namespace), self._lock)
+
+    def _write_segment(self, directory: str, name: str, matrix: np.ndarray, ids: list, metadatas: list) -> _Segment:
+        path = os.path.join(directory, f"seg-{name}.npy")
+        np.save(path, matrix)
+        with open(os.path.join(directory, f"seg-{name}.json"), "w", encoding="utf-8") as f:
+            json.dump({"ids": ids, "metadatas": metadatas}, f)
+        return _Segment(np.load(path, mmap_mode="r"), ids, metadatas)
+
+    def _commit(self, directory: str, manifest: dict):
+        manifest["generation"] += 1
+        manifest["updated_at"] = time.time()
+        tmp_path = os.path.join(directory, "manifest.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, os.path.join(directory, "manifest.json"))
+
+    def upsert(self, vectors, namespace: str = None, **kwargs):
+        """Adds or overwrites vectors given as {"id", "values", "metadata"} dicts or (id, values, metadata) tuples."""
+        if not vectors:
+            return {"upserted_count": 0}
+        records = [v if isinstance(v, dict) else dict(zip(("id", "values", "metadata"), v)) for v in vectors]
+        # An ID repeated within the batch keeps its last values, as if upserted one after another.
+        records = list({r["id"]: r for r in records}.values())
+        ids = [r["id"] for r in records]
+        matrix = _normalize(np.asarray([r["values"] for r in records], dtype=np.float32))
+
+        with self._write_lock(namespace):
+            current = self._namespace(namespace)
+            manifest = json.loads(json.dumps(current.manifest))
+            directory = current.directory
+            if manifest["dimension"] is None:
+                manifest["dimension"] = int(matrix.shape[1])
+            elif manifest["dimension"] != matrix.shape[1]:
+                raise ValueError(f"Vector dimension {matrix.shape[1]} does not match index dimension {manifest['dimension']}")
+
+            for id_ in ids:
+                if id_ in current.locations:
+                    seg, row = current.locations[id_]
+                    manifest["deleted"].setdefault(seg, []).append(row)
+
+            name = f"{manifest['next_segment']:08d}"
+            manifest["next_segment"] += 1
+            segment = self._write_segment(directory, name, matrix, ids, [r.get("metadata") or {} for r in records])
+            manifest["segments"].append(name)
+            manifest["rows"][name] = len(ids)
+            self._commit(directory, manifest)
+            current = self._publish(namespace, current.advanced(manifest, {name: segment}))
+            self._maybe_compact(namespace, current)
+        return {"upserted_count": len(ids)}
+
+    def delete(self, ids=None, delete_all: bool = False, namespace: str = None, filter: dict = None, **kwargs):
+        """Deletes vectors by ID, by metadata filter, or the whole namespace."""
+        if delete_all:
+            with self._lock:
+                shutil.rmtree(self._dir(namespace), ignore_errors=True)
+                self._loaded.pop(namespace, None)
+            return {}
+
+        with self._write_lock(namespace):
+            current = self._namespace(namespace)
+            manifest = json.loads(json.dumps(current.manifest))
+            if filter:
+                doomed = [
+                    (name, row)
+                    for name, segment in current.segments.items()
+                    for row, metadata in enumerate(segment.metadatas)
+                    if segment.alive[row] and _matches_filter(metadata, filter)
+                ]
+            else:
+                doomed = [current.locations[i] for i in ids or [] if i in current.locations]
+            if not doomed:
+                return {}
+            for seg, row in doomed:
+                manifest["deleted"].setdefault(seg, []).append(row)
+            self._commit(current.directory, manifest)
+            current = self._publish(namespace, current.advanced(manifest))
+            self._maybe_compact(namespace, current)
+        return {}
+
+    def query(self, vector, top_k: int = 10, namespace: str = None, filter: dict = None,
+              include_values: bool = False, include_metadata: bool = False, **kwargs):
+        """Returns {"matches": [{"id", "score", "values"?, "metadata"?}]} like Pinecone's query."""
+        current = self._namespace(namespace)
+        if not len(current):
+            return {"matches": []}
+        query = _normalize(np.asarray([vector], dtype=np.float32))[0]
+        matches = []
+        for score, seg, row in current.search(query, top_k, filter, self.ann_threshold):
+            segment = current.segments[seg]
+            match = {"id": segment.ids[row], "score": score}
+            if include_values:
+                match["values"] = np.asarray(segment.vectors[row]).tolist()
+            if include_metadata:
+                match["metadata"] = segment.metadatas[row]
+            matches.append(match)
+        return {"matches": matches}
+
+    def describe_namespace(self, namespace: str) -> dict:
+        current = self._namespace(namespace)
+        return {"vector_count": len(current), "dimension": current.manifest["dimension"]}
+
+    def _maybe_compact(self, namespace: str, current: _Namespace):
+        """Rewrites a namespace into a single segment once too many rows are dead. Caller holds the write lock."""
+        total = sum(current.manifest["rows"].values())
+        dead = sum(len(rows) for rows in current.manifest["deleted"].values())
+        if total == 0 or dead / total < COMPACT_DEAD_RATIO:
+            return
+
+        manifest = json.loads(json.dumps(current.manifest))
+        locations = list(current.locations.items())
+        name = f"{manifest['next_segment']:08d}"
+        manifest["next_segment"] += 1
+        added = {}
+        if locations:
+            matrix = np.vstack([current.segments[seg].vectors[row] for _, (seg, row) in locations])
+            added[name] = self._write_segment(
+                current.directory, name, matrix, [id_ for id_, _ in locations],
+                [current.segments[seg].metadatas[row] for _, (seg, row) in locations],
+            )
+        old_segments = manifest["segments"]
+        manifest["segments"] = list(added)
+        manifest["rows"] = {name: len(locations)} if locations else {}
+        manifest["deleted"] = {}
+        self._commit(current.directory, manifest)
+        self._publish(namespace, current.advanced(manifest, added))
+
+        # Readers in other processes may still have the old segments mapped; on POSIX
+        # unlinking is safe for them, elsewhere the files are left for the next compaction.
+        for old in old_segments:
+            for suffix in (".npy", ".json"):
+                try:
+                    os.remove(os.path.join(current.directory, f"seg-{old}{suffix}"))
+                except OSError:
+                    pass
+
+
+class _DirectoryLock:
+    """Serializes writers to one namespace directory across threads and, where supported, processes."""
+
+    def __init__(self, directory: str, thread_lock):
+        self.directory = directory
+        self.thread_lock = thread_lock
+        self._file = None
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        os.makedirs(self.directory, exist_ok=True)
+        if fcntl is not None:
+            self._file = open(os.path.join(self.directory, ".lock"), "w")
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+        self.thread_lock.release()
+
+
+class LocalVectorStore(VectorStore):
+    """A LangChain VectorStore over one namespace of a LocalIndex."""
+
+    def __init__(self, index: LocalIndex, embedding, namespace: str, text_key: str = "text"):
+        self._index = index
+        self._embedding = embedding
+        self._namespace = namespace
+        self._text_key = text_key
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [os.urandom(16).hex() for _ in texts]
+        vectors = self._embedding.embed_documents(texts)
+        self._index.upsert(
+            vectors=[
+                {"id": i, "values": v, "metadata": {**m, self._text_key: t}}
+                for i, v, m, t in zip(ids, vectors, metadatas, texts)
+            ],
+            namespace=self._namespace,
+        )
+        return ids
+
+    def delete(self, ids=None, **kwargs):
+        self._index.delete(ids=ids, namespace=self._namespace)
+        return True
+
+    def _to_document(self, match) -> Document:
+        metadata = dict(match.get("metadata") or {})
+        text = metadata.pop(self._text_key, "")
+        return Document(page_content=text, metadata=metadata)
+
+    def similarity_search_by_vector_with_score(self, embedding, k: int = 4, filter: dict = None):
+        response = self._index.query(
+            vector=embedding, top_k=k, namespace=self._namespace, filter=filter, include_metadata=True
+        )
+        return [(self._to_document(m), m["score"]) for m in response["matches"]]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: dict = None, **kwargs):
+        return self.similarity_search_by_vector_with_score(self._embedding.embed_query(query), k, filter)
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict = None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def _select_relevance_score_fn(self):
+        return lambda score: (score + 1.0) / 2.0
+
+    def max_marginal_relevance_search_by_vector(self, embedding, k: int = 4, fetch_k: int = 20,
+                                                lambda_mult: float = 0.5, filter: dict = None, **kwargs):
+        response = self._index.query(
+            vector=embedding, top_k=fetch_k, namespace=self._namespace, filter=filter,
+            include_values=True, include_metadata=True,
+        )
+        matches = response["matches"]
+        if not matches:
+            return []
+        selected = mmr_select(embedding, [m["values"] for m in matches], k=k, lambda_mult=lambda_mult)
+        return [self._to_document(matches[i]) for i in selected]
+
+    def max_marginal_relevance_search(self, query: str, k: int = 4, fetch_k: int = 20,
+                                      lambda_mult: float = 0.5, filter: dict = None, **kwargs):
+        return self.max_marginal_relevance_search_by_vector(
+            self._embedding.embed_query(query), k, fetch_k, lambda_mult, filter
+        )
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, index: LocalIndex = None, namespace: str = None,
+                   ids=None, **kwargs):
+        store = cls(index, embedding, namespace)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
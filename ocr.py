@@ -0,0 +1,155 @@
+# ocr.py
+
+import os
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.documents import Document
+from caching import DiskLRUCache, content_key
+
+# OCR for images and scanned PDFs. Everything here runs inside extraction
+# worker processes, so it must not touch Streamlit; settings arrive as a plain,
+# picklable dict (see rag_core.ocr_settings):
+#
+#   {"max_side": 2400, "max_dpi": 300, "lang": "eng", "threads": 2,
+#    "cache_dir": "/tmp/chatmydocs/ocr", "cache_max_bytes": 268435456}
+#
+# Before Tesseract sees an image it is rotated upright from its EXIF tag,
+# converted to grayscale, contrast-stretched, and scaled down so that neither
+# its longest side nor its resolution exceeds the caps. Phone photos are often
+# 12+ megapixels at 72 "DPI" metadata, far more than Tesseract needs for text.
+# Results are cached on disk by the image's content hash and those settings.
+
+OCR_VERSION = 1
+SCANNED_PAGE_MIN_CHARS = 25
+SCANNED_PAGES_SAMPLE = 10
+
+DEFAULT_SETTINGS = {
+    "max_side": 2400,
+    "max_dpi": 300,
+    "lang": "eng",
+    "threads": 2,
+    "cache_dir": None,
+    "cache_max_bytes": 256 * 1024 * 1024,
+}
+
+# Tesseract's own OpenMP threading oversubscribes the CPU when several pages
+# or files are recognized at once; parallelism comes from the callers instead.
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def _cache(settings: dict):
+    directory = settings.get("cache_dir")
+    if not directory:
+        return None
+    with _caches_lock:
+        if directory not in _caches:
+            _caches[directory] = DiskLRUCache(directory, settings["cache_max_bytes"])
+        return _caches[directory]
+
+
+def _cache_key(content_hash: str, settings: dict) -> str:
+    return content_key("ocr", str(OCR_VERSION), content_hash,
+                       str(settings["max_side"]), str(settings["max_dpi"]), settings["lang"])
+
+
+def prepare_image(image, settings: dict):
+    """Normalizes a PIL image for OCR: upright, grayscale, contrast-stretched, and within the size and DPI caps."""
+    from PIL import Image, ImageOps
+
+    image = ImageOps.exif_transpose(image)
+    image = ImageOps.autocontrast(image.convert("L"))
+
+    scale = 1.0
+    longest = max(image.size)
+    if longest > settings["max_side"]:
+        scale = settings["max_side"] / longest
+    dpi = image.info.get("dpi", (0, 0))[0]
+    if dpi and dpi > settings["max_dpi"]:
+        scale = min(scale, settings["max_dpi"] / dpi)
+    if scale < 1.0:
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image = image.resize(size, Image.LANCZOS)
+    return image
+
+
+def _recognize(load_image, content_hash: str, settings: dict) -> str:
+    """Returns the cached text for content_hash, or loads the image with load_image() and OCRs it."""
+    cache = _cache(settings)
+    key = _cache_key(content_hash, settings)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached.decode("utf-8")
+    import pytesseract
+    with load_image() as image:
+        text = pytesseract.image_to_string(prepare_image(image, settings), lang=settings["lang"])
+    if cache is not None:
+        cache.set(key, text.encode("utf-8"))
+    return text
+
+
+def ocr_image_file(path: str, file_name: str, settings: dict = None) -> list:
+    """OCRs a single image file into one Document."""
+    settings = {**DEFAULT_SETTINGS, **(settings or {})}
+    with open(path, "rb") as f:
+        content_hash = hashlib.sha256(f.read()).hexdigest()
+    from PIL import Image
+
+    text = _recognize(lambda: Image.open(path), content_hash, settings)
+    return [Document(page_content=text, metadata={"source": file_name})]
+
+
+def is_scanned_pdf(path: str) -> bool:
+    """
+    Guesses whether a PDF is made of page images rather than text.
+
+    Samples up to SCANNED_PAGES_SAMPLE pages; if most of them carry almost no
+    extractable text, the document needs OCR rather than text extraction.
+    Returns False when the PDF cannot be inspected, so it goes through the
+    regular loader as before.
+    """
+    try:
+        from pypdf import PdfReader
+        reader = PdfReader(path)
+        pages = reader.pages[:SCANNED_PAGES_SAMPLE]
+        if not pages:
+            return False
+        empty = sum(1 for page in pages if len((page.extract_text() or "").strip()) < SCANNED_PAGE_MIN_CHARS)
+        return empty / len(pages) >= 0.5
+    except Exception:
+        return False
+
+
+def ocr_pdf(path: str, file_name: str, settings: dict = None) -> list:
+    """
+    OCRs a scanned PDF page by page into one Document per page.
+
+    Pages are rendered at the DPI cap and recognized on a small thread pool;
+    Tesseract runs as a subprocess, so threads overlap well. Each page is cached
+    under the PDF's hash and its page number.
+    """
+    from pdf2image import convert_from_path, pdfinfo_from_path
+
+    settings = {**DEFAULT_SETTINGS, **(settings or {})}
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    pdf_hash = digest.hexdigest()
+    n_pages = pdfinfo_from_path(path)["Pages"]
+
+    def page_text(page_number):
+        render = lambda: convert_from_path(path, dpi=settings["max_dpi"], first_page=page_number,
+                                           last_page=page_number, grayscale=True)[0]
+        return _recognize(render, content_key(pdf_hash, str(page_number)), settings)
+
+    with ThreadPoolExecutor(max_workers=max(1, settings["threads"])) as pool:
+        texts = list(pool.map(page_text, range(1, n_pages + 1)))
+    return [
+        Document(page_content=text, metadata={"source": file_name, "page_number": number})
+        for number, text in enumerate(texts, start=1)
+    ]
@@ -1,94 +1,1250 @@
 import os
+import json
+import zlib
+import importlib.metadata
+import copy
+import time
+import random
+import logging
+import hashlib
+import queue
+import array
+import collections
+import threading
+import contextvars
+import multiprocessing
 import streamlit as st
-import boto3
 import tempfile
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from langchain_community.chat_models import BedrockChat
-from langchain_community.embeddings import BedrockEmbeddings
+from botocore.exceptions import ClientError, ConnectionError as BotocoreConnectionError, ReadTimeoutError
 from langchain_pinecone import PineconeVectorStore
 from langchain.chains import RetrievalQA
 from langchain_core.documents import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import UnstructuredFileLoader
-from PIL import Image
-import pytesseract
 from pinecone import Pinecone
+from pinecone.exceptions import NotFoundException
 from langchain.prompts import PromptTemplate
+from langchain_core.prompts import format_document
+from langchain_core.embeddings import Embeddings
+from caching import DiskLRUCache, S3BlobStore, TieredBlobCache, TTLCache, content_key
+import s3_utils
+import aws_clients
+import ocr
+import chunking
+import telemetry
+from chunk_store import ChunkTextStore
+from local_index import LocalIndex, LocalVectorStore, DEFAULT_ANN_THRESHOLD
+from retrieval import MMRRetriever
+from answer_cache import SemanticAnswerCache
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL_ID = "amazon.titan-embed-text-v1"
+LLM_MODEL_ID = "anthropic.claude-3-sonnet-20240229-v1:0"
+LLM_TEMPERATURE = 0.1
+
+def retriever_settings() -> dict:
+    """Returns the MMR retriever settings; fetch_k and lambda_mult are tunable via secrets."""
+    return {
+        "k": 5,
+        "fetch_k": int(st.secrets.get("MMR_FETCH_K", 50)),
+        "lambda_mult": float(st.secrets.get("MMR_LAMBDA", 0.5)),
+    }
 
 def get_bedrock_client():
-    """Initializes and returns a boto3 client for Bedrock Runtime."""
-    return boto3.client(
-        "bedrock-runtime",
-        aws_access_key_id=st.secrets["AWS_ACCESS_KEY_ID"],
-        aws_secret_access_key=st.secrets["AWS_SECRET_ACCESS_KEY"],
-        region_name=st.secrets["AWS_REGION"],
-    )
+    """Returns the shared, pooled boto3 client for Bedrock Runtime."""
+    return aws_clients.get_client("bedrock-runtime")
+
+THROTTLING_ERROR_CODES = {"ThrottlingException", "TooManyRequestsException", "ServiceQuotaExceededException"}
+RETRYABLE_ERROR_CODES = THROTTLING_ERROR_CODES | {
+    "ServiceUnavailableException", "ModelTimeoutException", "InternalServerException",
+}
+
+def _is_throttling(error: Exception) -> bool:
+    return isinstance(error, ClientError) and error.response.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, (BotocoreConnectionError, ReadTimeoutError)):
+        return True
+    return isinstance(error, ClientError) and error.response.get("Error", {}).get("Code") in RETRYABLE_ERROR_CODES
+
+class AdaptiveConcurrencyLimit:
+    """
+    Caps the number of requests in flight and adapts the cap with AIMD.
+
+    Every successful request raises the limit by 1/limit (about one more slot per
+    round of requests); a throttled request halves it. Throttles that arrive
+    within cooldown seconds of the last decrease belong to the same burst and do
+    not halve the limit again.
+    """
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = 16, cooldown: float = 1.0):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.cooldown = cooldown
+        self._limit = float(max(minimum, min(initial, maximum)))
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def acquire(self):
+        with self._cond:
+            while self._in_flight >= int(self._limit):
+                self._cond.wait()
+            self._in_flight += 1
+
+    def release(self, throttled: bool = False):
+        with self._cond:
+            self._in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                if now - self._last_decrease >= self.cooldown:
+                    self._limit = max(self.minimum, self._limit / 2)
+                    self._last_decrease = now
+            else:
+                self._limit = min(self.maximum, self._limit + 1 / self._limit)
+            self._cond.notify_all()
+
+class EmbeddingExecutor:
+    """
+    Runs single-text embedding requests concurrently and returns results in input order.
+
+    Parallelism is bounded by an AdaptiveConcurrencyLimit shared by every batch
+    in the process, since the Bedrock quota is per account, not per caller.
+    Retryable errors are retried up to max_attempts times with full-jitter
+    exponential backoff; throttling errors also shrink the concurrency limit.
+    """
+
+    def __init__(self, embed_one, max_concurrency: int = 16, initial_concurrency: int = 4,
+                 max_attempts: int = 8, base_delay: float = 0.1, max_delay: float = 10.0):
+        self.embed_one = embed_one
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.limit = AdaptiveConcurrencyLimit(initial_concurrency, maximum=max_concurrency)
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="embed")
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+        self.retries = 0
+
+    def _call(self, text: str):
+        for attempt in range(1, self.max_attempts + 1):
+            self.limit.acquire()
+            throttled = False
+            try:
+                return self.embed_one(text)
+            except Exception as e:
+                throttled = _is_throttling(e)
+                if not _is_retryable(e) or attempt == self.max_attempts:
+                    raise
+            finally:
+                self.limit.release(throttled)
+                with self._lock:
+                    self.requests += 1
+                    self.throttled += throttled
+            with self._lock:
+                self.retries += 1
+            time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+
+    def map(self, texts) -> list:
+        """Embeds every text, in parallel, and returns the vectors in the same order."""
+        texts = list(texts)
+        if len(texts) == 1:
+            return [self._call(texts[0])]
+        return list(self._pool.map(self._call, texts))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"requests": self.requests, "throttled": self.throttled, "retries": self.retries,
+                    "concurrency": self.limit.limit}
+
+class BedrockTitanEmbeddings(Embeddings):
+    """
+    Titan text embeddings through InvokeModel, one text per request, sent concurrently.
+
+    Titan embeds a single text per call, so a batch of chunks costs one round
+    trip per chunk; BedrockEmbeddings makes those calls one after another.
+    Requests go through a Bedrock client without botocore retries so that
+    throttling reaches the executor, which backs off and lowers concurrency.
+    """
+
+    def __init__(self, client, model_id: str, executor_options: dict = None):
+        self.client = client
+        self.model_id = model_id
+        self.executor = EmbeddingExecutor(self._embed_one, **(executor_options or {}))
+
+    def _embed_one(self, text: str) -> list:
+        response = self.client.invoke_model(
+            modelId=self.model_id,
+            body=json.dumps({"inputText": text.replace(os.linesep, " ")}),
+            accept="application/json",
+            contentType="application/json",
+        )
+        return json.loads(response["body"].read())["embedding"]
+
+    def embed_documents(self, texts):
+        return self.executor.map(texts)
+
+    def embed_query(self, text):
+        return self.executor.map([text])[0]
+
+def embedding_executor_options() -> dict:
+    """Returns the embedding concurrency settings; tunable via secrets."""
+    return {
+        "max_concurrency": int(st.secrets.get("EMBEDDING_MAX_CONCURRENCY", 16)),
+        "initial_concurrency": int(st.secrets.get("EMBEDDING_INITIAL_CONCURRENCY", 4)),
+        "max_attempts": int(st.secrets.get("EMBEDDING_MAX_ATTEMPTS", 8)),
+    }
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an Embeddings model with a content-addressed vector cache.
+
+    Vectors are keyed by a hash of (model_id, text), so identical chunks are
+    only ever sent to Bedrock once, regardless of which knowledge base they
+    belong to. Only the cache misses are forwarded to the underlying model.
+    """
+
+    def __init__(self, underlying: Embeddings, model_id: str, cache: TieredBlobCache):
+        self.underlying = underlying
+        self.model_id = model_id
+        self.cache = cache
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.remote_hits = 0
+        self.misses = 0
+
+    def _key(self, text: str) -> str:
+        return content_key(self.model_id, text)
+
+    def embed_documents(self, texts):
+        keys = [self._key(t) for t in texts]
+        found, remote_hits = self.cache.get_many(list(dict.fromkeys(keys)))
+        vectors = {k: array.array("f", data).tolist() for k, data in found.items()}
+
+        # Identical texts within one batch are embedded once.
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+
+        if missing:
+            new_vectors = self.underlying.embed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), new_vectors))
+            self.cache.set_many({k: array.array("f", v).tobytes() for k, v in fresh.items()})
+            vectors.update(fresh)
+
+        with self._lock:
+            self.misses += len(missing)
+            self.hits += len(texts) - len(missing)
+            self.remote_hits += remote_hits
+        return [vectors[k] for k in keys]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def stats(self) -> dict:
+        """Returns the hit/miss counters accumulated since the process started."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "remote_hits": self.remote_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "local_bytes": self.cache.local.size_bytes,
+            }
+
+_embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+
+def get_embedding_cache() -> TieredBlobCache:
+    """Returns the process-wide embedding cache, creating it on first use."""
+    global _embedding_cache
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            cache_dir = st.secrets.get(
+                "EMBEDDING_CACHE_DIR", os.path.join(tempfile.gettempdir(), "chatmydocs", "embeddings")
+            )
+            max_bytes = int(st.secrets.get("EMBEDDING_CACHE_MAX_MB", 512)) * 1024 * 1024
+            remote = None
+            s3_prefix = st.secrets.get("EMBEDDING_CACHE_S3_PREFIX")
+            if s3_prefix:
+                remote = S3BlobStore(s3_utils.get_s3_client, st.secrets["S3_BUCKET_NAME"], s3_prefix)
+            _embedding_cache = TieredBlobCache(DiskLRUCache(cache_dir, max_bytes), remote)
+        return _embedding_cache
+
+_cached_embeddings = None
 
 def _embeddings():
-    """Creates and returns BedrockEmbeddings using the Titan model."""
-    return BedrockEmbeddings(
-        client=get_bedrock_client(),
-        model_id="amazon.titan-embed-text-v1",
+    """Returns the process-wide, cache-backed, concurrent Titan embeddings."""
+    global _cached_embeddings
+    cache = get_embedding_cache()
+    options = embedding_executor_options()
+    with _embedding_cache_lock:
+        if _cached_embeddings is None:
+            bedrock = BedrockTitanEmbeddings(
+                aws_clients.get_client("bedrock-runtime", own_retries=True),
+                EMBEDDING_MODEL_ID,
+                options,
+            )
+            _cached_embeddings = CachedEmbeddings(bedrock, EMBEDDING_MODEL_ID, cache)
+        return _cached_embeddings
+
+def embedding_executor_stats() -> dict:
+    """Returns the embedding request, throttling and retry counters for this process."""
+    if _cached_embeddings is None:
+        return {"requests": 0, "throttled": 0, "retries": 0, "concurrency": 0}
+    return _cached_embeddings.underlying.executor.stats()
+
+telemetry.register_stats("embedding_executor", embedding_executor_stats,
+                         "Titan embedding requests, throttled requests, retries and current concurrency limit.")
+
+def embedding_cache_stats() -> dict:
+    """Returns the embedding cache hit/miss counters for this process."""
+    if _cached_embeddings is None:
+        return {"hits": 0, "remote_hits": 0, "misses": 0, "hit_rate": 0.0, "local_bytes": 0}
+    return _cached_embeddings.stats()
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg"}
+
+def ocr_settings() -> dict:
+    """Returns the OCR settings handed to extraction workers (see ocr.py)."""
+    return {
+        "max_side": int(st.secrets.get("OCR_MAX_SIDE", ocr.DEFAULT_SETTINGS["max_side"])),
+        "max_dpi": int(st.secrets.get("OCR_MAX_DPI", ocr.DEFAULT_SETTINGS["max_dpi"])),
+        "lang": st.secrets.get("OCR_LANG", ocr.DEFAULT_SETTINGS["lang"]),
+        "threads": int(st.secrets.get("OCR_THREADS", ocr.DEFAULT_SETTINGS["threads"])),
+        "cache_dir": st.secrets.get("OCR_CACHE_DIR", os.path.join(tempfile.gettempdir(), "chatmydocs", "ocr")),
+        "cache_max_bytes": int(float(st.secrets.get("OCR_CACHE_MAX_MB", 256)) * 1024 * 1024),
+    }
+
+def _extract_file(file_name: str, temp_path: str, ocr_options: dict = None):
+    """
+    Extracts Documents from a single file on disk.
+
+    Images, and PDFs that turn out to be scans, go through the OCR stage in
+    ocr.py; everything else through Unstructured. Runs inside extraction worker
+    processes, so it must not touch Streamlit. Returns a (docs, error_message)
+    tuple instead of raising.
+    """
+    with telemetry.span("ingest.extract", file=file_name, bytes=os.path.getsize(temp_path)) as span:
+        docs, error = _parse_file(file_name, temp_path, ocr_options, span)
+        span.set(documents=len(docs))
+        if error:
+            span.status = "error"
+        return docs, error
+
+def _parse_file(file_name: str, temp_path: str, ocr_options: dict, span: telemetry.Span):
+    ext = os.path.splitext(temp_path)[1].lower()
+    if ext in IMAGE_EXTENSIONS:
+        span.set(method="ocr")
+        try:
+            return ocr.ocr_image_file(temp_path, file_name, ocr_options), None
+        except Exception as e:
+            return [], f"OCR error on {file_name}: {e}"
+
+    loader_kwargs = {}
+    if ext == ".pdf" and ocr.is_scanned_pdf(temp_path):
+        span.set(method="ocr")
+        try:
+            return ocr.ocr_pdf(temp_path, file_name, ocr_options), None
+        except Exception:
+            # Page rendering is unavailable (e.g. no poppler); let Unstructured OCR the pages instead.
+            loader_kwargs["strategy"] = "ocr_only"
+    span.set(method=loader_kwargs.get("strategy", "unstructured"))
+    try:
+        # Only extraction workers load files, so the chat path never imports the loaders.
+        from langchain_community.document_loaders import UnstructuredFileLoader
+        loader = UnstructuredFileLoader(temp_path, **loader_kwargs)
+        loaded_docs = loader.load()
+        for doc in loaded_docs:
+            doc.metadata["source"] = file_name
+        return loaded_docs, None
+    except Exception as e:
+        return [], f"Failed to load {file_name}: {e}"
+
+def _extract_file_traced(file_name: str, temp_path: str, ocr_options: dict = None):
+    """Runs _extract_file in an extraction worker and also returns its spans, for telemetry.replay in the parent."""
+    with telemetry.capture() as spans:
+        docs, error = _extract_file(file_name, temp_path, ocr_options)
+    return docs, error, spans
+
+_extraction_pool = None
+_extraction_pool_lock = threading.Lock()
+
+def _get_extraction_pool() -> ProcessPoolExecutor:
+    """
+    Returns the process-wide extraction pool, sized once from EXTRACTION_WORKERS.
+
+    Workers are spawned rather than forked because the Streamlit server process
+    is multi-threaded. Keeping the pool alive amortizes the worker start-up cost.
+    Concurrent ingestions share the pool; each one bounds its own files in flight.
+    """
+    global _extraction_pool
+    with _extraction_pool_lock:
+        if _extraction_pool is None:
+            _extraction_pool = ProcessPoolExecutor(
+                max_workers=extraction_workers(), mp_context=multiprocessing.get_context("spawn")
+            )
+        return _extraction_pool
+
+def _discard_extraction_pool(pool: ProcessPoolExecutor):
+    """Drops a pool that raised BrokenProcessPool, so the next caller gets a new one."""
+    global _extraction_pool
+    with _extraction_pool_lock:
+        if _extraction_pool is pool:
+            _extraction_pool = None
+    pool.shutdown(wait=False)
+
+def extraction_workers() -> int:
+    """Returns the configured number of extraction worker processes."""
+    return max(1, int(st.secrets.get("EXTRACTION_WORKERS", os.cpu_count() or 1)))
+
+EXTRACTION_CACHE_VERSION = 1
+
+_extraction_cache = None
+_extraction_cache_stats = {"hits": 0, "misses": 0}
+_extraction_cache_lock = threading.Lock()
+
+def get_extraction_cache() -> TieredBlobCache:
+    """Returns the process-wide cache of extracted documents, creating it on first use."""
+    global _extraction_cache
+    with _extraction_cache_lock:
+        if _extraction_cache is None:
+            cache_dir = st.secrets.get(
+                "EXTRACTION_CACHE_DIR", os.path.join(tempfile.gettempdir(), "chatmydocs", "extracted")
+            )
+            max_bytes = int(st.secrets.get("EXTRACTION_CACHE_MAX_MB", 1024)) * 1024 * 1024
+            remote = None
+            s3_prefix = st.secrets.get("EXTRACTION_CACHE_S3_PREFIX")
+            if s3_prefix:
+                remote = S3BlobStore(s3_utils.get_s3_client, st.secrets["S3_BUCKET_NAME"], s3_prefix)
+            _extraction_cache = TieredBlobCache(DiskLRUCache(cache_dir, max_bytes), remote)
+        return _extraction_cache
+
+def extraction_cache_stats() -> dict:
+    with _extraction_cache_lock:
+        return dict(_extraction_cache_stats)
+
+def _loader_version() -> str:
+    try:
+        return importlib.metadata.version("unstructured")
+    except importlib.metadata.PackageNotFoundError:
+        return "unknown"
+
+LOADER_VERSION = _loader_version()
+
+def _ocr_key(ocr_options: dict = None) -> str:
+    """The OCR settings that change extracted text (threads only change speed)."""
+    return json.dumps({k: v for k, v in (ocr_options or {}).items() if k in ("max_side", "max_dpi", "lang")},
+                      sort_keys=True)
+
+def extraction_cache_key(file_data: dict, ocr_options: dict = None) -> str:
+    """
+    Keys a file's extracted documents by its content, its extension (which picks
+    the loader), the loader and cache format versions, and the OCR settings.
+    """
+    return content_key(
+        "extracted", str(EXTRACTION_CACHE_VERSION), LOADER_VERSION, str(ocr.OCR_VERSION), _ocr_key(ocr_options),
+        os.path.splitext(file_data["name"])[1].lower(), upload_sha256(file_data),
     )
 
-def _load_and_split(in_memory_files):
+def _encode_documents(docs) -> bytes:
+    payload = [{"page_content": d.page_content, "metadata": d.metadata} for d in docs]
+    return zlib.compress(json.dumps(payload, default=str).encode("utf-8"), 6)
+
+def _decode_documents(data: bytes, file_name: str) -> list:
+    docs = [Document(**d) for d in json.loads(zlib.decompress(data))]
+    for doc in docs:
+        doc.metadata["source"] = file_name
+    return docs
+
+def _iter_extracted(in_memory_files, max_workers: int = None, ocr_options: dict = None,
+                    cache: TieredBlobCache = None):
     """
-    Loads documents from in-memory data, saves them to a temporary directory
-    for processing, and then splits them into chunks.
+    Yields (file_name, docs, error_message) for each uploaded file, in upload order.
+
+    With a cache, files whose content was extracted before (under the same
+    loader version and settings) are served from it without being parsed.
+    Files already spooled to disk (items with a "path", see uploads.py) are read
+    in place. In-memory items are written to a temporary directory just before
+    they are handed to an extraction worker and removed as soon as their result
+    has been consumed. At most two files per worker are in flight, so memory and
+    disk use stay bounded no matter how large the upload is.
+
+    max_workers bounds this call's share of the process-wide pool (see
+    _get_extraction_pool); with 1, files are extracted in this process.
     """
-    docs = []
-    img_ext = {".png", ".jpg", ".jpeg"}
+    if max_workers is None:
+        max_workers = extraction_workers()
+    max_workers = min(max_workers, len(in_memory_files))
 
     with tempfile.TemporaryDirectory() as temp_dir:
-        for file_data in in_memory_files:
-            file_name = file_data["name"]
-            file_bytes = file_data["data"]
+        def stage_file(file_data):
+            if "path" in file_data:
+                return file_data["name"], file_data["path"]
+            temp_path = os.path.join(temp_dir, file_data["name"])
+            with open(temp_path, "wb") as f:
+                f.write(file_data["data"])
+            return file_data["name"], temp_path
 
-            temp_path = os.path.join(temp_dir, file_name)
+        def unstage(temp_path):
+            if temp_path and temp_path.startswith(temp_dir + os.sep):
+                os.remove(temp_path)
 
-            with open(temp_path, "wb") as f:
-                f.write(file_bytes)
+        def lookup(file_data):
+            """Returns (cache_key, cached documents or None)."""
+            if cache is None:
+                return None, None
+            key = extraction_cache_key(file_data, ocr_options)
+            with telemetry.span("ingest.extract_cache", file=file_data["name"]) as span:
+                found, _ = cache.get_many([key])
+                span.set(hit=key in found)
+            with _extraction_cache_lock:
+                _extraction_cache_stats["hits" if key in found else "misses"] += 1
+            return key, _decode_documents(found[key], file_data["name"]) if key in found else None
+
+        def store(key, loaded_docs, error):
+            if key is not None and not error:
+                cache.set_many({key: _encode_documents(loaded_docs)})
 
-            ext = os.path.splitext(temp_path)[1].lower()
-            if ext in img_ext:
+        if max_workers <= 1:
+            for file_data in in_memory_files:
+                key, cached = lookup(file_data)
+                if cached is not None:
+                    yield file_data["name"], cached, None
+                    continue
+                file_name, temp_path = stage_file(file_data)
+                loaded_docs, error = _extract_file(file_name, temp_path, ocr_options)
+                unstage(temp_path)
+                store(key, loaded_docs, error)
+                yield file_name, loaded_docs, error
+            return
+
+        remaining = iter(in_memory_files)
+        pending = collections.deque()
+
+        def submit(file_name, temp_path):
+            pool = _get_extraction_pool()
+            try:
+                return pool, pool.submit(_extract_file_traced, file_name, temp_path, ocr_options)
+            except BrokenProcessPool:
+                _discard_extraction_pool(pool)
+                pool = _get_extraction_pool()
+                return pool, pool.submit(_extract_file_traced, file_name, temp_path, ocr_options)
+
+        def result(file_name, temp_path, pool, future):
+            for attempt in range(2):
                 try:
-                    text = pytesseract.image_to_string(Image.open(temp_path))
-                    docs.append(Document(page_content=text, metadata={"source": file_name}))
-                except Exception as e:
-                    st.error(f"OCR error on {file_name}: {e}")
+                    return future.result()
+                except BrokenProcessPool:
+                    # A worker died (e.g. it ran out of memory) and took the pool's other tasks with it;
+                    # those are retried once on a new pool.
+                    _discard_extraction_pool(pool)
+                    if attempt:
+                        break
+                    pool, future = submit(file_name, temp_path)
+            return [], f"Failed to load {file_name}: its extraction worker crashed.", []
+
+        def submit_next():
+            file_data = next(remaining, None)
+            if file_data is None:
+                return
+            key, cached = lookup(file_data)
+            if cached is not None:
+                future = Future()
+                future.set_result((cached, None, []))
+                pending.append((file_data["name"], None, None, None, future))
+                return
+            file_name, temp_path = stage_file(file_data)
+            pending.append((file_name, temp_path, key, *submit(file_name, temp_path)))
+
+        for _ in range(max_workers * 2):
+            submit_next()
+        while pending:
+            file_name, temp_path, key, pool, future = pending.popleft()
+            loaded_docs, error, spans = result(file_name, temp_path, pool, future)
+            telemetry.replay(spans)
+            unstage(temp_path)
+            store(key, loaded_docs, error)
+            submit_next()
+            yield file_name, loaded_docs, error
+
+def _load_and_split(in_memory_files, max_workers: int = None, chunking_options: dict = None):
+    """
+    Loads documents from in-memory data, saves them to a temporary directory
+    for processing, and then splits them into token-budgeted chunks, dropping
+    near-duplicates unless the chunking settings turn that off.
+
+    With more than one worker, files are extracted in parallel on a process pool.
+    Chunks are always returned in upload order, and per-file errors are reported
+    the same way as in the serial path.
+    """
+    settings = chunking.chunking_settings(chunking_options)
+    dedup = chunking.NearDuplicateFilter(settings["dedup_threshold"]) if settings["dedup"] else None
+    docs = []
+    for _, loaded_docs, error in _iter_extracted(in_memory_files, max_workers, ocr_settings(),
+                                                 get_extraction_cache()):
+        if error:
+            st.error(error)
+        docs.extend(chunking.strip_repeated_lines(loaded_docs) if settings["dedup"] else loaded_docs)
+    with telemetry.span("ingest.split", documents=len(docs)) as span:
+        chunks = chunking.make_splitter(settings).split_documents(docs)
+        kept = [c for c in chunks if dedup is None or not dedup.is_duplicate(c.page_content)]
+        span.set(chunks=len(kept), tokens=sum(chunking.count_tokens(c.page_content) for c in kept))
+    return kept
+
+INGESTION_STAGES = ("extract", "split", "embed", "upsert")
+EMBED_BATCH_SIZE = 64
+PIPELINE_QUEUE_SIZE = 4
+
+class _PipelineStopped(Exception):
+    """Raised inside a pipeline stage when another stage has failed."""
+
+_END_OF_STREAM = object()
+
+def _queue_put(q, item, stop):
+    while True:
+        if stop.is_set():
+            raise _PipelineStopped()
+        try:
+            q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+def _queue_get(q, stop):
+    while True:
+        if stop.is_set():
+            raise _PipelineStopped()
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            pass
+
+def run_ingestion_pipeline(in_memory_files, embeddings, upsert_batch, on_progress=None, on_error=None,
+                           max_workers: int = None, queue_size: int = PIPELINE_QUEUE_SIZE,
+                           batch_size: int = EMBED_BATCH_SIZE, ocr_options: dict = None,
+                           extraction_cache: TieredBlobCache = None, chunking_options: dict = None,
+                           report: dict = None, on_stored=None, stored_chunk_ids=None, should_stop=None):
+    """
+    Streams files through extract -> split -> embed -> upsert.
+
+    Each stage runs on its own thread and hands work to the next through a
+    bounded queue, so only a few batches are held in memory at any time and the
+    first vectors are upserted while later files are still being parsed.
+
+    Every chunk gets a deterministic ID derived from its file name, the file's
+    content hash, its position and how it was extracted and split (see
+    chunk_id), so re-ingesting a file with the same settings overwrites its
+    vectors instead of duplicating them.
+
+    Files are split with the given chunking settings (see chunking.py), and
+    near-duplicate chunks are dropped before they reach the embedding stage.
+    If a `report` dict is given, it is filled with the number of chunks split,
+    the duplicates dropped, and the bytes of text kept and dropped.
+
+    `upsert_batch(ids, chunks, vectors)` stores one batch of embedded chunks. It
+    may return a Future (see IndexUpserter) to store batches concurrently; a
+    batch counts as upserted once its Future completes.
+    `ocr_options` are passed to the extraction workers (see ocr_settings), and
+    files found in `extraction_cache` are not parsed again.
+    `on_progress(stage, done, total)` and `on_error(message)` are always called
+    from the calling thread, so they may safely update Streamlit elements.
+    So is `on_stored(file_name, chunk_ids, complete)`, once per stored batch and
+    file, with complete=True on the call that finishes the file (files without
+    chunks get a single call with no IDs). Chunks whose IDs are in
+    `stored_chunk_ids` were stored by an earlier, interrupted run: they count
+    as stored without being embedded or upserted again.
+    `should_stop()` is polled while the pipeline runs; once it returns True,
+    every stage stops after its current item and the pipeline returns what was
+    stored so far, with report["cancelled"] set.
+    Returns a {file_name: [chunk_id, ...]} dict of what was stored. If any stage
+    fails, the others are stopped and the first exception is re-raised.
+    """
+    stop = threading.Event()
+    events = queue.Queue()
+    failures = []
+    extracted_q = queue.Queue(maxsize=queue_size)
+    split_q = queue.Queue(maxsize=queue_size)
+    embedded_q = queue.Queue(maxsize=queue_size)
+    counts = dict.fromkeys(INGESTION_STAGES, 0)
+    n_files = len(in_memory_files)
+    file_hashes = {f["name"]: upload_sha256(f) for f in in_memory_files}
+    stored_ids = {name: [] for name in file_hashes}
+    expected_chunks = {}
+    stored_chunk_ids = set(stored_chunk_ids or ())
+
+    def extract():
+        for file_name, loaded_docs, error in _iter_extracted(in_memory_files, max_workers, ocr_options,
+                                                             extraction_cache):
+            if error:
+                events.put(("error", error))
+            _queue_put(extracted_q, (file_name, loaded_docs), stop)
+            events.put(("extract", 1))
+        _queue_put(extracted_q, _END_OF_STREAM, stop)
+
+    settings = chunking.chunking_settings(chunking_options)
+    variant = chunk_variant(settings, ocr_options)
+    split_report = {"chunks": 0, "duplicates_dropped": 0, "bytes_kept": 0, "bytes_dropped": 0}
+
+    def split():
+        splitter = chunking.make_splitter(settings)
+        dedup = chunking.NearDuplicateFilter(settings["dedup_threshold"]) if settings["dedup"] else None
+        batch = []
+        while (item := _queue_get(extracted_q, stop)) is not _END_OF_STREAM:
+            file_name, loaded_docs = item
+            with telemetry.span("ingest.split", file=file_name, documents=len(loaded_docs)) as span:
+                if settings["dedup"]:
+                    loaded_docs = chunking.strip_repeated_lines(loaded_docs)
+                chunks = splitter.split_documents(loaded_docs)
+                file_hash = file_hashes[file_name]
+                kept = []
+                for i, chunk in enumerate(chunks):
+                    size = len(chunk.page_content.encode("utf-8"))
+                    if dedup is not None and dedup.is_duplicate(chunk.page_content):
+                        split_report["duplicates_dropped"] += 1
+                        split_report["bytes_dropped"] += size
+                    else:
+                        split_report["bytes_kept"] += size
+                        kept.append((chunk_id(file_name, file_hash, i, variant), chunk))
+                split_report["chunks"] += len(chunks)
+                span.set(chunks=len(kept), duplicates=len(chunks) - len(kept),
+                         tokens=sum(chunking.count_tokens(c.page_content) for _, c in kept))
+            events.put(("split", len(kept)))
+            events.put(("file_split", (file_name, len(kept))))
+            resumed = [(id_, chunk) for id_, chunk in kept if id_ in stored_chunk_ids]
+            if resumed:
+                events.put(("embed", len(resumed)))
+                events.put(("upsert", len(resumed)))
+                events.put(("stored", resumed))
+                kept = [(id_, chunk) for id_, chunk in kept if id_ not in stored_chunk_ids]
+            batch.extend(kept)
+            while len(batch) >= batch_size:
+                _queue_put(split_q, batch[:batch_size], stop)
+                batch = batch[batch_size:]
+        if batch:
+            _queue_put(split_q, batch, stop)
+        _queue_put(split_q, _END_OF_STREAM, stop)
+
+    def embed():
+        while (batch := _queue_get(split_q, stop)) is not _END_OF_STREAM:
+            ids, chunks = zip(*batch)
+            with telemetry.span("ingest.embed", chunks=len(chunks)):
+                vectors = embeddings.embed_documents([c.page_content for c in chunks])
+            _queue_put(embedded_q, (ids, chunks, vectors), stop)
+            events.put(("embed", len(chunks)))
+        _queue_put(embedded_q, _END_OF_STREAM, stop)
+
+    def upsert():
+        in_flight = collections.deque()
+
+        def settle(future, batch):
+            future.result()
+            events.put(("upsert", len(batch)))
+            events.put(("stored", batch))
+
+        try:
+            while (item := _queue_get(embedded_q, stop)) is not _END_OF_STREAM:
+                ids, chunks, vectors = item
+                result = upsert_batch(ids, chunks, vectors)
+                batch = list(zip(ids, chunks))
+                if isinstance(result, Future):
+                    in_flight.append((result, batch))
+                else:
+                    events.put(("upsert", len(batch)))
+                    events.put(("stored", batch))
+                while in_flight and in_flight[0][0].done():
+                    settle(*in_flight.popleft())
+        finally:
+            # Batches already handed to the index are waited for even when the
+            # pipeline stops early, so every vector written is reported as stored.
+            while in_flight:
+                settle(*in_flight.popleft())
+
+    def run_stage(name, target):
+        try:
+            target()
+        except _PipelineStopped:
+            pass
+        except Exception as e:
+            failures.append(e)
+            stop.set()
+
+    # Each stage runs in a copy of the caller's context, so its spans nest under the caller's.
+    threads = [
+        threading.Thread(target=contextvars.copy_context().run, args=(run_stage, name, target),
+                         name=f"ingest-{name}", daemon=True)
+        for name, target in zip(INGESTION_STAGES, (extract, split, embed, upsert))
+    ]
+    for t in threads:
+        t.start()
+
+    def file_stored(file_name, ids):
+        complete = len(stored_ids[file_name]) == expected_chunks.get(file_name)
+        if on_stored and (ids or complete):
+            on_stored(file_name, ids, complete)
+
+    def drain(timeout):
+        try:
+            event = events.get(timeout=timeout)
+        except queue.Empty:
+            return
+        while True:
+            kind, value = event
+            if kind == "error":
+                if on_error:
+                    on_error(value)
+            elif kind == "file_split":
+                file_name, n_chunks = value
+                expected_chunks[file_name] = n_chunks
+                file_stored(file_name, [])
+            elif kind == "stored":
+                by_file = collections.defaultdict(list)
+                for id_, chunk in value:
+                    by_file[chunk.metadata["source"]].append(id_)
+                for file_name, ids in by_file.items():
+                    stored_ids[file_name].extend(ids)
+                    file_stored(file_name, ids)
             else:
-                try:
-                    loader = UnstructuredFileLoader(temp_path)
-                    loaded_docs = loader.load()
-                    for doc in loaded_docs:
-                        doc.metadata["source"] = file_name
-                    docs.extend(loaded_docs)
-                except Exception as e:
-                    st.error(f"Failed to load {file_name}: {e}")
-
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    return splitter.split_documents(docs)
-
-def process_and_store_documents(in_memory_files, namespace: str):
-    """Processes in-memory documents and stores their embeddings in Pinecone."""
-    with st.spinner("Extracting text and creating embeddings..."):
-        docs = _load_and_split(in_memory_files)
-        em = _embeddings()
-        index_name = st.secrets["PINECONE_INDEX_NAME"]
-
-    with st.spinner(f"Storing {len(docs)} document chunks in the knowledge base..."):
-        PineconeVectorStore.from_documents(
-            documents=docs,
-            embedding=em,
-            index_name=index_name,
-            namespace=namespace,
-            batch_size=64  # OPTIMIZATION: Process documents in larger batches
-        )
+                counts[kind] += value
+                if on_progress:
+                    total = n_files if kind == "extract" else counts["split"]
+                    on_progress(kind, counts[kind], total)
+            try:
+                event = events.get_nowait()
+            except queue.Empty:
+                return
+
+    cancelled = False
+    while any(t.is_alive() for t in threads):
+        drain(timeout=0.1)
+        if not cancelled and should_stop is not None and should_stop():
+            cancelled = True
+            stop.set()
+    drain(timeout=0)
+
+    if failures:
+        raise failures[0]
+    if report is not None:
+        report.update(split_report, cancelled=cancelled)
+    return stored_ids
+
+def upsert_workers() -> int:
+    return int(st.secrets.get("UPSERT_WORKERS", 4))
+
+_pinecone_index_handle = None
+_pinecone_index_lock = threading.Lock()
+
+def _pinecone_index():
+    """Returns the process-wide Pinecone Index handle, whose connection pool is shared by all upserts and deletes."""
+    global _pinecone_index_handle
+    with _pinecone_index_lock:
+        if _pinecone_index_handle is None:
+            pc = Pinecone(api_key=st.secrets["PINECONE_API_KEY"])
+            _pinecone_index_handle = pc.Index(st.secrets["PINECONE_INDEX_NAME"], pool_threads=upsert_workers())
+        return _pinecone_index_handle
+
+_local_index = None
+_local_index_lock = threading.Lock()
+
+def _get_local_index() -> LocalIndex:
+    """Returns the process-wide local vector index, rooted at LOCAL_INDEX_DIR."""
+    global _local_index
+    with _local_index_lock:
+        if _local_index is None:
+            root = st.secrets.get("LOCAL_INDEX_DIR", os.path.join(tempfile.gettempdir(), "chatmydocs", "vectors"))
+            ann_threshold = int(st.secrets.get("LOCAL_INDEX_ANN_THRESHOLD", DEFAULT_ANN_THRESHOLD))
+            _local_index = LocalIndex(root, ann_threshold=ann_threshold)
+        return _local_index
+
+VECTOR_BACKENDS = ("pinecone", "local")
+
+def vector_backend(is_guest: bool = False) -> str:
+    """
+    Returns the configured vector backend: VECTOR_BACKEND for registered users,
+    GUEST_VECTOR_BACKEND (the local index by default) for throwaway guest sessions.
+    """
+    if is_guest:
+        return st.secrets.get("GUEST_VECTOR_BACKEND", "local")
+    return st.secrets.get("VECTOR_BACKEND", "pinecone")
+
+def _vector_index(backend: str = None):
+    """Returns a Pinecone-Index-compatible handle for the given backend."""
+    backend = backend or vector_backend()
+    if backend not in VECTOR_BACKENDS:
+        raise ValueError(f"Unknown vector backend '{backend}'")
+    return _get_local_index() if backend == "local" else _pinecone_index()
+
+def warm_up():
+    """Builds the process-wide embeddings and vector index handles ahead of the first upload or question."""
+    _embeddings()
+    _vector_index()
+
+DEFAULT_METADATA_FIELDS = ("source", "page_number")
+
+def metadata_policy() -> dict:
+    """
+    Returns which chunk metadata is stored on each vector.
+
+    Only the whitelisted fields (VECTOR_METADATA_FIELDS) are kept; "source" is
+    always kept, since documents are removed by it. With CHUNK_TEXT_STORE = "s3"
+    the chunk text goes to the side ChunkTextStore instead of the vector metadata.
+    """
+    fields = list(st.secrets.get("VECTOR_METADATA_FIELDS", DEFAULT_METADATA_FIELDS))
+    if "source" not in fields:
+        fields.insert(0, "source")
+    return {"fields": fields, "text": st.secrets.get("CHUNK_TEXT_STORE", "inline")}
+
+_chunk_store = None
+_chunk_store_lock = threading.Lock()
 
-    return load_vector_store(namespace=namespace)
+def get_chunk_store():
+    """Returns the process-wide ChunkTextStore if chunk texts are kept outside the index, else None."""
+    global _chunk_store
+    if metadata_policy()["text"] != "s3":
+        return None
+    with _chunk_store_lock:
+        if _chunk_store is None:
+            cache_dir = st.secrets.get(
+                "CHUNK_TEXT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "chatmydocs", "chunks")
+            )
+            max_bytes = int(st.secrets.get("CHUNK_TEXT_CACHE_MAX_MB", 256)) * 1024 * 1024
+            _chunk_store = ChunkTextStore(
+                st.secrets["S3_BUCKET_NAME"],
+                st.secrets.get("CHUNK_TEXT_S3_PREFIX", "_chunks"),
+                DiskLRUCache(cache_dir, max_bytes),
+            )
+        return _chunk_store
 
-def load_vector_store(namespace: str):
-    """Loads an existing vector store from Pinecone by namespace."""
+def compact_metadata(metadata: dict, fields) -> dict:
+    """Keeps only the whitelisted metadata fields, dropping empty values the index would reject."""
+    return {field: metadata[field] for field in fields if metadata.get(field) is not None}
+
+class IndexUpserter:
+    """
+    Writes embedded chunks to the vector index, several batches at a time.
+
+    Each call submits one batch to a small thread pool and returns its Future;
+    at most max_workers batches are in flight, and further calls block until
+    one finishes. Vectors carry the metadata chosen by the metadata policy;
+    when chunk texts go to a ChunkTextStore, they are written there before
+    the batch's vectors, so no vector is ever queryable without its text.
+    """
+
+    def __init__(self, index, namespace: str, policy: dict = None, chunk_store: ChunkTextStore = None,
+                 max_workers: int = 4, text_key: str = "text"):
+        self.index = index
+        self.namespace = namespace
+        self.policy = policy or {"fields": list(DEFAULT_METADATA_FIELDS), "text": "inline"}
+        self.chunk_store = chunk_store if self.policy["text"] == "s3" else None
+        self.text_key = text_key
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="upsert")
+        self._slots = threading.Semaphore(max_workers)
+
+    def _vector(self, id_, chunk, vector) -> dict:
+        metadata = compact_metadata(chunk.metadata, self.policy["fields"])
+        if self.chunk_store is None:
+            metadata[self.text_key] = chunk.page_content
+        return {"id": id_, "values": vector, "metadata": metadata}
+
+    def _write(self, ids, chunks, vectors):
+        if self.chunk_store is not None:
+            with telemetry.span("ingest.store_texts", chunks=len(chunks)):
+                self.chunk_store.put_many(self.namespace, {id_: c.page_content for id_, c in zip(ids, chunks)})
+        with telemetry.span("vector.upsert", vectors=len(vectors)):
+            self.index.upsert(
+                vectors=[self._vector(id_, chunk, vector) for id_, chunk, vector in zip(ids, chunks, vectors)],
+                namespace=self.namespace,
+            )
+
+    def __call__(self, ids, chunks, vectors) -> Future:
+        self._slots.acquire()
+        try:
+            future = self._pool.submit(contextvars.copy_context().run, self._write, list(ids), list(chunks),
+                                       list(vectors))
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+STAGE_LABELS = {
+    "extract": "📄 Extracting text",
+    "split": "✂️ Splitting into chunks",
+    "embed": "🧠 Creating embeddings",
+    "upsert": "📦 Storing in the knowledge base",
+}
+
+def _streamlit_progress():
+    """Creates one progress bar per ingestion stage and returns an on_progress callback for them."""
+    bars = {stage: st.progress(0.0, text=f"{label}...") for stage, label in STAGE_LABELS.items()}
+
+    def on_progress(stage, done, total):
+        unit = "files" if stage == "extract" else "chunks"
+        fraction = min(done / total, 1.0) if total else 0.0
+        bars[stage].progress(fraction, text=f"{STAGE_LABELS[stage]}: {done}/{total} {unit}")
+    return on_progress
+
+def file_sha256(data) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def upload_sha256(item: dict) -> str:
+    """Returns the content hash of an upload item, reusing the one computed while spooling it."""
+    if item.get("sha256"):
+        return item["sha256"]
+    if "data" in item:
+        return file_sha256(item["data"])
+    digest = hashlib.sha256()
+    with open(item["path"], "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def upload_size(item: dict) -> int:
+    return item["size"] if "size" in item else len(item["data"])
+
+def chunk_variant(chunking_settings: dict, ocr_options: dict = None) -> str:
+    """
+    Names how files are turned into chunks: the chunking settings, the loader
+    and OCR versions and the OCR settings. Any change to these can change a
+    chunk's text, so it is part of every chunk ID.
+    """
+    return content_key(json.dumps(chunking_settings, sort_keys=True), LOADER_VERSION, str(ocr.OCR_VERSION),
+                       _ocr_key(ocr_options))
+
+def chunk_id(file_name: str, file_hash: str, index: int, variant: str = "") -> str:
+    """Returns the deterministic vector ID of a file's index-th chunk, as split under chunk_variant() `variant`."""
+    return f"{content_key(file_name, file_hash, variant)[:32]}-{index}"
+
+MANIFEST_VERSION = 2
+
+def new_manifest() -> dict:
+    return {"version": MANIFEST_VERSION, "files": {}}
+
+def load_manifest(data) -> dict:
+    """
+    Normalizes a stored source_documents.json into a manifest.
+
+    Knowledge bases created before manifests existed stored a plain list of file
+    names. Those files are kept with unknown hashes and chunk IDs, so they are
+    re-ingested if uploaded again and can only be removed by metadata filter.
+    """
+    if isinstance(data, dict) and "files" in data:
+        return data
+    manifest = new_manifest()
+    for name in data or []:
+        manifest["files"][name] = {"sha256": None, "size": None, "chunk_ids": None}
+    return manifest
+
+def manifest_documents(manifest: dict) -> list:
+    """Returns the source file names recorded in a manifest, in insertion order."""
+    return list(manifest["files"])
+
+CHECKPOINT_INTERVAL_SECONDS = 5.0
+
+def ingest_documents(in_memory_files, namespace: str, manifest: dict = None, backend: str = None,
+                     chunking_options: dict = None, on_progress=None, on_error=None, on_checkpoint=None,
+                     should_stop=None, checkpoint: dict = None,
+                     checkpoint_interval: float = CHECKPOINT_INTERVAL_SECONDS):
+    """
+    Streams uploaded documents into the vector index and returns (updated_manifest, report).
+
+    The Streamlit-free core of process_and_store_documents, so it can also run
+    as a background job (see ingest_jobs.py). Files whose name and content hash
+    are already in the manifest are skipped, and changed files have their stale
+    vectors replaced as soon as their new vectors are stored.
+
+    Progress is checkpointed: `on_checkpoint({"manifest", "partial"})` is called
+    whenever a file has been fully stored, and at most every checkpoint_interval
+    seconds while batches of a file are being stored. "manifest" includes every
+    finished file; "partial" maps each unfinished file to the chunk IDs stored
+    so far. Passing the last checkpoint back as `checkpoint` (together with its
+    manifest) resumes an interrupted run: finished files are skipped and stored
+    chunks are neither embedded nor upserted again.
+
+    When `should_stop()` returns True, the run stops after the batches in
+    flight, removes the vectors of unfinished files and returns the manifest of
+    the files finished so far, with report["cancelled"] set.
+    """
+    manifest = copy.deepcopy(manifest) if manifest else new_manifest()
+    manifest["chunking"] = chunking.chunking_settings(chunking_options or manifest.get("chunking"))
+    hashes = {f["name"]: upload_sha256(f) for f in in_memory_files}
+    pending = [f for f in in_memory_files if manifest["files"].get(f["name"], {}).get("sha256") != hashes[f["name"]]]
+    report = {"files": len(pending), "skipped": len(in_memory_files) - len(pending), "stored": 0, "resumed": 0,
+              "cancelled": False, "chunks": 0, "duplicates_dropped": 0, "bytes_kept": 0, "bytes_dropped": 0}
+    if not pending:
+        return manifest, report
+
+    # Chunk IDs stored by an interrupted run, for files that still need finishing.
+    partial = {name: list(ids) for name, ids in (checkpoint or {}).get("partial", {}).items() if name in hashes}
+    resumed_ids = {id_ for ids in partial.values() for id_ in ids}
+    cache_before = embedding_cache_stats()
+    extraction_before = extraction_cache_stats()
+    index = _vector_index(backend)
+    upserter = IndexUpserter(index, namespace, metadata_policy(), get_chunk_store(), max_workers=upsert_workers())
+    sizes = {f["name"]: upload_size(f) for f in pending}
+    last_checkpoint = time.monotonic()
+
+    def save_checkpoint():
+        nonlocal last_checkpoint
+        last_checkpoint = time.monotonic()
+        if on_checkpoint:
+            on_checkpoint({"manifest": copy.deepcopy(manifest), "partial": {k: list(v) for k, v in partial.items()}})
+
+    def on_stored(file_name, ids, complete):
+        new = [id_ for id_ in ids if id_ not in resumed_ids]
+        partial.setdefault(file_name, []).extend(new)
+        report["resumed"] += len(ids) - len(new)
+        if not complete:
+            if time.monotonic() - last_checkpoint >= checkpoint_interval:
+                save_checkpoint()
+            return
+        new_ids = partial.pop(file_name)
+        previous = manifest["files"].get(file_name)
+        if previous and previous.get("chunk_ids"):
+            kept = set(new_ids)
+            _delete_ids(index, namespace, [i for i in previous["chunk_ids"] if i not in kept])
+        manifest["files"][file_name] = {"sha256": hashes[file_name], "size": sizes[file_name], "chunk_ids": new_ids}
+        report["stored"] += len(new_ids)
+        save_checkpoint()
+
+    # Vectors of files ingested before manifests existed have random IDs; they
+    # are removed by source before the file's new vectors are written.
+    for f in pending:
+        previous = manifest["files"].get(f["name"])
+        if previous and previous.get("chunk_ids") is None and f["name"] not in partial:
+            _delete_by_source(index, namespace, f["name"], on_error=on_error)
+
+    with telemetry.span("ingest", namespace=namespace, files=len(pending),
+                        bytes=sum(sizes.values())) as ingest_span:
+        try:
+            run_ingestion_pipeline(
+                pending,
+                embeddings=_embeddings(),
+                upsert_batch=upserter,
+                on_progress=on_progress,
+                on_error=on_error,
+                ocr_options=ocr_settings(),
+                extraction_cache=get_extraction_cache(),
+                chunking_options=manifest["chunking"],
+                report=report,
+                on_stored=on_stored,
+                stored_chunk_ids=resumed_ids,
+                should_stop=should_stop,
+            )
+        except BaseException:
+            save_checkpoint()
+            raise
+        finally:
+            upserter.close()
+        if report["cancelled"]:
+            finished = {id_ for entry in manifest["files"].values() for id_ in entry.get("chunk_ids") or ()}
+            unfinished = resumed_ids.union(*partial.values()) - finished
+            _delete_ids(index, namespace, sorted(unfinished))
+        ingest_span.set(chunks=report["stored"], duplicates=report["duplicates_dropped"],
+                        cancelled=report["cancelled"])
+    invalidate_namespace(namespace)
+
+    cache_after = embedding_cache_stats()
+    report["embedding_hits"] = cache_after["hits"] - cache_before["hits"]
+    report["embedding_misses"] = cache_after["misses"] - cache_before["misses"]
+    extraction_after = extraction_cache_stats()
+    report["extraction_reused"] = extraction_after["hits"] - extraction_before["hits"]
+    report["extraction_parsed"] = extraction_after["misses"] - extraction_before["misses"]
+    return manifest, report
+
+def discard_checkpoint(checkpoint: dict, namespace: str, backend: str = None):
+    """Removes the vectors of the files an interrupted ingestion left unfinished (see ingest_documents)."""
+    finished = {id_ for entry in checkpoint["manifest"]["files"].values() for id_ in entry.get("chunk_ids") or ()}
+    unfinished = {id_ for ids in checkpoint.get("partial", {}).values() for id_ in ids} - finished
+    _delete_ids(_vector_index(backend), namespace, sorted(unfinished))
+    invalidate_namespace(namespace)
+
+def report_ingestion(report: dict):
+    """Shows the notes of an ingestion report (skipped files, duplicates, cache reuse) in the page."""
+    if report["skipped"]:
+        st.info(f"Skipped {report['skipped']} unchanged document(s) already in the knowledge base.")
+    if report["duplicates_dropped"]:
+        st.caption(f"Skipped {report['duplicates_dropped']} near-duplicate chunks "
+                   f"({report['bytes_dropped'] / 1024:.0f} KB of repeated text) before embedding.")
+    hits, misses = report.get("embedding_hits", 0), report.get("embedding_misses", 0)
+    if hits + misses:
+        st.caption(f"Embedding cache: reused {hits} of {hits + misses} chunk vectors ({misses} sent to Bedrock).")
+    reused = report.get("extraction_reused", 0)
+    if reused:
+        parsed = report.get("extraction_parsed", 0)
+        st.caption(f"Extraction cache: reused the parsed text of {reused} of {reused + parsed} files.")
+
+def process_and_store_documents(in_memory_files, namespace: str, manifest: dict = None, backend: str = None,
+                                chunking_options: dict = None):
+    """
+    Processes uploaded documents (spooled to disk or in memory) and streams their
+    embeddings into the vector index, showing progress in the page.
+
+    When a manifest of an existing knowledge base is given, files whose name and
+    content hash are already recorded are skipped, and changed files have their
+    stale vectors replaced. Chunking settings given for a new knowledge base are
+    recorded in its manifest and reused whenever documents are added later.
+    Returns (vector_store, updated_manifest).
+    """
+    with st.status("Building your knowledge base...", expanded=True) as status:
+        manifest, report = ingest_documents(in_memory_files, namespace, manifest, backend, chunking_options,
+                                            on_progress=_streamlit_progress(), on_error=st.error)
+        status.update(label=f"Stored {report['stored']} document chunks.", state="complete", expanded=False)
+    report_ingestion(report)
+    return load_vector_store(namespace=namespace, backend=backend), manifest
+
+def remove_documents_from_kb(file_names, namespace: str, manifest: dict, backend: str = None) -> dict:
+    """Deletes only the vectors of the given source files and returns the updated manifest."""
+    manifest = copy.deepcopy(manifest)
+    index = _vector_index(backend)
+    for name in file_names:
+        entry = manifest["files"].get(name)
+        if entry is None:
+            continue
+        if entry.get("chunk_ids") is None:
+            _delete_by_source(index, namespace, name)
+        else:
+            _delete_ids(index, namespace, entry["chunk_ids"])
+        del manifest["files"][name]
+    invalidate_namespace(namespace)
+    return manifest
+
+PINECONE_DELETE_BATCH = 1000
+
+def _delete_ids(index, namespace: str, ids):
+    ids = list(ids)
+    for start in range(0, len(ids), PINECONE_DELETE_BATCH):
+        index.delete(ids=ids[start:start + PINECONE_DELETE_BATCH], namespace=namespace)
+    store = get_chunk_store()
+    if store is not None and ids:
+        errors = store.delete_many(namespace, ids)["errors"]
+        if errors:
+            logger.warning("Could not delete %d chunk texts of namespace %s", len(errors), namespace)
+
+def _delete_by_source(index, namespace: str, file_name: str, on_error=None):
+    """Deletes a legacy file's vectors, which have random IDs, by metadata filter."""
+    try:
+        index.delete(filter={"source": {"$eq": file_name}}, namespace=namespace)
+    except Exception as e:
+        (on_error or st.warning)(f"Could not remove old vectors of '{file_name}': {e}")
+
+def load_vector_store(namespace: str, backend: str = None):
+    """Loads an existing vector store from Pinecone, or from the local index, by namespace."""
     em = _embeddings()
+    if (backend or vector_backend()) == "local":
+        return LocalVectorStore(_get_local_index(), em, namespace)
     index_name = st.secrets["PINECONE_INDEX_NAME"]
 
     return PineconeVectorStore.from_existing_index(
@@ -97,23 +1253,44 @@ def load_vector_store(namespace: str):
         namespace=namespace
     )
 
-def delete_knowledge_base(namespace: str):
-    """Deletes all vectors from a specific namespace in the Pinecone index."""
-    try:
-        pc = Pinecone(api_key=st.secrets["PINECONE_API_KEY"])
-        index = pc.Index(st.secrets["PINECONE_INDEX_NAME"])
-        index.delete(namespace=namespace, delete_all=True)
-        return True
-    except Exception as e:
-        st.error(f"Error deleting knowledge base from Pinecone: {e}")
-        return False
+def purge_knowledge_base(bucket_name: str, s3_prefix: str, namespace: str, backend: str = None, on_progress=None) -> dict:
+    """
+    Deletes a knowledge base's S3 objects and its vectors concurrently.
+
+    The vector namespace, and any chunk texts in the side ChunkTextStore, are
+    dropped on helper threads while the S3 prefix is listed and deleted in
+    parallel batches. A namespace that holds no vectors (e.g. every file failed
+    extraction) counts as deleted. Does not touch Streamlit, so it can run as a
+    background job; failures are returned rather than displayed:
+
+        {"s3_deleted": int, "s3_errors": [{"Key", "Code", "Message"}], "vector_error": str | None}
+    """
+    index = _vector_index(backend)
+    store = get_chunk_store()
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        vectors = pool.submit(index.delete, namespace=namespace, delete_all=True)
+        texts = pool.submit(store.delete_namespace, namespace) if store is not None else None
+        s3_report = s3_utils.delete_prefix(bucket_name, s3_prefix, on_progress=on_progress)
+        try:
+            vectors.result()
+            vector_error = None
+        except NotFoundException:
+            vector_error = None  # Pinecone answers 404 for a namespace without vectors.
+        except Exception as e:
+            vector_error = str(e)
+        if texts is not None:
+            text_report = texts.result()
+            s3_report["deleted"] += text_report["deleted"]
+            s3_report["errors"].extend(text_report["errors"])
+    invalidate_namespace(namespace)
+    return {"s3_deleted": s3_report["deleted"], "s3_errors": s3_report["errors"], "vector_error": vector_error}
 
 def create_conversational_chain(vector_store):
     """Creates the LangChain conversational retrieval chain with a custom prompt."""
     llm = BedrockChat(
         client=get_bedrock_client(),
-        model_id="anthropic.claude-3-sonnet-20240229-v1:0",
-        model_kwargs={"temperature": 0.1}
+        model_id=LLM_MODEL_ID,
+        model_kwargs={"temperature": LLM_TEMPERATURE}
     )
     prompt_template = """
     You are a friendly and helpful assistant for answering questions based on the provided text.
@@ -133,10 +1310,7 @@ def create_conversational_chain(vector_store):
         template=prompt_template, input_variables=["context", "question"]
     )
 
-    retriever = vector_store.as_retriever(
-        search_type="mmr",
-        search_kwargs={'k': 5, 'fetch_k': 50}
-    )
+    retriever = MMRRetriever(vector_store=vector_store, chunk_store=get_chunk_store(), **retriever_settings())
 
     qa = RetrievalQA.from_chain_type(
         llm=llm,
@@ -145,4 +1319,166 @@ def create_conversational_chain(vector_store):
         chain_type="stuff",
         chain_type_kwargs={"prompt": PROMPT}
     )
-    return qa
\ No newline at end of file
+    return qa
+
+_chain_cache = None
+_chain_cache_lock = threading.Lock()
+
+def _get_chain_cache() -> TTLCache:
+    """Returns the process-wide cache of conversational chains, shared by all sessions."""
+    global _chain_cache
+    with _chain_cache_lock:
+        if _chain_cache is None:
+            _chain_cache = TTLCache(
+                max_entries=int(st.secrets.get("CHAIN_CACHE_MAX_ENTRIES", 32)),
+                ttl_seconds=float(st.secrets.get("CHAIN_CACHE_TTL_SECONDS", 1800)),
+            )
+        return _chain_cache
+
+def _chain_key(namespace: str, backend: str) -> tuple:
+    return (namespace, backend, LLM_MODEL_ID, LLM_TEMPERATURE, EMBEDDING_MODEL_ID, tuple(sorted(retriever_settings().items())))
+
+def get_conversational_chain(namespace: str, backend: str = None):
+    """
+    Returns the retrieval chain for a namespace from the process-wide cache.
+
+    Chains hold no per-user state, so every session chatting with the same
+    knowledge base shares one chain and its vector store connection.
+    """
+    backend = backend or vector_backend()
+    return _get_chain_cache().get_or_create(
+        _chain_key(namespace, backend),
+        lambda: create_conversational_chain(load_vector_store(namespace=namespace, backend=backend)),
+    )
+
+def invalidate_namespace(namespace: str):
+    """Drops every cached object built for a namespace after its documents changed."""
+    if _chain_cache is not None:
+        _chain_cache.invalidate_where(lambda key: key[0] == namespace)
+    if _answer_cache is not None:
+        _answer_cache.invalidate(namespace)
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+def _get_answer_cache() -> SemanticAnswerCache:
+    """Returns the process-wide semantic answer cache."""
+    global _answer_cache
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = SemanticAnswerCache(
+                threshold=float(st.secrets.get("ANSWER_CACHE_THRESHOLD", 0.95)),
+                ttl_seconds=float(st.secrets.get("ANSWER_CACHE_TTL_SECONDS", 3600)),
+                max_entries=int(st.secrets.get("ANSWER_CACHE_MAX_ENTRIES", 256)),
+            )
+        return _answer_cache
+
+class AnswerStream:
+    """
+    Streams an answer token by token, reusing a cached answer when a
+    near-identical question was already asked of the same knowledge base.
+
+    Creating the stream performs the answer cache lookup and the retrieval step
+    eagerly, so callers can show a spinner for retrieval and then render the
+    generated text as it arrives. Iterating yields text chunks. Once iteration
+    has finished, `result` holds the chain's result dict ("result",
+    "source_documents") plus a "cached" flag, and `timings` holds retrieval,
+    time-to-first-token and total latency in seconds.
+
+    The whole answer is traced as one "answer" span that ends when iteration
+    does; its stages are child spans.
+    """
+
+    def __init__(self, rag_chain, namespace: str, question: str):
+        self.namespace = namespace
+        self.question = question
+        self.result = None
+        self.timings = {}
+        self._start = time.perf_counter()
+        self._span = telemetry.start("answer", namespace=namespace, streamed=True)
+        self._generation = None
+        try:
+            with telemetry.use(self._span):
+                self._cache = _get_answer_cache()
+                with telemetry.span("answer.embed_query"):
+                    self._query_embedding = _embeddings().embed_query(question)
+                self._hit = self._cache.lookup(namespace, self._query_embedding)
+                self._span.set(cached=self._hit is not None)
+                if self._hit is None:
+                    self._stuff_chain = rag_chain.combine_documents_chain
+                    with telemetry.span("answer.retrieve") as span:
+                        self._sources = rag_chain.retriever.invoke(question)
+                        span.set(documents=len(self._sources))
+                    self.timings["retrieval"] = time.perf_counter() - self._start
+        except BaseException as e:
+            self._span.set(error=type(e).__name__)
+            self._span.end("error")
+            raise
+
+    def __iter__(self):
+        # Spans are ended explicitly rather than with `with telemetry.span`, whose
+        # context would leak into the consumer's context between yields.
+        try:
+            yield from self._generate()
+        except BaseException as e:
+            status = "cancelled" if isinstance(e, GeneratorExit) else "error"
+            for span in (self._generation, self._span):
+                if span is not None:
+                    span.set(error=type(e).__name__)
+                    span.end(status)
+            raise
+        self._span.end()
+
+    def _generate(self):
+        if self._hit is not None:
+            entry, similarity = self._hit
+            logger.info("Answer cache hit for %s (similarity %.3f, saved %.2fs)", self.namespace, similarity,
+                        entry["latency"])
+            self.result = {"result": entry["answer"], "source_documents": entry["sources"], "cached": True}
+            yield entry["answer"]
+            return
+
+        llm_chain = self._stuff_chain.llm_chain
+        context = self._stuff_chain.document_separator.join(
+            format_document(doc, self._stuff_chain.document_prompt) for doc in self._sources
+        )
+        prompt = llm_chain.prompt.format(context=context, question=self.question)
+
+        self._generation = telemetry.start("answer.generate", parent=self._span,
+                                           input_tokens=chunking.count_tokens(prompt))
+        parts = []
+        for chunk in llm_chain.llm.stream(prompt):
+            text = chunk.content if hasattr(chunk, "content") else str(chunk)
+            if not text:
+                continue
+            if not parts:
+                self.timings["first_token"] = time.perf_counter() - self._start
+                self._generation.set(first_token_ms=round(self.timings["first_token"] * 1000, 1))
+            parts.append(text)
+            yield text
+
+        answer = "".join(parts)
+        self.timings["total"] = time.perf_counter() - self._start
+        self._generation.set(output_tokens=chunking.count_tokens(answer))
+        self._generation.end()
+        logger.info(
+            "Streamed answer for %s: retrieval %.2fs, time to first token %.2fs, total %.2fs",
+            self.namespace, self.timings["retrieval"], self.timings.get("first_token", self.timings["total"]),
+            self.timings["total"],
+        )
+        self._cache.store(self.namespace, self.question, self._query_embedding, answer, self._sources,
+                          self.timings["total"])
+        self.result = {"result": answer, "source_documents": self._sources, "cached": False}
+
+def stream_answer(rag_chain, namespace: str, question: str) -> AnswerStream:
+    """Starts answering a question and returns an AnswerStream to render token by token."""
+    return AnswerStream(rag_chain, namespace, question)
+
+def answer_cache_stats() -> dict:
+    """Returns hit-rate and latency-saved metrics of the answer cache."""
+    if _answer_cache is None:
+        return {"hits": 0, "misses": 0, "hit_rate": 0.0, "latency_saved_seconds": 0.0, "entries": 0}
+    return _answer_cache.stats()
+
+telemetry.register_stats("answer_cache", answer_cache_stats,
+                         "Semantic answer cache: hits, misses, hit rate and generation time saved by hits.")
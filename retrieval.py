@@ -0,0 +1,112 @@
+# retrieval.py
+
+from typing import Any
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+import telemetry
+
+
+def mmr_select(query_embedding, candidate_embeddings, k: int = 5, lambda_mult: float = 0.5) -> list:
+    """
+    Selects k candidates by Maximal Marginal Relevance using matrix operations.
+
+    Relevance to the query is computed for all candidates with one
+    matrix-vector product. Each candidate's maximum similarity to the already
+    selected set is kept in a running vector, so every step costs a single
+    (n x d) @ d product instead of recomputing an (n x selected) similarity
+    matrix. Total cost is O(k * n * d) for n candidates of dimension d.
+    Returns the selected candidate indices in selection order.
+    """
+    candidates = np.asarray(candidate_embeddings, dtype=np.float32)
+    if candidates.ndim != 2 or len(candidates) == 0 or k <= 0:
+        return []
+    query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+
+    norms = np.linalg.norm(candidates, axis=1)
+    norms[norms == 0] = 1.0
+    candidates = candidates / norms[:, None]
+    query_norm = np.linalg.norm(query)
+    query = query / (query_norm if query_norm else 1.0)
+
+    relevance = candidates @ query
+    max_redundancy = np.full(len(candidates), -np.inf, dtype=np.float32)
+    available = np.ones(len(candidates), dtype=bool)
+    selected = []
+
+    for _ in range(min(k, len(candidates))):
+        if selected:
+            scores = lambda_mult * relevance - (1.0 - lambda_mult) * max_redundancy
+        else:
+            scores = relevance.copy()
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_redundancy, candidates @ candidates[best], out=max_redundancy)
+    return selected
+
+
+class MMRRetriever(BaseRetriever):
+    """
+    Retrieves fetch_k candidates with their vectors in one index query and
+    re-ranks them with the vectorized mmr_select.
+
+    Works with any vector store exposing a Pinecone-style `_index.query` plus
+    `_namespace` and `_text_key`, which covers both PineconeVectorStore and
+    local_index.LocalVectorStore.
+
+    Vectors stored without their text (see rag_core.metadata_policy) are
+    hydrated from chunk_store after re-ranking, in one bulk fetch for just the
+    k selected chunks.
+    """
+
+    vector_store: Any
+    k: int = 5
+    fetch_k: int = 50
+    lambda_mult: float = 0.5
+    filter: Any = None
+    chunk_store: Any = None
+
+    def _fetch_candidates(self, query_embedding):
+        response = self.vector_store._index.query(
+            vector=list(query_embedding),
+            top_k=self.fetch_k,
+            namespace=self.vector_store._namespace,
+            filter=self.filter,
+            include_values=True,
+            include_metadata=True,
+        )
+        return response["matches"]
+
+    def _to_document(self, match, texts: dict = None) -> Document:
+        metadata = dict(match["metadata"] or {})
+        text = metadata.pop(self.vector_store._text_key, None)
+        if text is None:
+            text = (texts or {}).get(match["id"], "")
+        return Document(page_content=text, metadata=metadata)
+
+    def _side_texts(self, matches) -> dict:
+        """Fetches the texts of matches whose text is not stored on the vector."""
+        if self.chunk_store is None:
+            return {}
+        ids = [m["id"] for m in matches if self.vector_store._text_key not in (m["metadata"] or {})]
+        return self.chunk_store.get_many(self.vector_store._namespace, ids) if ids else {}
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None):
+        with telemetry.span("retrieval.embed_query"):
+            query_embedding = self.vector_store.embeddings.embed_query(query)
+        with telemetry.span("retrieval.query", top_k=self.fetch_k) as span:
+            matches = self._fetch_candidates(query_embedding)
+            span.set(candidates=len(matches))
+        if not matches:
+            return []
+        with telemetry.span("retrieval.mmr", candidates=len(matches)):
+            selected = mmr_select(
+                query_embedding, [m["values"] for m in matches], k=self.k, lambda_mult=self.lambda_mult
+            )
+        selected = [matches[i] for i in selected]
+        with telemetry.span("retrieval.hydrate") as span:
+            texts = self._side_texts(selected)
+            span.set(chunks=len(texts))
+        return [self._to_document(match, texts) for match in selected]
@@ -1,32 +1,60 @@
 # s3_utils.py
 
 import streamlit as st
-import boto3
-import os
+import aws_clients
+import io
 import json
-from botocore.exceptions import ClientError
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import BotoCoreError, ClientError
+from boto3.s3.transfer import TransferConfig, S3UploadFailedError
 
 
 def get_s3_client():
-    """Initializes and returns a boto3 S3 client using credentials from st.secrets."""
-    return boto3.client(
-        's3',
-        aws_access_key_id=st.secrets["AWS_ACCESS_KEY_ID"],
-        aws_secret_access_key=st.secrets["AWS_SECRET_ACCESS_KEY"],
-        region_name=st.secrets["AWS_REGION"]
-    )
+    """Returns the shared, pooled boto3 S3 client."""
+    return aws_clients.get_client('s3')
 
 
-def upload_file_to_s3(file_bytes, bucket_name, object_name):
-    """Uploads file bytes to an S3 bucket."""
-    s3_client = get_s3_client()
-    try:
-        s3_client.put_object(Bucket=bucket_name, Key=object_name, Body=file_bytes)
-        st.info(f"📄 Uploaded '{os.path.basename(object_name)}' to S3.")
-        return True
-    except ClientError as e:
-        st.error(f"Error uploading to S3: {e}")
-        return False
+class BackgroundUploader:
+    """
+    Uploads files to S3 on a bounded thread pool while the caller carries on.
+
+    Files above multipart_threshold_mb go up as multipart uploads whose parts
+    are also sent in parallel. Nothing here touches Streamlit: the caller
+    collects the outcome with results() and decides how to report it.
+    """
+
+    def __init__(self, bucket_name, max_workers=8, multipart_threshold_mb=8, part_concurrency=4):
+        self.bucket_name = bucket_name
+        self._config = TransferConfig(
+            multipart_threshold=int(multipart_threshold_mb * 1024 * 1024),
+            multipart_chunksize=int(multipart_threshold_mb * 1024 * 1024),
+            max_concurrency=part_concurrency,
+        )
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="s3-upload")
+        self._futures = {}
+
+    def _upload(self, source, object_name):
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            get_s3_client().upload_fileobj(io.BytesIO(source), self.bucket_name, object_name, Config=self._config)
+        else:
+            get_s3_client().upload_file(source, self.bucket_name, object_name, Config=self._config)
+
+    def submit(self, source, object_name):
+        """Queues an upload of a local file path, or of in-memory bytes."""
+        self._futures[object_name] = self._pool.submit(self._upload, source, object_name)
+
+    def results(self):
+        """Waits for every submitted upload. Returns {object_name: error message, or None on success}."""
+        outcome = {}
+        for object_name, future in self._futures.items():
+            try:
+                future.result()
+                outcome[object_name] = None
+            except (BotoCoreError, ClientError, S3UploadFailedError) as e:
+                outcome[object_name] = str(e)
+        self._pool.shutdown()
+        return outcome
 
 
 # --- NEW FUNCTIONS ---
@@ -63,6 +91,97 @@ def load_json_from_s3(bucket_name, object_name):
             return None
 
 
+def save_jsonl_to_s3(records, bucket_name, object_name, if_absent=False):
+    """
+    Saves a list of records as compact JSON Lines (one JSON object per line) to S3.
+
+    With if_absent=True the object is only created, never overwritten, and an
+    existing object makes this return False without reporting an error.
+    """
+    s3_client = get_s3_client()
+    condition = {'IfNoneMatch': '*'} if if_absent else {}
+    try:
+        body = "".join(json.dumps(r, separators=(',', ':'), ensure_ascii=False) + "\n" for r in records)
+        s3_client.put_object(
+            Bucket=bucket_name,
+            Key=object_name,
+            Body=body.encode('utf-8'),
+            ContentType='application/x-ndjson',
+            **condition
+        )
+        return True
+    except ClientError as e:
+        if if_absent and e.response['Error']['Code'] in ('PreconditionFailed', 'ConditionalRequestConflict', '412', '409'):
+            return False
+        st.error(f"Error saving JSON Lines to S3: {e}")
+        return False
+
+
+def load_jsonl_from_s3(bucket_name, object_name):
+    """Loads a JSON Lines file from S3 as a list of records, or None if it doesn't exist."""
+    s3_client = get_s3_client()
+    try:
+        response = s3_client.get_object(Bucket=bucket_name, Key=object_name)
+        content = response['Body'].read().decode('utf-8')
+        return [json.loads(line) for line in content.splitlines() if line]
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'NoSuchKey':
+            return None
+        else:
+            st.error(f"Error loading JSON Lines from S3: {e}")
+            return None
+
+
+def load_json_if_changed(bucket_name, object_name, etag=None):
+    """
+    Conditionally loads a JSON file from S3 using its ETag.
+
+    Returns (data, etag, changed). If the object still has the given ETag, S3
+    answers 304 Not Modified without a body and (None, etag, False) is returned.
+    A missing object returns (None, None, True).
+    """
+    s3_client = get_s3_client()
+    kwargs = {'IfNoneMatch': etag} if etag else {}
+    try:
+        response = s3_client.get_object(Bucket=bucket_name, Key=object_name, **kwargs)
+        content = response['Body'].read().decode('utf-8')
+        return json.loads(content), response['ETag'], True
+    except ClientError as e:
+        code = e.response['Error']['Code']
+        if code in ('304', 'NotModified'):
+            return None, etag, False
+        if code == 'NoSuchKey':
+            return None, None, True
+        st.error(f"Error loading JSON from S3: {e}")
+        return None, etag, False
+
+
+def save_json_if_unchanged(data, bucket_name, object_name, etag=None):
+    """
+    Saves a JSON file to S3 only if nobody else has written it since it was read.
+
+    Pass the ETag it was read with, or None if it must not exist yet. Returns
+    the new ETag, or None if the precondition failed and the caller should
+    re-read and retry.
+    """
+    s3_client = get_s3_client()
+    condition = {'IfMatch': etag} if etag else {'IfNoneMatch': '*'}
+    try:
+        response = s3_client.put_object(
+            Bucket=bucket_name,
+            Key=object_name,
+            Body=json.dumps(data, separators=(',', ':')).encode('utf-8'),
+            ContentType='application/json',
+            **condition
+        )
+        return response['ETag']
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('PreconditionFailed', 'ConditionalRequestConflict', '412', '409'):
+            return None
+        st.error(f"Error saving JSON to S3: {e}")
+        return None
+
+
 def list_folders_in_s3(bucket_name, prefix):
     """Lists 'subdirectories' (common prefixes) in an S3 bucket for a user."""
     s3_client = get_s3_client()
@@ -86,18 +205,96 @@ def list_folders_in_s3(bucket_name, prefix):
         return []
 
 
-def delete_folder_from_s3(bucket_name, prefix):
-    """Deletes all objects within a 'folder' in S3."""
+def download_file_from_s3(bucket_name, object_name, path):
+    """Downloads an object to a local file, in parallel parts if it is large. Raises ClientError on failure."""
+    get_s3_client().download_file(bucket_name, object_name, path)
+
+
+def delete_file_from_s3(bucket_name, object_name):
+    """Deletes a single object from an S3 bucket."""
     s3_client = get_s3_client()
     try:
-        # List all objects with the given prefix
-        objects_to_delete_response = s3_client.list_objects_v2(Bucket=bucket_name, Prefix=prefix)
-
-        if 'Contents' in objects_to_delete_response:
-            # Format the list for the delete_objects call
-            delete_keys = {'Objects': [{'Key': obj['Key']} for obj in objects_to_delete_response['Contents']]}
-            s3_client.delete_objects(Bucket=bucket_name, Delete=delete_keys)
+        s3_client.delete_object(Bucket=bucket_name, Key=object_name)
         return True
     except ClientError as e:
-        st.error(f"Error deleting knowledge base from S3: {e}")
-        return False
\ No newline at end of file
+        st.error(f"Error deleting file from S3: {e}")
+        return False
+
+
+S3_DELETE_BATCH = 1000
+
+
+def _delete_batch(bucket_name, keys):
+    """Deletes up to 1,000 keys in one request. Returns (deleted_count, per-object errors)."""
+    try:
+        response = get_s3_client().delete_objects(
+            Bucket=bucket_name,
+            Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True}
+        )
+    except ClientError as e:
+        error = e.response['Error']
+        return 0, [{'Key': key, 'Code': error.get('Code'), 'Message': error.get('Message')} for key in keys]
+    errors = [
+        {'Key': err.get('Key'), 'Code': err.get('Code'), 'Message': err.get('Message')}
+        for err in response.get('Errors', [])
+    ]
+    return len(keys) - len(errors), errors
+
+
+def delete_prefix(bucket_name, prefix, max_workers=8, on_progress=None):
+    """
+    Deletes every object under a prefix, however many there are.
+
+    The listing is paginated and each page of up to 1,000 keys is sent as one
+    delete_objects request on a thread pool, so deletes overlap with listing.
+    Does not touch Streamlit, so it can run from a background thread.
+
+    Returns {"deleted": int, "errors": [{"Key", "Code", "Message"}, ...]}.
+    on_progress(deleted_so_far), if given, is called from worker threads.
+    """
+    report = {"deleted": 0, "errors": []}
+    lock = threading.Lock()
+
+    def delete(keys):
+        deleted, errors = _delete_batch(bucket_name, keys)
+        with lock:
+            report["deleted"] += deleted
+            report["errors"].extend(errors)
+            so_far = report["deleted"]
+        if on_progress:
+            on_progress(so_far)
+
+    paginator = get_s3_client().get_paginator('list_objects_v2')
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = []
+        try:
+            for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix,
+                                           PaginationConfig={'PageSize': S3_DELETE_BATCH}):
+                keys = [obj['Key'] for obj in page.get('Contents', [])]
+                for start in range(0, len(keys), S3_DELETE_BATCH):
+                    futures.append(pool.submit(delete, keys[start:start + S3_DELETE_BATCH]))
+        except ClientError as e:
+            error = e.response['Error']
+            report["errors"].append({'Key': prefix, 'Code': error.get('Code'), 'Message': error.get('Message')})
+        for future in futures:
+            future.result()
+    return report
+
+
+def delete_keys(bucket_name, keys, max_workers=8):
+    """
+    Deletes the given keys in batches of up to 1,000, sent concurrently.
+
+    Returns {"deleted": int, "errors": [{"Key", "Code", "Message"}, ...]}, like delete_prefix.
+    """
+    keys = list(keys)
+    batches = [keys[start:start + S3_DELETE_BATCH] for start in range(0, len(keys), S3_DELETE_BATCH)]
+    report = {"deleted": 0, "errors": []}
+    if not batches:
+        return report
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as pool:
+        for deleted, errors in pool.map(lambda batch: _delete_batch(bucket_name, batch), batches):
+            report["deleted"] += deleted
+            report["errors"].extend(errors)
+    return report
+
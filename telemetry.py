@@ -0,0 +1,411 @@
+# telemetry.py
+
+import sys
+import json
+import time
+import uuid
+import logging
+import threading
+import contextvars
+import collections
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Tracing spans for the RAG pipeline and every AWS call, with no Streamlit
+# dependency so they work on worker threads, in extraction processes and in
+# the offline benchmarks.
+#
+# A span records a named stage, its duration, its status and attributes such as
+# byte, chunk and token counts. Spans nest through a context variable, so a
+# stage started inside another becomes its child and shares its trace ID.
+# Threads started with a copied context (contextvars.copy_context) keep the
+# parent. Finished spans are:
+#
+#   * written as one JSON line each to the "chatmydocs.telemetry" logger when
+#     JSON logs are enabled (see configure),
+#   * aggregated per span name into Prometheus-style histograms and counters,
+#     served as text on /metrics when a metrics port is configured,
+#   * kept in a bounded buffer of recent spans for the in-app latency panel.
+#
+# Components with their own counters (caches, the embedding executor) register
+# them with register_stats(); they are served as gauges next to the spans.
+#
+# Extraction runs in separate processes, whose spans would otherwise be lost:
+# capture() collects them there instead, and replay() records them in the
+# parent process under the span that was current when the file was submitted.
+
+logger = logging.getLogger("chatmydocs.telemetry")
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+COUNTED_ATTRIBUTES = ("bytes", "bytes_sent", "bytes_received", "chunks", "documents", "files", "tokens",
+                      "input_tokens", "output_tokens", "vectors")
+RECENT_SPANS = 5000
+
+_current = contextvars.ContextVar("telemetry_span", default=None)
+_captured = contextvars.ContextVar("telemetry_capture", default=None)
+
+
+class Span:
+    """One timed stage. Use span() or start()/end() rather than creating it directly."""
+
+    def __init__(self, name: str, parent=None, attrs: dict = None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.start_time = time.time()
+        self.status = "ok"
+        self.attrs = dict(attrs or {})
+        self._t0 = time.perf_counter()
+        self._ended = False
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+        return self
+
+    def add(self, key: str, n):
+        self.attrs[key] = self.attrs.get(key, 0) + n
+        return self
+
+    def end(self, status: str = None, seconds: float = None):
+        """Finishes the span; later calls are ignored."""
+        if self._ended:
+            return
+        self._ended = True
+        if status:
+            self.status = status
+        _finish(self.to_dict(time.perf_counter() - self._t0 if seconds is None else seconds))
+
+    def to_dict(self, seconds: float) -> dict:
+        return {
+            "span": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": round(self.start_time, 6),
+            "duration_ms": round(seconds * 1000, 3),
+            "status": self.status,
+            "attrs": self.attrs,
+        }
+
+
+def current():
+    """Returns the span active in this context, or None."""
+    return _current.get()
+
+
+def start(name: str, parent=None, **attrs) -> Span:
+    """Starts a span without activating it; call end() on it when the stage is over."""
+    return Span(name, parent or _current.get(), attrs)
+
+
+@contextmanager
+def use(span: Span):
+    """Makes span the parent of spans started in this block."""
+    token = _current.set(span)
+    try:
+        yield span
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Times the enclosed block as a child of the current span. Exceptions mark it as failed and propagate."""
+    s = start(name, **attrs)
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.status = "error"
+        s.attrs.setdefault("error", type(e).__name__)
+        raise
+    finally:
+        _current.reset(token)
+        s.end()
+
+
+def record(name: str, seconds: float, parent=None, status: str = "ok", **attrs):
+    """Records a stage that was timed elsewhere, as ending now."""
+    s = Span(name, parent or _current.get(), attrs)
+    s.start_time = time.time() - seconds
+    s.end(status, seconds)
+
+
+@contextmanager
+def capture():
+    """Collects the spans finished in this block into a list instead of recording them."""
+    spans = []
+    token = _captured.set(spans)
+    try:
+        yield spans
+    finally:
+        _captured.reset(token)
+
+
+def replay(spans, parent=None):
+    """Records spans collected by capture(), attaching their roots to parent (the current span by default)."""
+    parent = parent or _current.get()
+    for data in spans:
+        data = dict(data)
+        if parent is not None:
+            if data["parent_id"] is None:
+                data["parent_id"] = parent.span_id
+            data["trace_id"] = parent.trace_id
+        _finish(data)
+
+
+# --- Aggregation -----------------------------------------------------------
+
+class _Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counts = collections.Counter()
+        self.totals = collections.Counter()
+        self.recent = collections.deque(maxlen=RECENT_SPANS)
+
+    def observe(self, data: dict):
+        seconds = data["duration_ms"] / 1000
+        name = data["span"]
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = {"buckets": [0] * len(DURATION_BUCKETS), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += seconds
+            histogram["count"] += 1
+            self.counts[(name, data["status"])] += 1
+            for key in COUNTED_ATTRIBUTES:
+                value = data["attrs"].get(key)
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    self.totals[(name, key)] += value
+            self.recent.append((name, seconds, data["status"]))
+
+    def snapshot(self):
+        with self._lock:
+            return ({k: {**v, "buckets": list(v["buckets"])} for k, v in self.histograms.items()},
+                    dict(self.counts), dict(self.totals), list(self.recent))
+
+
+_registry = _Registry()
+_json_logs = False
+
+
+def _finish(data: dict):
+    captured = _captured.get()
+    if captured is not None:
+        captured.append(data)
+        return
+    _registry.observe(data)
+    if _json_logs:
+        logger.info(json.dumps(data, default=str, separators=(",", ":")))
+
+
+def _percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def summary() -> list:
+    """
+    Returns one row per span name over the recent spans: count, errors,
+    p50/p95/p99 and mean latency in milliseconds, plus lifetime totals of the
+    counted attributes. Rows are sorted by total time spent, largest first.
+    """
+    _, _, totals, recent = _registry.snapshot()
+    by_name = collections.defaultdict(list)
+    errors = collections.Counter()
+    for name, seconds, status in recent:
+        by_name[name].append(seconds)
+        if status != "ok":
+            errors[name] += 1
+    rows = []
+    for name, values in by_name.items():
+        values.sort()
+        row = {
+            "stage": name,
+            "count": len(values),
+            "errors": errors[name],
+            "p50_ms": round(_percentile(values, 0.50) * 1000, 1),
+            "p95_ms": round(_percentile(values, 0.95) * 1000, 1),
+            "p99_ms": round(_percentile(values, 0.99) * 1000, 1),
+            "mean_ms": round(sum(values) / len(values) * 1000, 1),
+            "total_s": round(sum(values), 2),
+        }
+        for key in COUNTED_ATTRIBUTES:
+            if (name, key) in totals:
+                row[key] = totals[(name, key)]
+        rows.append(row)
+    return sorted(rows, key=lambda r: r["total_s"], reverse=True)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def render_prometheus() -> str:
+    """Renders all aggregated spans in the Prometheus text exposition format."""
+    histograms, counts, totals, _ = _registry.snapshot()
+    lines = [
+        "# HELP chatmydocs_span_duration_seconds Duration of traced pipeline stages and AWS calls.",
+        "# TYPE chatmydocs_span_duration_seconds histogram",
+    ]
+    for name in sorted(histograms):
+        h = histograms[name]
+        label = f'span="{_escape(name)}"'
+        for bound, n in zip(DURATION_BUCKETS, h["buckets"]):
+            lines.append(f'chatmydocs_span_duration_seconds_bucket{{{label},le="{bound}"}} {n}')
+        lines.append(f'chatmydocs_span_duration_seconds_bucket{{{label},le="+Inf"}} {h["count"]}')
+        lines.append(f"chatmydocs_span_duration_seconds_sum{{{label}}} {h['sum']:.6f}")
+        lines.append(f"chatmydocs_span_duration_seconds_count{{{label}}} {h['count']}")
+
+    lines += ["# HELP chatmydocs_spans_total Finished spans by status.", "# TYPE chatmydocs_spans_total counter"]
+    for (name, status), n in sorted(counts.items()):
+        lines.append(f'chatmydocs_spans_total{{span="{_escape(name)}",status="{_escape(status)}"}} {n}')
+
+    lines += ["# HELP chatmydocs_span_attribute_total Sum of counted span attributes (bytes, chunks, tokens, ...).",
+              "# TYPE chatmydocs_span_attribute_total counter"]
+    for (name, key), total in sorted(totals.items()):
+        lines.append(f'chatmydocs_span_attribute_total{{span="{_escape(name)}",attribute="{key}"}} {total}')
+
+    for component, values in stats().items():
+        description = _stats_sources[component][1]
+        for key, value in values.items():
+            metric = f"chatmydocs_{component}_{key}"
+            lines += [f"# HELP {metric} {description}", f"# TYPE {metric} gauge", f"{metric} {value}"]
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_server = None
+_config_lock = threading.Lock()
+
+
+def configure(json_logs: bool = False, metrics_port: int = None, metrics_host: str = "127.0.0.1"):
+    """
+    Turns on the exporters: JSON span logs on stderr, and a /metrics endpoint on
+    metrics_port. Streamlit cannot serve extra routes, so metrics get their own
+    small HTTP server, started once per process. It has no authentication, so it
+    listens on loopback unless metrics_host says otherwise.
+    """
+    global _json_logs, _server
+    with _config_lock:
+        _json_logs = bool(json_logs)
+        if _json_logs and not logger.handlers:
+            handler = logging.StreamHandler(sys.stderr)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+        if metrics_port and _server is None:
+            _server = ThreadingHTTPServer((metrics_host, int(metrics_port)), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+
+
+# --- Component counters ----------------------------------------------------
+
+_stats_sources = {}
+
+
+def register_stats(component: str, fn, description: str):
+    """
+    Exposes a component's counters, returned by fn() as {name: number}, as
+    chatmydocs_<component>_<name> gauges on /metrics and through stats().
+    Registering a component again replaces its source.
+    """
+    with _config_lock:
+        _stats_sources[component] = (fn, description)
+
+
+def stats() -> dict:
+    """Returns {component: {name: number}} from every registered source. Sources that fail are left out."""
+    with _config_lock:
+        sources = sorted(_stats_sources.items())
+    result = {}
+    for component, (fn, _) in sources:
+        try:
+            values = fn()
+        except Exception:
+            logger.debug("Reading the %s counters failed", component, exc_info=True)
+            continue
+        result[component] = {k: v for k, v in values.items() if isinstance(v, (int, float)) and not isinstance(v, bool)}
+    return result
+
+
+# --- AWS calls -------------------------------------------------------------
+
+def _before_aws_call(params=None, context=None, **kwargs):
+    if context is None:
+        return
+    context["telemetry_t0"] = time.perf_counter()
+    context["telemetry_bytes_sent"] = _body_size((params or {}).get("body"))
+
+
+def _body_size(body) -> int:
+    if isinstance(body, str):
+        return len(body.encode("utf-8"))
+    if isinstance(body, (bytes, bytearray)):
+        return len(body)
+    try:
+        # Streamed uploads: measure what is left to send without moving the stream.
+        position = body.tell()
+        size = body.seek(0, 2) - position
+        body.seek(position)
+        return size
+    except Exception:
+        return 0
+
+
+def _aws_span_name(event_name: str) -> str:
+    # Event names look like "after-call.s3.GetObject".
+    _, service, operation = event_name.split(".", 2)
+    return f"aws.{service}.{operation}"
+
+
+def _after_aws_call(http_response=None, context=None, event_name="", **kwargs):
+    if context is None or "telemetry_t0" not in context:
+        return
+    status_code = getattr(http_response, "status_code", 0)
+    headers = getattr(http_response, "headers", {}) or {}
+    try:
+        received = int(headers.get("content-length", 0))
+    except (TypeError, ValueError):
+        received = 0
+    record(_aws_span_name(event_name), time.perf_counter() - context["telemetry_t0"],
+           status="error" if status_code >= 400 else "ok", http_status=status_code,
+           bytes_sent=context.get("telemetry_bytes_sent", 0), bytes_received=received)
+
+
+def _after_aws_call_error(exception=None, context=None, event_name="", **kwargs):
+    if context is None or "telemetry_t0" not in context:
+        return
+    record(_aws_span_name(event_name), time.perf_counter() - context["telemetry_t0"], status="error",
+           error=type(exception).__name__, bytes_sent=context.get("telemetry_bytes_sent", 0))
+
+
+def instrument_client(client):
+    """Records a span for every API call a boto3 client makes, retries included, via botocore's event hooks."""
+    events = client.meta.events
+    events.register("before-call", _before_aws_call, unique_id="telemetry-before-call")
+    events.register("after-call", _after_aws_call, unique_id="telemetry-after-call")
+    events.register("after-call-error", _after_aws_call_error, unique_id="telemetry-after-call-error")
+    return client
@@ -0,0 +1,47 @@
+# tests/conftest.py
+
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Repo modules, and the offline stand-ins the tests share with the benchmarks.
+sys.path[:0] = [REPO_DIR, os.path.join(REPO_DIR, "benchmarks")]
+
+import fakes  # noqa: E402
+
+# Like the benchmarks, tests run against the headless Streamlit stand-in.
+st = fakes.use_headless_streamlit({})
+
+
+@pytest.fixture
+def services(tmp_path, monkeypatch):
+    """
+    Wires the offline stand-ins for S3, DynamoDB, Bedrock and Pinecone into
+    the repo modules, with every cache under tmp_path and no process-wide
+    state left over from an earlier test.
+    """
+    fakes.use_headless_streamlit({
+        "S3_BUCKET_NAME": "test-bucket",
+        "PINECONE_API_KEY": "offline",
+        "PINECONE_INDEX_NAME": "offline",
+        "VECTOR_BACKEND": "pinecone",
+        "EXTRACTION_WORKERS": 1,
+        "EMBEDDING_CACHE_DIR": str(tmp_path / "embeddings"),
+        "EXTRACTION_CACHE_DIR": str(tmp_path / "extraction"),
+        "OCR_CACHE_DIR": str(tmp_path / "ocr"),
+        "CHUNK_TEXT_CACHE_DIR": str(tmp_path / "chunks"),
+        "LOCAL_INDEX_DIR": str(tmp_path / "vectors"),
+    })
+    import rag_core
+    for name in ("_embedding_cache", "_cached_embeddings", "_extraction_cache", "_local_index", "_chunk_store",
+                 "_chain_cache", "_answer_cache"):
+        monkeypatch.setattr(rag_core, name, None)
+    monkeypatch.setattr(rag_core, "_pinecone_index", rag_core._pinecone_index)
+    monkeypatch.setattr(rag_core, "PineconeVectorStore", rag_core.PineconeVectorStore)
+    monkeypatch.setattr(rag_core, "BedrockChat", rag_core.BedrockChat)
+    import catalog
+    catalog._cache.clear()
+    st.messages.clear()
+    return fakes.install()
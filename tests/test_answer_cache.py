@@ -0,0 +1,62 @@
+# tests/test_answer_cache.py
+
+import fakes
+import rag_core
+from answer_cache import SemanticAnswerCache
+
+
+def cache(**kwargs):
+    now = [0.0]
+    return SemanticAnswerCache(threshold=0.95, clock=lambda: now[0], **kwargs), now
+
+
+def test_similar_question_hits_and_records_latency_saved():
+    answers, _ = cache()
+    answers.store("alice-notes", "What is MMR?", [1.0, 0.0], "Maximal marginal relevance.", ["a.pdf"], 2.5)
+    entry, similarity = answers.lookup("alice-notes", [0.99, 0.1])
+    assert entry["answer"] == "Maximal marginal relevance." and entry["sources"] == ["a.pdf"]
+    assert similarity > 0.99
+    stats = answers.stats()
+    assert (stats["hits"], stats["misses"], stats["latency_saved_seconds"]) == (1, 0, 2.5)
+
+
+def test_question_below_the_threshold_misses():
+    answers, _ = cache()
+    answers.store("alice-notes", "What is MMR?", [1.0, 0.0], "Maximal marginal relevance.", [], 2.5)
+    # Cosine similarity 0.8.
+    assert answers.lookup("alice-notes", [0.8, 0.6]) is None
+    assert answers.stats()["misses"] == 1
+
+
+def test_namespaces_are_isolated():
+    answers, _ = cache()
+    answers.store("alice-notes", "What is MMR?", [1.0, 0.0], "From Alice's notes.", [], 1.0)
+    assert answers.lookup("bob-notes", [1.0, 0.0]) is None
+    answers.invalidate("alice-notes")
+    assert answers.lookup("alice-notes", [1.0, 0.0]) is None
+
+
+def test_entries_expire():
+    answers, now = cache(ttl_seconds=60)
+    answers.store("alice-notes", "What is MMR?", [1.0, 0.0], "Maximal marginal relevance.", [], 1.0)
+    now[0] = 61.0
+    assert answers.lookup("alice-notes", [1.0, 0.0]) is None
+    assert answers.stats()["entries"] == 0
+
+
+def ask(chain, namespace, question):
+    stream = rag_core.stream_answer(chain, namespace, question)
+    text = "".join(stream)
+    return text, stream.result["cached"]
+
+
+def test_stream_answer_reuses_an_answer_only_within_its_namespace(services, monkeypatch):
+    monkeypatch.setattr(rag_core, "BedrockChat", fakes.scripted_chat_model(0.0, 0.0))
+    chains = {ns: rag_core.create_conversational_chain(rag_core.load_vector_store(ns, backend="pinecone"))
+              for ns in ("alice-notes", "bob-notes")}
+
+    answer, cached = ask(chains["alice-notes"], "alice-notes", "What is MMR?")
+    assert not cached
+    assert ask(chains["alice-notes"], "alice-notes", "What is MMR?") == (answer, True)
+    assert not ask(chains["bob-notes"], "bob-notes", "What is MMR?")[1]
+    assert rag_core.answer_cache_stats()["hits"] == 1
@@ -0,0 +1,77 @@
+# tests/test_auth.py
+
+import pytest
+
+import auth
+import fakes
+
+
+@pytest.fixture
+def table(services, monkeypatch):
+    monkeypatch.setattr(auth, "_migrated", False)
+    auth._user_cache.clear()
+    auth._all_users_cache.clear()
+    table = services.dynamodb.Table("chatmydocs_users")
+    scans = []
+    scan = table.scan
+    monkeypatch.setattr(table, "scan", lambda **kwargs: scans.append(kwargs) or scan(**kwargs))
+    table.scans = scans
+    return table
+
+
+def add_user(table, username, email=None):
+    table.put_item(Item={"username": username, "name": username, "email": email or f"{username}@example.com",
+                         "password": "hash"})
+
+
+def test_legacy_mixed_case_users_are_migrated_once(table, monkeypatch):
+    add_user(table, "Alice")
+    add_user(table, "bob")
+    assert auth.migrate_usernames() == 1
+    assert auth.UserDirectory()["alice"]["email"] == "Alice@example.com"
+    assert len(table.scans) == 1
+
+    # Another server process only reads the marker.
+    monkeypatch.setattr(auth, "_migrated", False)
+    assert auth.migrate_usernames() == 0
+    assert len(table.scans) == 1
+
+
+def test_unknown_users_never_scan(table):
+    auth.migrate_usernames()
+    directory = auth.UserDirectory()
+    for _ in range(3):
+        assert "nobody" not in directory
+    assert len(table.scans) == 1
+
+
+def test_migration_keeps_an_existing_lower_case_account(table):
+    add_user(table, "Carol")
+    add_user(table, "carol", email="other@example.com")
+    assert auth.migrate_usernames() == 0
+    assert auth.UserDirectory()["carol"]["email"] == "other@example.com"
+    assert auth.username_exists("CAROL")
+
+
+def test_failed_migration_reports_and_can_be_rerun(table, monkeypatch):
+    add_user(table, "Dave")
+    scan = table.scan
+
+    def denied(**kwargs):
+        raise fakes._client_error("AccessDeniedException", "Scan")
+
+    monkeypatch.setattr(table, "scan", denied)
+    assert auth.migrate_usernames() is None
+    assert not auth._migrated
+    assert "nobody" not in auth.UserDirectory()
+
+    monkeypatch.setattr(table, "scan", scan)
+    assert auth.migrate_usernames() == 1
+
+
+def test_sessions_do_not_share_user_entries(table):
+    add_user(table, "erin")
+    first, second = auth.UserDirectory(), auth.UserDirectory()
+    first["erin"]["logged_in"] = True
+    assert "logged_in" not in second["erin"]
+    assert "logged_in" not in auth.get_user("erin")
@@ -0,0 +1,47 @@
+# tests/test_catalog.py
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import catalog
+import fakes
+
+BUCKET = "test-bucket"
+
+
+def test_concurrent_writes_to_one_catalog_all_land(services):
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        assert all(pool.map(lambda i: catalog.add_ingest(BUCKET, "alice", f"kb{i}", f"KB {i}"), range(16)))
+    catalog._cache.clear()
+    assert sorted(catalog.load_catalog(BUCKET, "alice", None)["ingests"]) == sorted(f"kb{i}" for i in range(16))
+
+
+def test_writes_for_other_users_are_not_held_up(services):
+    lock = catalog._write_lock(BUCKET, "alice")
+    with lock:
+        done = threading.Event()
+        threading.Thread(target=lambda: catalog.add_ingest(BUCKET, "bob", "kb", "KB") and done.set()).start()
+        assert done.wait(5)
+    del lock
+    assert not catalog._write_locks
+
+
+def test_unreadable_catalog_is_not_rebuilt(services, monkeypatch):
+    catalog.add_ingest(BUCKET, "alice", "kb", "KB")
+    catalog._cache.clear()
+    get_object, put_object = services.s3.get_object, services.s3.put_object
+
+    def denied(**kwargs):
+        raise fakes._client_error("AccessDenied", "GetObject", status=403)
+
+    monkeypatch.setattr(services.s3, "get_object", denied)
+    monkeypatch.setattr(services.s3, "put_object", lambda **kwargs: pytest.fail("wrote while the catalog was unreadable"))
+    monkeypatch.setattr(services.s3, "get_paginator", lambda *args: pytest.fail("rebuilt the catalog"))
+    assert catalog.load_catalog(BUCKET, "alice", None) == catalog._empty_catalog()
+    assert not catalog.add_ingest(BUCKET, "alice", "other", "Other")
+
+    monkeypatch.setattr(services.s3, "get_object", get_object)
+    monkeypatch.setattr(services.s3, "put_object", put_object)
+    assert list(catalog.load_catalog(BUCKET, "alice", None)["ingests"]) == ["kb"]
@@ -0,0 +1,53 @@
+# tests/test_chat_store.py
+
+from concurrent.futures import ThreadPoolExecutor
+
+import chat_store
+import s3_utils
+
+BUCKET = "test-bucket"
+PREFIX = "alice/notes/"
+
+
+def turn(session, i):
+    return [{"role": "user", "content": f"{session} {i}"}, {"role": "assistant", "content": f"re: {session} {i}"}]
+
+
+def all_messages():
+    messages, start = chat_store.load_page(BUCKET, PREFIX)
+    while start:
+        older, start = chat_store.load_page(BUCKET, PREFIX, end=start)
+        messages = older + messages
+    return messages
+
+
+def test_a_write_between_read_and_save_is_kept(services, monkeypatch):
+    chat_store.append_messages(BUCKET, PREFIX, turn("a", 0))
+    load = s3_utils.load_json_if_changed
+    interleaved = []
+
+    def load_then_interleave(*args, **kwargs):
+        result = load(*args, **kwargs)
+        if not interleaved:
+            interleaved.append(True)
+            chat_store.append_messages(BUCKET, PREFIX, turn("b", 0))
+        return result
+
+    monkeypatch.setattr(s3_utils, "load_json_if_changed", load_then_interleave)
+    assert chat_store.append_messages(BUCKET, PREFIX, turn("a", 1))
+    monkeypatch.undo()
+    assert all_messages() == turn("a", 0) + turn("b", 0) + turn("a", 1)
+
+
+def test_concurrent_sessions_lose_no_messages(services):
+    def session(name):
+        for i in range(30):
+            assert chat_store.append_messages(BUCKET, PREFIX, turn(name, i))
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        list(pool.map(session, ["a", "b", "c"]))
+    messages = all_messages()
+    assert len(messages) == 3 * 30 * 2
+    for name in "abc":
+        mine = [m for m in messages if m["content"].split()[-2] == name]
+        assert mine == [m for i in range(30) for m in turn(name, i)]
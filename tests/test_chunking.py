@@ -0,0 +1,75 @@
+# tests/test_chunking.py
+
+import os
+import sys
+import subprocess
+
+from langchain_core.documents import Document
+
+import chunking
+
+TABLE = ["Quarter    Revenue    Cost", "Q1         1,200      900", "Q2         1,350      950",
+         "Q3         1,410      990", "Q4         1,600      1,020", "2023       5,560      3,860"]
+
+
+OPENINGS = ["Sales rose in the north.", "Costs fell after the merger.", "Hiring slowed down.",
+            "The new plant opened.", "Exports doubled."]
+CLOSINGS = ["See the appendix.", "Details follow below.", "More in chapter two.", "Figures are audited.",
+            "Outlook remains stable."]
+
+
+def paragraphs(n):
+    return [OPENINGS[n - 1], f"Revenue grew {n * 3}% in region {n}.", f"Paragraph {n} about revenue.",
+            CLOSINGS[n - 1]]
+
+
+def page(n, body):
+    return "\n".join([f"ACME Corp - Annual Report {2023}", "Confidential - internal use only", *body,
+                      f"Page {n} of 12"])
+
+
+def test_strips_running_headers_and_footers_but_keeps_the_first():
+    docs = [Document(page_content=page(n, paragraphs(n)), metadata={"source": "r.pdf"})
+            for n in range(1, 6)]
+    stripped = chunking.strip_repeated_lines(docs)
+    text = "\n".join(d.page_content for d in stripped)
+    assert text.count("Confidential - internal use only") == 1
+    assert text.count("ACME Corp - Annual Report") == 1
+    assert text.count("of 12") == 1
+    assert all(line in text for n in range(1, 6) for line in paragraphs(n))
+    assert [d.metadata for d in stripped] == [d.metadata for d in docs]
+
+
+def test_numeric_tables_survive():
+    # The same table layout on every page, ending every page: rows collapse to the
+    # same digit pattern but are content, not boilerplate.
+    docs = [Document(page_content=page(n, TABLE).rsplit("\n", 1)[0]) for n in range(1, 6)]
+    stripped = chunking.strip_repeated_lines(docs)
+    for doc in stripped:
+        for row in TABLE[1:]:
+            assert row in doc.page_content
+
+
+def test_short_and_body_lines_survive():
+    body = ["Total", "42", "Notes:", "Repeated sentence in the middle of every page.", "Closing remark."]
+    docs = [Document(page_content="\n".join(["Intro line one", "Intro two", "Intro three", *body,
+                                             "End a", "End b", f"End {n}"])) for n in range(5)]
+    stripped = chunking.strip_repeated_lines(docs)
+    for doc in stripped:
+        for line in ["Total", "42", "Notes:", "Repeated sentence in the middle of every page."]:
+            assert line in doc.page_content.split("\n")
+
+
+def test_form_feeds_split_a_document_into_pages():
+    doc = Document(page_content="\f".join(page(n, paragraphs(n)) for n in range(1, 6)))
+    [stripped] = chunking.strip_repeated_lines([doc])
+    pages = stripped.page_content.split("\f")
+    assert len(pages) == 5
+    assert sum("Confidential - internal use only" in p for p in pages) == 1
+    assert all(line in p for n, p in zip(range(1, 6), pages) for line in paragraphs(n))
+
+
+def test_importing_chunking_does_not_load_numpy():
+    # app.py imports chunking on the login page, for DEFAULT_CHUNKING only.
+    check = "import sys, chunking; assert 'numpy' not in sys.modules"
+    subprocess.run([sys.executable, "-c", check], cwd=os.path.dirname(chunking.__file__), check=True)
@@ -0,0 +1,158 @@
+# tests/test_ingest_jobs.py
+
+import threading
+import time
+
+import pytest
+from botocore.exceptions import EndpointConnectionError
+from langchain_core.documents import Document
+
+import catalog
+import ingest_jobs
+import jobs
+import rag_core
+import s3_utils
+from corpus import generate_corpus
+
+BUCKET = "test-bucket"
+USER = "alice"
+
+
+@pytest.fixture
+def items(tmp_path, services, monkeypatch):
+    """Six uploaded text files, with their originals in the KB's S3 folder as the app uploads them."""
+    def read_text(file_name, temp_path, ocr_options=None):
+        with open(temp_path, encoding="utf-8") as f:
+            return [Document(page_content=f.read(), metadata={"source": file_name})], None
+
+    # Parsing is not under test; Unstructured is not needed for plain text.
+    monkeypatch.setattr(rag_core, "_extract_file", read_text)
+    monkeypatch.setattr(rag_core, "CHECKPOINT_INTERVAL_SECONDS", 0.0)
+    files = generate_corpus(str(tmp_path / "corpus"), n_files=6, pages_per_file=24, seed=3)
+    for item in files:
+        services.s3.upload_file(item["path"], BUCKET, f"{USER}/biology/{item['name']}")
+    return files
+
+
+def stored_ids(services, namespace):
+    return set(services.index._namespaces.get(namespace, {}))
+
+
+def manifest_ids(manifest):
+    return {id_ for entry in manifest["files"].values() for id_ in entry["chunk_ids"]}
+
+
+def fail_upsert(services, on_call):
+    """Makes the on_call-th index upsert raise, as if Pinecone went away mid-run."""
+    upsert, calls = services.index.upsert, []
+
+    def flaky(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == on_call:
+            raise RuntimeError("index went away")
+        return upsert(*args, **kwargs)
+    services.index.upsert = flaky
+    return upsert
+
+
+def test_cancel_keeps_finished_files_and_a_rerun_finishes_the_rest(services, items):
+    job = jobs.Job(ingest_jobs.job_id(USER, "biology"), "ingest")
+    upsert = services.index.upsert
+
+    def cancel_after_a_few(*args, **kwargs):
+        result = upsert(*args, **kwargs)
+        if services.index.requests >= 3:
+            job.cancel()
+        return result
+    services.index.upsert = cancel_after_a_few
+
+    result = ingest_jobs.run(job, BUCKET, USER, "biology", "Biology", items, "pinecone")
+    manifest = result["manifest"]
+    assert result["report"]["cancelled"]
+    assert 0 < len(manifest["files"]) < len(items)
+    # Vectors of unfinished files were removed again.
+    assert stored_ids(services, f"{USER}-biology") == manifest_ids(manifest)
+    assert ingest_jobs.load_checkpoint(BUCKET, USER, "biology") is None
+    assert s3_utils.load_json_from_s3(BUCKET, f"{USER}/biology/source_documents.json") == manifest
+
+    services.index.upsert = upsert
+    rerun = ingest_jobs.run(jobs.Job(job.id, "ingest"), BUCKET, USER, "biology", "Biology", items, "pinecone",
+                            manifest=manifest)
+    assert rerun["report"]["skipped"] == len(manifest["files"])
+    assert set(rerun["manifest"]["files"]) == {item["name"] for item in items}
+    assert stored_ids(services, f"{USER}-biology") == manifest_ids(rerun["manifest"])
+
+
+def test_resume_after_a_failure_skips_finished_files(services, items):
+    upsert = fail_upsert(services, on_call=4)
+    job = jobs.Job(ingest_jobs.job_id(USER, "biology"), "ingest")
+    with pytest.raises(RuntimeError):
+        ingest_jobs.run(job, BUCKET, USER, "biology", "Biology", items, "pinecone")
+
+    checkpoint = ingest_jobs.load_checkpoint(BUCKET, USER, "biology")
+    assert checkpoint["failed"] and ingest_jobs.is_interrupted(checkpoint)
+    finished = set(checkpoint["manifest"]["files"])
+    assert finished and len(finished) < len(items)
+    assert "biology" in catalog.load_catalog(BUCKET, USER, None)["ingests"]
+
+    services.index.upsert = upsert
+    result = ingest_jobs.resume(jobs.Job(job.id, "ingest"), BUCKET, USER, "biology", checkpoint)
+    report, manifest = result["report"], result["manifest"]
+    assert report["skipped"] == len(finished)
+    assert report["files"] == len(items) - len(finished)
+    assert set(manifest["files"]) == {item["name"] for item in items}
+    assert stored_ids(services, f"{USER}-biology") == manifest_ids(manifest)
+    # Batches stored before the failure were not upserted again.
+    assert report["resumed"] == sum(len(ids) for ids in checkpoint["partial"].values())
+    assert ingest_jobs.load_checkpoint(BUCKET, USER, "biology") is None
+    user_catalog = catalog.load_catalog(BUCKET, USER, None)
+    assert "biology" in user_catalog["kbs"] and not user_catalog.get("ingests")
+
+
+def test_a_failed_upload_does_not_fail_the_ingest(services, items):
+    upload_file = services.s3.upload_file
+
+    def unreachable(Filename, Bucket, Key, **kwargs):
+        if Key.endswith(items[1]["name"]):
+            raise EndpointConnectionError(endpoint_url="https://s3.amazonaws.com")
+        return upload_file(Filename, Bucket, Key, **kwargs)
+    services.s3.upload_file = unreachable
+
+    uploader = s3_utils.BackgroundUploader(BUCKET, max_workers=2)
+    for item in items:
+        uploader.submit(item["path"], f"{USER}/biology/{item['name']}")
+    released = []
+    result = ingest_jobs.run(jobs.Job(ingest_jobs.job_id(USER, "biology"), "ingest"), BUCKET, USER, "biology",
+                             "Biology", items, "pinecone", uploader=uploader, release=released.extend)
+    assert list(result["upload_errors"]) == [items[1]["name"]]
+    assert released == items
+    assert len(result["manifest"]["files"]) == len(items)
+    assert s3_utils.load_json_from_s3(BUCKET, f"{USER}/biology/source_documents.json") == result["manifest"]
+
+
+def test_a_busy_job_keeps_its_checkpoint_fresh(services, items, monkeypatch):
+    monkeypatch.setattr(ingest_jobs, "HEARTBEAT_SECONDS", 0.05)
+    monkeypatch.setattr(ingest_jobs, "STALE_SECONDS", 0.3)
+    extract, release = rag_core._extract_file, threading.Event()
+
+    def slow_extract(file_name, temp_path, ocr_options=None):
+        # One long extraction that reports no progress, like OCR of a large scan.
+        release.wait(5)
+        return extract(file_name, temp_path, ocr_options)
+    monkeypatch.setattr(rag_core, "_extract_file", slow_extract)
+
+    job = jobs.submit("ingest", ingest_jobs.run, BUCKET, USER, "biology", "Biology", items[:1], "pinecone",
+                      job_id=ingest_jobs.job_id(USER, "biology"))
+    try:
+        time.sleep(0.6)
+        checkpoint = ingest_jobs.load_checkpoint(BUCKET, USER, "biology")
+        assert checkpoint is not None and not ingest_jobs.is_interrupted(checkpoint)
+    finally:
+        release.set()
+        while not job.done:
+            time.sleep(0.01)
+        jobs.forget(job.id)
+    assert job.error is None
+    time.sleep(0.2)
+    # The heartbeat stopped with the job, so the finished job's checkpoint stays deleted.
+    assert ingest_jobs.load_checkpoint(BUCKET, USER, "biology") is None
@@ -0,0 +1,68 @@
+# tests/test_local_index.py
+
+import numpy as np
+
+from local_index import LocalIndex, _Namespace
+
+
+def vectors(ids, seed):
+    rng = np.random.default_rng(seed)
+    return [{"id": i, "values": rng.normal(size=8).tolist(), "metadata": {"source": f"{i[0]}.txt"}} for i in ids]
+
+
+def assert_matches_disk(index, namespace):
+    """The view advanced in memory must equal a fresh load of the directory."""
+    view = index._namespace(namespace)
+    fresh = _Namespace(index._dir(namespace))
+    assert view.locations == fresh.locations
+    assert view.manifest["rows"] == {n: len(s.ids) for n, s in fresh.segments.items()}
+    for name, segment in fresh.segments.items():
+        assert (view.segments[name].alive == segment.alive).all()
+
+
+def test_writes_advance_the_loaded_view(tmp_path):
+    index = LocalIndex(str(tmp_path))
+    index.upsert(vectors([f"a{i}" for i in range(10)], 1), namespace="ns")
+    loaded = index._namespace("ns")
+    index.upsert(vectors([f"b{i}" for i in range(10)], 2), namespace="ns")
+    assert_matches_disk(index, "ns")
+    # The earlier view is untouched, so concurrent readers keep a consistent snapshot.
+    assert len(loaded) == 10
+
+    index.upsert(vectors(["a1", "b2"], 3), namespace="ns")
+    index.delete(ids=["a3"], namespace="ns")
+    assert_matches_disk(index, "ns")
+    assert index.describe_namespace("ns")["vector_count"] == 19
+
+    index.delete(filter={"source": "b.txt"}, namespace="ns")
+    assert_matches_disk(index, "ns")
+    view = index._namespace("ns")
+    # Half the rows were dead, so the namespace was compacted into one segment.
+    assert len(view.manifest["segments"]) == 1 and not view.manifest["deleted"]
+    assert sorted(view.locations) == sorted(f"a{i}" for i in range(10) if i != 3)
+
+    query = vectors([f"a{i}" for i in range(10)], 1)[5]["values"]
+    assert index.query(query, top_k=1, namespace="ns")["matches"][0]["id"] == "a5"
+
+
+def test_writes_by_another_process_are_reloaded(tmp_path):
+    index, other = LocalIndex(str(tmp_path)), LocalIndex(str(tmp_path))
+    index.upsert(vectors(["a0", "a1"], 1), namespace="ns")
+    assert index.describe_namespace("ns")["vector_count"] == 2
+    other.upsert(vectors(["a2"], 2), namespace="ns")
+    assert index.describe_namespace("ns")["vector_count"] == 3
+    assert_matches_disk(index, "ns")
+
+
+def test_an_id_repeated_in_one_batch_keeps_its_last_values(tmp_path):
+    index = LocalIndex(str(tmp_path))
+    first, last = vectors(["a0", "a0"], 1)
+    index.upsert([first, vectors(["b0"], 2)[0], last], namespace="ns")
+    assert index.describe_namespace("ns")["vector_count"] == 2
+    matches = index.query(last["values"], top_k=3, namespace="ns")["matches"]
+    assert [m["id"] for m in matches] == ["a0", "b0"]
+    assert matches[0]["score"] > 0.999
+
+    index.delete(ids=["a0"], namespace="ns")
+    assert [m["id"] for m in index.query(last["values"], top_k=3, namespace="ns")["matches"]] == ["b0"]
+    assert_matches_disk(index, "ns")
@@ -0,0 +1,40 @@
+# tests/test_rag_core.py
+
+import pytest
+
+import rag_core
+import s3_utils
+
+BUCKET = "test-bucket"
+
+
+@pytest.mark.parametrize("backend", ["pinecone", "local"])
+def test_deleting_a_kb_without_vectors_succeeds(services, backend):
+    s3_utils.save_json_to_s3({"files": {}}, BUCKET, "alice/empty/source_documents.json")
+    report = rag_core.purge_knowledge_base(BUCKET, "alice/empty/", "alice-empty", backend=backend)
+    assert report == {"s3_deleted": 1, "s3_errors": [], "vector_error": None}
+    assert len(services.s3) == 0
+
+
+def test_chunk_ids_change_with_chunking_settings():
+    small = rag_core.chunk_variant(rag_core.chunking.chunking_settings({"chunk_tokens": 128}))
+    default = rag_core.chunk_variant(rag_core.chunking.chunking_settings())
+    assert default == rag_core.chunk_variant(rag_core.chunking.chunking_settings())
+    assert rag_core.chunk_id("a.pdf", "hash", 0, small) != rag_core.chunk_id("a.pdf", "hash", 0, default)
+
+
+def test_embedding_cache_hits_skip_bedrock(services):
+    embeddings = rag_core._embeddings()
+    texts = ["first chunk", "second chunk", "first chunk"]
+    vectors = embeddings.embed_documents(texts)
+    # The repeated text is embedded once.
+    assert services.bedrock.requests == 2
+    assert vectors[0] == vectors[2]
+
+    assert embeddings.embed_documents(["second chunk", "first chunk"]) == [vectors[1], vectors[0]]
+    assert embeddings.embed_query("first chunk") == vectors[0]
+    assert services.bedrock.requests == 2
+    assert rag_core.embedding_cache_stats()["hits"] == 4
+
+    embeddings.embed_documents(["third chunk"])
+    assert services.bedrock.requests == 3
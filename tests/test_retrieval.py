@@ -0,0 +1,24 @@
+# tests/test_retrieval.py
+
+from retrieval import mmr_select
+
+QUERY = [1.0, 0.0, 0.0]
+# 0 and 1 are the same passage (relevance 0.9), 2 is less relevant (0.6) but
+# different, 3 is unrelated to the query.
+CANDIDATES = [[0.9, 0.436, 0.0], [0.9, 0.436, 0.0], [0.6, 0.0, 0.8], [0.0, 1.0, 0.0]]
+
+
+def test_mmr_prefers_a_diverse_passage_over_a_duplicate():
+    # Second pick, with lambda 0.5: the duplicate scores 0.5 * 0.9 - 0.5 * 1.0 = -0.05,
+    # passage 2 scores 0.5 * 0.6 - 0.5 * 0.54 = 0.03 and passage 3 0 - 0.5 * 0.436 = -0.218.
+    assert mmr_select(QUERY, CANDIDATES, k=3, lambda_mult=0.5) == [0, 2, 1]
+
+
+def test_mmr_with_lambda_one_ranks_by_relevance():
+    assert mmr_select(QUERY, CANDIDATES, k=4, lambda_mult=1.0) == [0, 1, 2, 3]
+
+
+def test_mmr_edge_cases():
+    assert mmr_select(QUERY, CANDIDATES, k=10) == [0, 2, 1, 3]
+    assert mmr_select(QUERY, [], k=3) == []
+    assert mmr_select(QUERY, CANDIDATES, k=0) == []
@@ -0,0 +1,22 @@
+# tests/test_telemetry.py
+
+import socket
+
+import telemetry
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_metrics_server_listens_on_loopback_by_default(monkeypatch):
+    monkeypatch.setattr(telemetry, "_server", None)
+    telemetry.configure(metrics_port=free_port())
+    server = telemetry._server
+    try:
+        assert server.server_address[0] == "127.0.0.1"
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,67 @@
+# tests/test_uploads.py
+
+import io
+import os
+import time
+
+import pytest
+
+import uploads
+
+MB = 2**20
+
+
+class Upload(io.BytesIO):
+    def __init__(self, name, size):
+        super().__init__(b"x" * size)
+        self.name = name
+        self.size = size
+
+
+def idle(spool, session_id, seconds):
+    then = time.time() - seconds
+    os.utime(os.path.join(spool.root, session_id), (then, then))
+
+
+def test_abandoned_sessions_are_swept_after_an_idle_timeout(tmp_path):
+    spool = uploads.UploadSpool(str(tmp_path), session_limit_bytes=4 * MB, process_limit_bytes=6 * MB)
+    spool.spool_all("closed-tab", [Upload("a.pdf", 3 * MB)])
+    spool.spool_all("live", [Upload("b.pdf", 2 * MB)])
+    with pytest.raises(uploads.UploadRejected):
+        spool.spool("other", Upload("c.pdf", 2 * MB))
+
+    idle(spool, "closed-tab", uploads.IDLE_SESSION_SECONDS + 1)
+    idle(spool, "live", uploads.IDLE_SESSION_SECONDS + 1)
+    spool.touch("live")
+    items, rejected = spool.spool_all("other", [Upload("c.pdf", 2 * MB)])
+    assert not rejected
+    assert not os.path.exists(os.path.join(spool.root, "closed-tab"))
+    assert spool.usage("live") == 2 * MB
+    assert spool.usage() == 4 * MB
+
+
+def test_budget_counts_files_on_disk(tmp_path):
+    spool = uploads.UploadSpool(str(tmp_path), session_limit_bytes=4 * MB, process_limit_bytes=4 * MB)
+    items, _ = spool.spool_all("s", [Upload("a.pdf", 3 * MB)])
+    # A fresh spool over the same directory (a restart, another server process) sees those bytes.
+    restarted = uploads.UploadSpool(str(tmp_path), session_limit_bytes=4 * MB, process_limit_bytes=4 * MB)
+    with pytest.raises(uploads.UploadRejected):
+        restarted.spool("t", Upload("b.pdf", 2 * MB))
+    restarted.release("s", items)
+    assert restarted.usage() == 0
+
+
+def test_pinned_sessions_outlive_the_idle_timeout(tmp_path):
+    spool = uploads.UploadSpool(str(tmp_path), session_limit_bytes=4 * MB, process_limit_bytes=4 * MB)
+    items, _ = spool.spool_all("s", [Upload("a.pdf", MB)])
+    spool.pin("s")
+    idle(spool, "s", uploads.IDLE_SESSION_SECONDS + 1)
+    spool.sweep()
+    other_process = uploads.UploadSpool(str(tmp_path), 4 * MB, 4 * MB)
+    other_process.sweep()
+    assert os.path.exists(items[0]["path"])
+
+    spool.unpin("s")
+    idle(spool, "s", uploads.IDLE_SESSION_SECONDS + 1)
+    spool.sweep()
+    assert not os.path.exists(items[0]["path"])
@@ -0,0 +1,196 @@
+# uploads.py
+
+import os
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+
+# Uploaded files are copied once, in small chunks, from Streamlit's upload
+# buffer into a per-session spool directory on disk. Everything downstream
+# (extraction workers, hashing, S3 uploads) reads that one file by path, so the
+# session state only holds lightweight descriptors:
+#
+#   {"name": "notes.pdf", "path": "/tmp/.../3f2a...pdf", "size": 81234, "sha256": "..."}
+#
+# A per-session and a process-wide byte budget bound how much can be spooled at
+# once; uploads that would exceed either are rejected rather than buffered.
+# Both are measured from the spool directory itself (plus copies in progress),
+# so files of sessions that vanished, or of other server processes sharing the
+# directory, are counted until they are swept.
+#
+# A session that closes without releasing its files (a closed tab, a session
+# timeout) leaves them behind. Its directory is swept once it has been idle for
+# IDLE_SESSION_SECONDS: every rerun of a live session touches it. While a
+# background job owns a session's files, the session is pinned and only swept
+# after STALE_SESSION_SECONDS, in case the process died mid-job.
+
+COPY_CHUNK_BYTES = 1024 * 1024
+IDLE_SESSION_SECONDS = 30 * 60
+STALE_SESSION_SECONDS = 24 * 3600
+PIN_FILE = ".pinned"
+
+
+class UploadRejected(Exception):
+    """Raised when an upload would exceed the session or process upload budget."""
+
+
+def _dir_bytes(path: str) -> int:
+    try:
+        return sum(e.stat().st_size for e in os.scandir(path) if e.is_file() and e.name != PIN_FILE)
+    except FileNotFoundError:
+        return 0
+
+
+class UploadSpool:
+    def __init__(self, root: str, session_limit_bytes: int, process_limit_bytes: int):
+        self.root = root
+        self.session_limit_bytes = session_limit_bytes
+        self.process_limit_bytes = process_limit_bytes
+        self._copying = {}
+        self._pins = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _session_dir(self, session_id: str) -> str:
+        return os.path.join(self.root, session_id)
+
+    def _session_bytes(self, session_id: str) -> int:
+        return _dir_bytes(self._session_dir(session_id)) + self._copying.get(session_id, 0)
+
+    def _process_bytes(self) -> int:
+        on_disk = sum(_dir_bytes(e.path) for e in os.scandir(self.root) if e.is_dir())
+        return on_disk + sum(self._copying.values())
+
+    def usage(self, session_id: str = None) -> int:
+        """Spooled bytes held by one session, or by the whole spool directory when session_id is None."""
+        with self._lock:
+            return self._process_bytes() if session_id is None else self._session_bytes(session_id)
+
+    def _reserve(self, session_id: str, n_bytes: int):
+        # Bytes being copied count in full until the file is complete, then as the file on disk.
+        with self._lock:
+            if self._session_bytes(session_id) + n_bytes > self.session_limit_bytes:
+                raise UploadRejected(
+                    f"this session's upload limit of {self.session_limit_bytes // 2**20} MB would be exceeded")
+            if self._process_bytes() + n_bytes > self.process_limit_bytes:
+                raise UploadRejected("the server is handling too many uploads right now; please try again shortly")
+            self._copying[session_id] = self._copying.get(session_id, 0) + n_bytes
+
+    def _copied(self, session_id: str, n_bytes: int):
+        with self._lock:
+            remaining = self._copying.get(session_id, 0) - n_bytes
+            if remaining > 0:
+                self._copying[session_id] = remaining
+            else:
+                self._copying.pop(session_id, None)
+
+    def touch(self, session_id: str):
+        """Records activity of a live session, so its files are not swept as abandoned."""
+        try:
+            os.utime(self._session_dir(session_id))
+        except FileNotFoundError:
+            pass
+
+    def pin(self, session_id: str):
+        """Keeps a session's files from being swept while a background job owns them; undo with unpin()."""
+        with self._lock:
+            self._pins[session_id] = self._pins.get(session_id, 0) + 1
+            os.makedirs(self._session_dir(session_id), exist_ok=True)
+            open(os.path.join(self._session_dir(session_id), PIN_FILE), "w").close()
+
+    def unpin(self, session_id: str):
+        with self._lock:
+            remaining = self._pins.get(session_id, 0) - 1
+            if remaining > 0:
+                self._pins[session_id] = remaining
+                return
+            self._pins.pop(session_id, None)
+            try:
+                os.remove(os.path.join(self._session_dir(session_id), PIN_FILE))
+            except FileNotFoundError:
+                pass
+        self.touch(session_id)
+
+    def spool(self, session_id: str, uploaded_file) -> dict:
+        """
+        Copies one file-like upload (with .name and .size) to disk, hashing it on the way.
+
+        Raises UploadRejected if it does not fit in the budget.
+        """
+        size = uploaded_file.size
+        self._reserve(session_id, size)
+        session_dir = self._session_dir(session_id)
+        os.makedirs(session_dir, exist_ok=True)
+        path = os.path.join(session_dir, uuid.uuid4().hex + os.path.splitext(uploaded_file.name)[1].lower())
+        digest = hashlib.sha256()
+        try:
+            uploaded_file.seek(0)
+            with open(path, "wb") as out:
+                while True:
+                    chunk = uploaded_file.read(COPY_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    out.write(chunk)
+        except BaseException:
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+        finally:
+            self._copied(session_id, size)
+        return {"name": uploaded_file.name, "path": path, "size": size, "sha256": digest.hexdigest()}
+
+    def spool_all(self, session_id: str, uploaded_files):
+        """Spools several uploads. Returns (items, {file_name: reason}) for those that were rejected."""
+        self.sweep()
+        items, rejected = [], {}
+        for uploaded_file in uploaded_files:
+            try:
+                items.append(self.spool(session_id, uploaded_file))
+            except UploadRejected as e:
+                rejected[uploaded_file.name] = str(e)
+        return items, rejected
+
+    def release(self, session_id: str, items):
+        """Deletes spooled files once they are no longer needed, returning their bytes to the budget."""
+        for item in items or []:
+            if "path" not in item:
+                continue
+            try:
+                os.remove(item["path"])
+            except FileNotFoundError:
+                continue
+
+    def sweep(self):
+        """Removes spool directories of sessions that went away without releasing their files."""
+        now = time.time()
+        for entry in os.scandir(self.root):
+            if not entry.is_dir():
+                continue
+            with self._lock:
+                if entry.name in self._pins or entry.name in self._copying:
+                    continue
+            pinned = os.path.exists(os.path.join(entry.path, PIN_FILE))
+            try:
+                idle = now - entry.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if idle > (STALE_SESSION_SECONDS if pinned else IDLE_SESSION_SECONDS):
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+
+_spool = None
+_spool_lock = threading.Lock()
+
+
+def get_spool(root: str, session_limit_bytes: int, process_limit_bytes: int) -> UploadSpool:
+    """Returns the process-wide spool, applying the current limits."""
+    global _spool
+    with _spool_lock:
+        if _spool is None or _spool.root != root:
+            _spool = UploadSpool(root, session_limit_bytes, process_limit_bytes)
+        _spool.session_limit_bytes = session_limit_bytes
+        _spool.process_limit_bytes = process_limit_bytes
+        return _spool
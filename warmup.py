@@ -0,0 +1,53 @@
+# warmup.py
+
+import logging
+import importlib
+import threading
+import telemetry
+
+logger = logging.getLogger(__name__)
+
+# The login page must render fast on a cold server (a restart or a freshly
+# scaled replica), so app.py does not import rag_core at the top: LangChain,
+# Pinecone and the Bedrock wrappers are imported by the functions that ingest
+# documents or answer questions. Once someone is past the login page, start()
+# imports those modules on a background thread and calls their warm_up(), if
+# they have one, so the first upload or question does not pay for them either.
+#
+# A session that needs rag_core before the warm-up has finished just waits for
+# it: Python lets only one thread execute a module's import, and the others
+# block until it is done.
+#
+# The warm-up runs once per process. rag_core.warm_up() reads its settings
+# (vector backend, Pinecone index, embedding model) from st.secrets, which is
+# loaded from the server's secrets file and readable from any thread. Nothing on
+# this path may render, though: this thread has no script context, so errors go
+# to the log instead.
+
+MODULES = ("rag_core",)
+
+_started = False
+_lock = threading.Lock()
+
+
+def start(modules=MODULES) -> bool:
+    """Starts warming up the given modules unless this process already has. Returns True if it started."""
+    global _started
+    with _lock:
+        if _started:
+            return False
+        _started = True
+    threading.Thread(target=_warm_up, args=(modules,), name="warmup", daemon=True).start()
+    return True
+
+
+def _warm_up(modules):
+    for name in modules:
+        try:
+            with telemetry.span("warmup", module=name):
+                module = importlib.import_module(name)
+                if hasattr(module, "warm_up"):
+                    module.warm_up()
+        except Exception:
+            # Whatever failed here is retried, and reported, on first use.
+            logger.exception("Warming up %s failed", name)